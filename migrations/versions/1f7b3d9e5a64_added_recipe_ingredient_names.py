@@ -0,0 +1,71 @@
+"""Added recipe ingredient names
+
+Revision ID: 1f7b3d9e5a64
+Revises: e8d4f6a2c913
+Create Date: 2026-10-19 12:41:08.905127
+
+"""
+import re
+from collections import defaultdict
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '1f7b3d9e5a64'
+down_revision = 'e8d4f6a2c913'
+branch_labels = None
+depends_on = None
+
+NON_WORD_RE = re.compile(r'[^\w\s]+')
+
+
+# Frozen copy of server.search.normalize_ingredient_names as of this
+# revision, so replaying it always stores the same names
+def normalize_ingredient_name(name):
+    words = NON_WORD_RE.sub(' ', name.lower()).split()
+    if not words:
+        return ''
+
+    last = words[-1]
+    if last.endswith('ies') and len(last) > 4:
+        last = last[:-3] + 'y'
+    elif last.endswith('oes') and len(last) > 4:
+        last = last[:-2]
+    elif last.endswith('s') and not last.endswith(('ss', 'us')) and len(last) > 3:
+        last = last[:-1]
+    words[-1] = last
+
+    return ' '.join(words)
+
+
+def normalize_ingredient_names(names):
+    normalized = {normalize_ingredient_name(name) for name in names if name}
+    normalized.discard('')
+    return sorted(normalized)
+
+
+def upgrade() -> None:
+    op.add_column('recipe', sa.Column('ingredient_names', postgresql.ARRAY(sa.String()), nullable=True))
+    op.create_index('ix_recipe_ingredient_names', 'recipe', ['ingredient_names'], unique=False, postgresql_using='gin')
+
+    recipe = sa.table('recipe', sa.column('id', sa.Integer), sa.column('ingredient_names', postgresql.ARRAY(sa.String())))
+    ingredient = sa.table('ingredient', sa.column('recipe_id', sa.Integer), sa.column('name', sa.String))
+
+    connection = op.get_bind()
+    names = defaultdict(list)
+    for recipe_id, name in connection.execute(sa.select(ingredient.c.recipe_id, ingredient.c.name)):
+        names[recipe_id].append(name)
+
+    if names:
+        connection.execute(
+            recipe.update().where(recipe.c.id == sa.bindparam('recipe_id')).values(ingredient_names=sa.bindparam('names')),
+            [{'recipe_id': recipe_id, 'names': normalize_ingredient_names(recipe_names)} for recipe_id, recipe_names in names.items()],
+        )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_ingredient_names', table_name='recipe', postgresql_using='gin')
+    op.drop_column('recipe', 'ingredient_names')
@@ -0,0 +1,51 @@
+"""Added meal plan item user id
+
+Revision ID: 2f6b8d3e9a54
+Revises: 7c4e9b2a6f18
+Create Date: 2026-10-19 20:03:18.746102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6b8d3e9a54'
+down_revision = '7c4e9b2a6f18'
+branch_labels = None
+depends_on = None
+
+MEAL_PLAN_ITEM_USER_ID_TRIGGER = """
+CREATE FUNCTION meal_plan_item_set_user_id() RETURNS trigger AS $$
+BEGIN
+    NEW.user_id := (SELECT user_id FROM recipe WHERE id = NEW.recipe_id);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_user_id
+    BEFORE INSERT OR UPDATE OF recipe_id ON meal_plan_item
+    FOR EACH ROW EXECUTE FUNCTION meal_plan_item_set_user_id();
+"""
+
+
+def upgrade() -> None:
+    op.add_column('meal_plan_item', sa.Column('user_id', sa.Integer(), nullable=True))
+    # Lock out concurrent meal plan changes between the backfill and the trigger
+    op.execute('LOCK TABLE meal_plan_item IN SHARE ROW EXCLUSIVE MODE')
+    op.execute(
+        """
+        UPDATE meal_plan_item SET user_id = recipe.user_id
+        FROM recipe WHERE recipe.id = meal_plan_item.recipe_id
+        """
+    )
+    op.execute(MEAL_PLAN_ITEM_USER_ID_TRIGGER)
+    op.alter_column('meal_plan_item', 'user_id', existing_type=sa.Integer(), nullable=False)
+    op.create_foreign_key(None, 'meal_plan_item', 'user', ['user_id'], ['id'], ondelete='CASCADE')
+    op.create_index('ix_meal_plan_item_user_id_date', 'meal_plan_item', ['user_id', 'date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_meal_plan_item_user_id_date', table_name='meal_plan_item')
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_item_set_user_id CASCADE')
+    op.drop_column('meal_plan_item', 'user_id')
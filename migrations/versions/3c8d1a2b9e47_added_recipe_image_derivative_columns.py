@@ -0,0 +1,26 @@
+"""Added recipe image derivative columns
+
+Revision ID: 3c8d1a2b9e47
+Revises: fbcb2e918c0e
+Create Date: 2026-10-19 09:12:04.318220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c8d1a2b9e47'
+down_revision = 'fbcb2e918c0e'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('recipe', sa.Column('thumbnail_url', sa.String(), nullable=True))
+    op.add_column('recipe', sa.Column('srcset', sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('recipe', 'srcset')
+    op.drop_column('recipe', 'thumbnail_url')
@@ -0,0 +1,24 @@
+"""Added recipe tag assoc tag index
+
+Revision ID: 4b8e1c6f3a27
+Revises: 9c2e5a7d1b38
+Create Date: 2026-10-19 13:58:12.440915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b8e1c6f3a27'
+down_revision = '9c2e5a7d1b38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_recipe_tag_assoc_tag_id_recipe_id', 'recipe_tag_assoc', ['tag_id', 'recipe_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_tag_assoc_tag_id_recipe_id', table_name='recipe_tag_assoc')
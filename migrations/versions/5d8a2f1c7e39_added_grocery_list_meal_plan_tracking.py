@@ -0,0 +1,39 @@
+"""Added grocery list meal plan tracking
+
+Revision ID: 5d8a2f1c7e39
+Revises: a3f7c9e2d481
+Create Date: 2026-10-19 17:18:44.109532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d8a2f1c7e39'
+down_revision = 'a3f7c9e2d481'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing lists have no window and stay snapshots
+    op.add_column('grocery_list', sa.Column('start_date', sa.DateTime(), nullable=True))
+    op.add_column('grocery_list', sa.Column('end_date', sa.DateTime(), nullable=True))
+    op.alter_column('grocery_list_item', 'quantity', existing_type=sa.Integer(), type_=sa.Float(), existing_nullable=False)
+    op.add_column('grocery_list_item', sa.Column('meal_plan_item_id', sa.Integer(), nullable=True))
+    op.add_column('grocery_list_item', sa.Column('ingredient_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_grocery_list_item_meal_plan_item_id'), 'grocery_list_item', ['meal_plan_item_id'], unique=False)
+    op.create_foreign_key('grocery_list_item_meal_plan_item_id_fkey', 'grocery_list_item', 'meal_plan_item', ['meal_plan_item_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('grocery_list_item_ingredient_id_fkey', 'grocery_list_item', 'ingredient', ['ingredient_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('grocery_list_item_ingredient_id_fkey', 'grocery_list_item', type_='foreignkey')
+    op.drop_constraint('grocery_list_item_meal_plan_item_id_fkey', 'grocery_list_item', type_='foreignkey')
+    op.drop_index(op.f('ix_grocery_list_item_meal_plan_item_id'), table_name='grocery_list_item')
+    op.drop_column('grocery_list_item', 'ingredient_id')
+    op.drop_column('grocery_list_item', 'meal_plan_item_id')
+    op.alter_column('grocery_list_item', 'quantity', existing_type=sa.Float(), type_=sa.Integer(), existing_nullable=False)
+    op.drop_column('grocery_list', 'end_date')
+    op.drop_column('grocery_list', 'start_date')
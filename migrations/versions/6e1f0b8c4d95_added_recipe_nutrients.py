@@ -0,0 +1,130 @@
+"""Added recipe nutrients
+
+Revision ID: 6e1f0b8c4d95
+Revises: d2a9c4e7f160
+Create Date: 2026-10-19 15:52:30.617204
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6e1f0b8c4d95'
+down_revision = 'd2a9c4e7f160'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# Frozen copy of server.nutrition.parse_nutrition and its tables as of this
+# revision, so replaying it always adds the same columns and values
+NUTRIENT_ALIASES = {
+    'calories': ['calories', 'calorie', 'kcal', 'cals', 'cal'],
+    'protein': ['protein'],
+    'fat': ['total fat', 'fat'],
+    'carbohydrates': ['carbohydrates', 'carbohydrate', 'carbs', 'carb'],
+    'fiber': ['dietary fiber', 'fiber', 'fibre'],
+    'sugar': ['sugars', 'sugar'],
+    'sodium': ['sodium'],
+}
+NUTRIENT_UNITS = {'protein': 1, 'fat': 1, 'carbohydrates': 1, 'fiber': 1, 'sugar': 1, 'sodium': 0.001}
+UNIT_GRAMS = {'kg': 1000, 'g': 1, 'mg': 0.001, 'mcg': 0.000001, 'µg': 0.000001}
+
+VALUE_PATTERN = r'(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>kg|mg|mcg|µg|g)?'
+QUALIFIER_PATTERN = r'(?<!saturated )(?<!trans )(?<!added )'
+LABEL_FIRST, VALUE_FIRST = 0, 1
+
+SEGMENT_SPLIT_RE = re.compile(r'[,;|/()\n]+|\band\b', re.I)
+VALUE_START_RE = re.compile(r'^\d')
+LABEL_START_RE = re.compile(
+    r'^(?:' + '|'.join(re.escape(alias) for aliases in NUTRIENT_ALIASES.values() for alias in aliases) + r')\b',
+    re.I,
+)
+
+
+def _nutrient_patterns(aliases):
+    names = '|'.join(re.escape(alias) for alias in aliases)
+    label_first = re.compile(rf'{QUALIFIER_PATTERN}\b(?:{names})\b\s*[:=-]?\s*{VALUE_PATTERN}', re.I)
+    value_first = re.compile(rf'{VALUE_PATTERN}\b\s*(?:of\s+)?{QUALIFIER_PATTERN}(?:{names})\b', re.I)
+    return label_first, value_first
+
+
+NUTRIENT_PATTERNS = {nutrient: _nutrient_patterns(aliases) for nutrient, aliases in NUTRIENT_ALIASES.items()}
+
+
+def parse_nutrition(text):
+    nutrients = dict.fromkeys(NUTRIENT_ALIASES)
+    if not text:
+        return nutrients
+
+    for segment in SEGMENT_SPLIT_RE.split(text):
+        segment = segment.strip()
+        if not segment:
+            continue
+
+        if VALUE_START_RE.match(segment):
+            styles = [VALUE_FIRST]
+        elif LABEL_START_RE.match(segment):
+            styles = [LABEL_FIRST]
+        else:
+            styles = [VALUE_FIRST, LABEL_FIRST]
+
+        for nutrient, patterns in NUTRIENT_PATTERNS.items():
+            if nutrients[nutrient] is not None:
+                continue
+
+            for style in styles:
+                match = patterns[style].search(segment)
+                if match is None:
+                    continue
+
+                value = float(match.group('value'))
+                unit = match.group('unit')
+                if nutrient in NUTRIENT_UNITS and unit is not None:
+                    value = value * UNIT_GRAMS[unit.lower()] / NUTRIENT_UNITS[nutrient]
+                nutrients[nutrient] = round(value, 3)
+                break
+
+    return nutrients
+
+
+def upgrade() -> None:
+    for nutrient in NUTRIENT_ALIASES:
+        op.add_column('recipe', sa.Column(nutrient, sa.Float(), nullable=True))
+    op.create_index('ix_recipe_user_id_calories', 'recipe', ['user_id', 'calories'], unique=False)
+    op.create_index('ix_recipe_user_id_protein', 'recipe', ['user_id', 'protein'], unique=False)
+
+    recipe = sa.table(
+        'recipe',
+        sa.column('id', sa.Integer),
+        sa.column('nutrition', sa.String),
+        *[sa.column(nutrient, sa.Float) for nutrient in NUTRIENT_ALIASES],
+    )
+    update = recipe.update().where(recipe.c.id == sa.bindparam('recipe_id')).values(
+        {nutrient: sa.bindparam(nutrient) for nutrient in NUTRIENT_ALIASES}
+    )
+
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(recipe.c.id, recipe.c.nutrition)
+            .where(recipe.c.id > last_id, recipe.c.nutrition != '')
+            .order_by(recipe.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+
+        connection.execute(update, [{'recipe_id': recipe_id, **parse_nutrition(nutrition)} for recipe_id, nutrition in rows])
+        last_id = rows[-1].id
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_user_id_protein', table_name='recipe')
+    op.drop_index('ix_recipe_user_id_calories', table_name='recipe')
+    for nutrient in reversed(list(NUTRIENT_ALIASES)):
+        op.drop_column('recipe', nutrient)
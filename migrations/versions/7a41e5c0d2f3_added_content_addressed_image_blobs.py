@@ -0,0 +1,36 @@
+"""Added content addressed image blobs
+
+Revision ID: 7a41e5c0d2f3
+Revises: 3c8d1a2b9e47
+Create Date: 2026-10-19 10:02:51.904117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a41e5c0d2f3'
+down_revision = '3c8d1a2b9e47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('image_blob',
+    sa.Column('hash', sa.String(), nullable=False),
+    sa.Column('key', sa.String(), nullable=False),
+    sa.Column('mime_type', sa.String(), nullable=False),
+    sa.Column('size', sa.Integer(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('orphaned_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('hash')
+    )
+    op.add_column('recipe', sa.Column('image_hash', sa.String(), nullable=True))
+    op.create_foreign_key('recipe_image_hash_fkey', 'recipe', 'image_blob', ['image_hash'], ['hash'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('recipe_image_hash_fkey', 'recipe', type_='foreignkey')
+    op.drop_column('recipe', 'image_hash')
+    op.drop_table('image_blob')
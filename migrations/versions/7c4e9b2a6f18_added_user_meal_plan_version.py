@@ -0,0 +1,86 @@
+"""Added user meal plan version
+
+Revision ID: 7c4e9b2a6f18
+Revises: 5d8a2f1c7e39
+Create Date: 2026-10-19 19:12:47.520931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c4e9b2a6f18'
+down_revision = '5d8a2f1c7e39'
+branch_labels = None
+depends_on = None
+
+MEAL_PLAN_VERSION_TRIGGERS = """
+CREATE FUNCTION meal_plan_recipes_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN new_rows ON recipe.id = new_rows.recipe_id
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN old_rows ON recipe.id = old_rows.recipe_id
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_recipe_changed() RETURNS trigger AS $$
+BEGIN
+    UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+    WHERE "user".id IN (SELECT user_id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_item REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_item REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_item REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_insert
+    AFTER INSERT ON ingredient REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_update
+    AFTER UPDATE ON ingredient REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_delete
+    AFTER DELETE ON ingredient REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER recipe_meal_plan_version_update
+    AFTER UPDATE ON recipe REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipe_changed();
+
+CREATE TRIGGER recipe_meal_plan_version_delete
+    AFTER DELETE ON recipe REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipe_changed();
+"""
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('meal_plan_version', sa.Integer(), server_default='0', nullable=False))
+    op.execute(MEAL_PLAN_VERSION_TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_recipes_changed, meal_plan_recipe_changed CASCADE')
+    op.drop_column('user', 'meal_plan_version')
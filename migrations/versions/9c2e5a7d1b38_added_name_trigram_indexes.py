@@ -0,0 +1,27 @@
+"""Added name trigram indexes
+
+Revision ID: 9c2e5a7d1b38
+Revises: 1f7b3d9e5a64
+Create Date: 2026-10-19 13:22:47.118350
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2e5a7d1b38'
+down_revision = '1f7b3d9e5a64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index('ix_recipe_name_trgm', 'recipe', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index('ix_tag_name_trgm', 'tag', ['name'], unique=False, postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tag_name_trgm', table_name='tag', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+    op.drop_index('ix_recipe_name_trgm', table_name='recipe', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
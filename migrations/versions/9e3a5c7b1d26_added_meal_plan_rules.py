@@ -0,0 +1,117 @@
+"""Added meal plan rules
+
+Revision ID: 9e3a5c7b1d26
+Revises: 2f6b8d3e9a54
+Create Date: 2026-10-19 21:27:05.318447
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e3a5c7b1d26'
+down_revision = '2f6b8d3e9a54'
+branch_labels = None
+depends_on = None
+
+MEAL_PLAN_RULE_VERSION_TRIGGERS = """
+CREATE FUNCTION meal_plan_rules_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM new_rows);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_rule_exceptions_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT meal_plan_rule.user_id FROM meal_plan_rule
+            JOIN new_rows ON meal_plan_rule.id = new_rows.meal_plan_rule_id
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT meal_plan_rule.user_id FROM meal_plan_rule
+            JOIN old_rows ON meal_plan_rule.id = old_rows.meal_plan_rule_id
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_rule_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_rule REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rules_changed();
+
+CREATE TRIGGER meal_plan_rule_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_rule REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rules_changed();
+
+CREATE TRIGGER meal_plan_rule_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_rule REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rules_changed();
+
+CREATE TRIGGER meal_plan_rule_exception_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_rule_exception REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rule_exceptions_changed();
+
+CREATE TRIGGER meal_plan_rule_exception_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_rule_exception REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rule_exceptions_changed();
+
+CREATE TRIGGER meal_plan_rule_exception_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_rule_exception REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rule_exceptions_changed();
+"""
+
+
+def upgrade() -> None:
+    op.create_table('meal_plan_rule',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('rrule', sa.String(), nullable=False),
+    sa.Column('start_date', sa.DateTime(), nullable=False),
+    sa.Column('end_date', sa.DateTime(), nullable=True),
+    sa.Column('servings', sa.Integer(), nullable=False),
+    sa.Column('meal_type', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_meal_plan_rule_user_id_start_date', 'meal_plan_rule', ['user_id', 'start_date'], unique=False)
+    op.create_table('meal_plan_rule_exception',
+    sa.Column('meal_plan_rule_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['meal_plan_rule_id'], ['meal_plan_rule.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('meal_plan_rule_id', 'date')
+    )
+    op.add_column('meal_plan_item', sa.Column('meal_plan_rule_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('meal_plan_item_meal_plan_rule_id_fkey', 'meal_plan_item', 'meal_plan_rule', ['meal_plan_rule_id'], ['id'], ondelete='SET NULL')
+    op.add_column('grocery_list_item', sa.Column('meal_plan_rule_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_grocery_list_item_meal_plan_rule_id'), 'grocery_list_item', ['meal_plan_rule_id'], unique=False)
+    op.create_foreign_key('grocery_list_item_meal_plan_rule_id_fkey', 'grocery_list_item', 'meal_plan_rule', ['meal_plan_rule_id'], ['id'], ondelete='CASCADE')
+    op.execute(MEAL_PLAN_RULE_VERSION_TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_rules_changed, meal_plan_rule_exceptions_changed CASCADE')
+    op.drop_constraint('grocery_list_item_meal_plan_rule_id_fkey', 'grocery_list_item', type_='foreignkey')
+    op.drop_index(op.f('ix_grocery_list_item_meal_plan_rule_id'), table_name='grocery_list_item')
+    op.drop_column('grocery_list_item', 'meal_plan_rule_id')
+    op.drop_constraint('meal_plan_item_meal_plan_rule_id_fkey', 'meal_plan_item', type_='foreignkey')
+    op.drop_column('meal_plan_item', 'meal_plan_rule_id')
+    op.drop_table('meal_plan_rule_exception')
+    op.drop_index('ix_meal_plan_rule_user_id_start_date', table_name='meal_plan_rule')
+    op.drop_table('meal_plan_rule')
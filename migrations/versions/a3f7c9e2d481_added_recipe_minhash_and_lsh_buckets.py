@@ -0,0 +1,38 @@
+"""Added recipe minhash and LSH buckets
+
+Revision ID: a3f7c9e2d481
+Revises: 6e1f0b8c4d95
+Create Date: 2026-10-19 16:41:12.385920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f7c9e2d481'
+down_revision = '6e1f0b8c4d95'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Existing recipes are indexed by running "recipes-admin index-duplicates"
+    op.add_column('recipe', sa.Column('minhash', postgresql.ARRAY(sa.BigInteger()), nullable=True))
+    op.create_table('recipe_lsh_bucket',
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('band', sa.Integer(), nullable=False),
+    sa.Column('bucket', sa.BigInteger(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('recipe_id', 'band')
+    )
+    op.create_index('ix_recipe_lsh_bucket_user_id_band_bucket', 'recipe_lsh_bucket', ['user_id', 'band', 'bucket', 'recipe_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_lsh_bucket_user_id_band_bucket', table_name='recipe_lsh_bucket')
+    op.drop_table('recipe_lsh_bucket')
+    op.drop_column('recipe', 'minhash')
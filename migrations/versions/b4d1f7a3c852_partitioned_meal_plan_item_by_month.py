@@ -0,0 +1,177 @@
+"""Partitioned meal plan item by month
+
+Revision ID: b4d1f7a3c852
+Revises: 9e3a5c7b1d26
+Create Date: 2026-10-19 22:41:37.902215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d1f7a3c852'
+down_revision = '9e3a5c7b1d26'
+branch_labels = None
+depends_on = None
+
+MEAL_PLAN_ITEM_DEFAULT_PARTITION = 'CREATE TABLE meal_plan_item_default PARTITION OF meal_plan_item DEFAULT'
+
+MEAL_PLAN_ITEM_GROCERY_CLEANUP_TRIGGER = """
+CREATE FUNCTION meal_plan_items_deleted() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM grocery_list_item
+    WHERE meal_plan_item_id IN (SELECT id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_grocery_cleanup
+    AFTER DELETE ON meal_plan_item REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_deleted();
+"""
+
+MEAL_PLAN_ITEM_USER_ID_TRIGGER = """
+CREATE FUNCTION meal_plan_item_set_user_id() RETURNS trigger AS $$
+BEGIN
+    NEW.user_id := (SELECT user_id FROM recipe WHERE id = NEW.recipe_id);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_user_id
+    BEFORE INSERT OR UPDATE OF recipe_id ON meal_plan_item
+    FOR EACH ROW EXECUTE FUNCTION meal_plan_item_set_user_id();
+"""
+
+MEAL_PLAN_VERSION_TRIGGERS = """
+CREATE FUNCTION meal_plan_recipes_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN new_rows ON recipe.id = new_rows.recipe_id
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN old_rows ON recipe.id = old_rows.recipe_id
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_recipe_changed() RETURNS trigger AS $$
+BEGIN
+    UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+    WHERE "user".id IN (SELECT user_id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_item REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_item REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_item REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_insert
+    AFTER INSERT ON ingredient REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_update
+    AFTER UPDATE ON ingredient REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_delete
+    AFTER DELETE ON ingredient REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER recipe_meal_plan_version_update
+    AFTER UPDATE ON recipe REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipe_changed();
+
+CREATE TRIGGER recipe_meal_plan_version_delete
+    AFTER DELETE ON recipe REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipe_changed();
+"""
+
+COLUMNS = 'id, recipe_id, date, servings, meal_type, user_id, meal_plan_rule_id'
+
+
+def upgrade() -> None:
+    # Foreign keys can't reference the ID of a partitioned table on its own
+    op.drop_constraint('grocery_list_item_meal_plan_item_id_fkey', 'grocery_list_item', type_='foreignkey')
+    op.drop_index('ix_meal_plan_item_user_id_date', table_name='meal_plan_item')
+    op.rename_table('meal_plan_item', 'meal_plan_item_unpartitioned')
+    op.execute('ALTER INDEX meal_plan_item_pkey RENAME TO meal_plan_item_unpartitioned_pkey')
+    op.execute('ALTER SEQUENCE meal_plan_item_id_seq OWNED BY NONE')
+    # Dropped with their triggers, which are recreated on the new table
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_item_set_user_id CASCADE')
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_recipes_changed, meal_plan_recipe_changed CASCADE')
+
+    op.create_table('meal_plan_item',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('meal_plan_item_id_seq'::regclass)"), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('servings', sa.Integer(), nullable=False),
+    sa.Column('meal_type', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('meal_plan_rule_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['meal_plan_rule_id'], ['meal_plan_rule.id'], name='meal_plan_item_meal_plan_rule_id_fkey', ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.id'], name='meal_plan_item_recipe_id_fkey', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='meal_plan_item_user_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'date'),
+    postgresql_partition_by='RANGE (date)'
+    )
+    op.execute(MEAL_PLAN_ITEM_DEFAULT_PARTITION)
+    op.execute(f'INSERT INTO meal_plan_item ({COLUMNS}) SELECT {COLUMNS} FROM meal_plan_item_unpartitioned')
+    op.drop_table('meal_plan_item_unpartitioned')
+    op.execute('ALTER SEQUENCE meal_plan_item_id_seq OWNED BY meal_plan_item.id')
+    op.create_index('ix_meal_plan_item_user_id_date', 'meal_plan_item', ['user_id', 'date'], unique=False)
+
+    op.execute(MEAL_PLAN_ITEM_USER_ID_TRIGGER)
+    op.execute(MEAL_PLAN_VERSION_TRIGGERS)
+    op.execute(MEAL_PLAN_ITEM_GROCERY_CLEANUP_TRIGGER)
+
+
+def downgrade() -> None:
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_items_deleted CASCADE')
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_item_set_user_id CASCADE')
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_recipes_changed, meal_plan_recipe_changed CASCADE')
+    op.drop_index('ix_meal_plan_item_user_id_date', table_name='meal_plan_item')
+    op.rename_table('meal_plan_item', 'meal_plan_item_partitioned')
+    op.execute('ALTER INDEX meal_plan_item_pkey RENAME TO meal_plan_item_partitioned_pkey')
+    op.execute('ALTER SEQUENCE meal_plan_item_id_seq OWNED BY NONE')
+
+    op.create_table('meal_plan_item',
+    sa.Column('id', sa.Integer(), server_default=sa.text("nextval('meal_plan_item_id_seq'::regclass)"), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.DateTime(), nullable=False),
+    sa.Column('servings', sa.Integer(), nullable=False),
+    sa.Column('meal_type', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('meal_plan_rule_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['meal_plan_rule_id'], ['meal_plan_rule.id'], name='meal_plan_item_meal_plan_rule_id_fkey', ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['recipe_id'], ['recipe.id'], name='meal_plan_item_recipe_id_fkey', ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], name='meal_plan_item_user_id_fkey', ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute(f'INSERT INTO meal_plan_item ({COLUMNS}) SELECT {COLUMNS} FROM meal_plan_item_partitioned')
+    # Drops the monthly and archive partitions too
+    op.drop_table('meal_plan_item_partitioned')
+    op.execute('ALTER SEQUENCE meal_plan_item_id_seq OWNED BY meal_plan_item.id')
+    op.create_index('ix_meal_plan_item_user_id_date', 'meal_plan_item', ['user_id', 'date'], unique=False)
+
+    op.execute(MEAL_PLAN_ITEM_USER_ID_TRIGGER)
+    op.execute(MEAL_PLAN_VERSION_TRIGGERS)
+    op.execute('DELETE FROM grocery_list_item WHERE meal_plan_item_id NOT IN (SELECT id FROM meal_plan_item)')
+    op.create_foreign_key('grocery_list_item_meal_plan_item_id_fkey', 'grocery_list_item', 'meal_plan_item', ['meal_plan_item_id'], ['id'], ondelete='CASCADE')
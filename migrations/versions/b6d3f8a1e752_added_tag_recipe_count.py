@@ -0,0 +1,63 @@
+"""Added tag recipe count
+
+Revision ID: b6d3f8a1e752
+Revises: 4b8e1c6f3a27
+Create Date: 2026-10-19 14:36:03.275518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d3f8a1e752'
+down_revision = '4b8e1c6f3a27'
+branch_labels = None
+depends_on = None
+
+RECIPE_TAG_COUNT_TRIGGERS = """
+CREATE FUNCTION recipe_tag_assoc_inserted() RETURNS trigger AS $$
+BEGIN
+    UPDATE tag SET recipe_count = tag.recipe_count + delta.count
+    FROM (SELECT tag_id, count(*) AS count FROM new_rows GROUP BY tag_id) AS delta
+    WHERE tag.id = delta.tag_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION recipe_tag_assoc_deleted() RETURNS trigger AS $$
+BEGIN
+    UPDATE tag SET recipe_count = tag.recipe_count - delta.count
+    FROM (SELECT tag_id, count(*) AS count FROM old_rows GROUP BY tag_id) AS delta
+    WHERE tag.id = delta.tag_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipe_tag_assoc_count_insert
+    AFTER INSERT ON recipe_tag_assoc REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_tag_assoc_inserted();
+
+CREATE TRIGGER recipe_tag_assoc_count_delete
+    AFTER DELETE ON recipe_tag_assoc REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_tag_assoc_deleted();
+"""
+
+
+def upgrade() -> None:
+    op.add_column('tag', sa.Column('recipe_count', sa.Integer(), server_default='0', nullable=False))
+    # Lock out concurrent tag changes between the backfill and the triggers
+    op.execute('LOCK TABLE recipe_tag_assoc IN SHARE ROW EXCLUSIVE MODE')
+    op.execute(
+        """
+        UPDATE tag SET recipe_count = counts.count
+        FROM (SELECT tag_id, count(*) AS count FROM recipe_tag_assoc GROUP BY tag_id) AS counts
+        WHERE tag.id = counts.tag_id
+        """
+    )
+    op.execute(RECIPE_TAG_COUNT_TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute('DROP FUNCTION IF EXISTS recipe_tag_assoc_inserted, recipe_tag_assoc_deleted CASCADE')
+    op.drop_column('tag', 'recipe_count')
@@ -0,0 +1,26 @@
+"""Added recipe image indexes
+
+Revision ID: c5e2b7f91a08
+Revises: 7a41e5c0d2f3
+Create Date: 2026-10-19 11:37:20.582604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e2b7f91a08'
+down_revision = '7a41e5c0d2f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_recipe_image_hash'), 'recipe', ['image_hash'], unique=False)
+    op.create_index(op.f('ix_recipe_image_url'), 'recipe', ['image_url'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_recipe_image_url'), table_name='recipe')
+    op.drop_index(op.f('ix_recipe_image_hash'), table_name='recipe')
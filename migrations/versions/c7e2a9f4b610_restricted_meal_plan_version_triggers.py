@@ -0,0 +1,172 @@
+"""Restricted meal plan version triggers
+
+Revision ID: c7e2a9f4b610
+Revises: b4d1f7a3c852
+Create Date: 2026-10-19 23:18:52.406719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2a9f4b610'
+down_revision = 'b4d1f7a3c852'
+branch_labels = None
+depends_on = None
+
+MEAL_PLAN_VERSION_TRIGGERS = """
+CREATE FUNCTION meal_plan_items_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM new_rows);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_recipes_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN new_rows ON recipe.id = new_rows.recipe_id
+            WHERE EXISTS (SELECT FROM meal_plan_item WHERE meal_plan_item.recipe_id = recipe.id)
+            OR EXISTS (SELECT FROM meal_plan_rule WHERE meal_plan_rule.recipe_id = recipe.id)
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN old_rows ON recipe.id = old_rows.recipe_id
+            WHERE EXISTS (SELECT FROM meal_plan_item WHERE meal_plan_item.recipe_id = recipe.id)
+            OR EXISTS (SELECT FROM meal_plan_rule WHERE meal_plan_rule.recipe_id = recipe.id)
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_recipe_changed() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT FROM meal_plan_item WHERE meal_plan_item.recipe_id = NEW.id)
+        OR EXISTS (SELECT FROM meal_plan_rule WHERE meal_plan_rule.recipe_id = NEW.id)
+    THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_item REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_item REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_item REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_insert
+    AFTER INSERT ON ingredient REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_update
+    AFTER UPDATE ON ingredient REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_delete
+    AFTER DELETE ON ingredient REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+-- Transition tables can't be combined with a column list, so this one is
+-- per row, for the rows whose columns actually changed
+CREATE TRIGGER recipe_meal_plan_version_update
+    AFTER UPDATE OF name, servings ON recipe
+    FOR EACH ROW
+    WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.servings IS DISTINCT FROM NEW.servings)
+    EXECUTE FUNCTION meal_plan_recipe_changed();
+"""
+
+PREVIOUS_MEAL_PLAN_VERSION_TRIGGERS = """
+CREATE FUNCTION meal_plan_recipes_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN new_rows ON recipe.id = new_rows.recipe_id
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN old_rows ON recipe.id = old_rows.recipe_id
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_recipe_changed() RETURNS trigger AS $$
+BEGIN
+    UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+    WHERE "user".id IN (SELECT user_id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_item REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_item REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_item REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_insert
+    AFTER INSERT ON ingredient REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_update
+    AFTER UPDATE ON ingredient REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_delete
+    AFTER DELETE ON ingredient REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER recipe_meal_plan_version_update
+    AFTER UPDATE ON recipe REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipe_changed();
+
+CREATE TRIGGER recipe_meal_plan_version_delete
+    AFTER DELETE ON recipe REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipe_changed();
+"""
+
+
+def upgrade() -> None:
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_recipes_changed, meal_plan_recipe_changed CASCADE')
+    op.create_index('ix_meal_plan_item_recipe_id', 'meal_plan_item', ['recipe_id'], unique=False)
+    op.create_index('ix_meal_plan_rule_recipe_id', 'meal_plan_rule', ['recipe_id'], unique=False)
+    op.execute(MEAL_PLAN_VERSION_TRIGGERS)
+
+
+def downgrade() -> None:
+    op.execute('DROP FUNCTION IF EXISTS meal_plan_items_changed, meal_plan_recipes_changed, meal_plan_recipe_changed CASCADE')
+    op.drop_index('ix_meal_plan_rule_recipe_id', table_name='meal_plan_rule')
+    op.drop_index('ix_meal_plan_item_recipe_id', table_name='meal_plan_item')
+    op.execute(PREVIOUS_MEAL_PLAN_VERSION_TRIGGERS)
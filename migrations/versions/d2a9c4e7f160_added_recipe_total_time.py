@@ -0,0 +1,32 @@
+"""Added recipe total time
+
+Revision ID: d2a9c4e7f160
+Revises: b6d3f8a1e752
+Create Date: 2026-10-19 15:10:44.902371
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a9c4e7f160'
+down_revision = 'b6d3f8a1e752'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('recipe', sa.Column('total_time', sa.Integer(), sa.Computed('prep_time + cook_time', persisted=True), nullable=False))
+    op.create_index('ix_recipe_user_id_total_time', 'recipe', ['user_id', 'total_time'], unique=False)
+    op.create_index('ix_recipe_user_id_prep_time', 'recipe', ['user_id', 'prep_time'], unique=False)
+    op.create_index('ix_recipe_user_id_servings', 'recipe', ['user_id', 'servings'], unique=False)
+    op.create_index('ix_recipe_user_id_favorite', 'recipe', ['user_id', 'favorite'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_user_id_favorite', table_name='recipe')
+    op.drop_index('ix_recipe_user_id_servings', table_name='recipe')
+    op.drop_index('ix_recipe_user_id_prep_time', table_name='recipe')
+    op.drop_index('ix_recipe_user_id_total_time', table_name='recipe')
+    op.drop_column('recipe', 'total_time')
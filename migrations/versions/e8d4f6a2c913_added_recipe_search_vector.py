@@ -0,0 +1,42 @@
+"""Added recipe search vector
+
+Revision ID: e8d4f6a2c913
+Revises: c5e2b7f91a08
+Create Date: 2026-10-19 12:04:51.316207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8d4f6a2c913'
+down_revision = 'c5e2b7f91a08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('recipe', sa.Column('search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.create_index('ix_recipe_search_vector', 'recipe', ['search_vector'], unique=False, postgresql_using='gin')
+    op.execute(
+        """
+        UPDATE recipe SET search_vector =
+            setweight(to_tsvector('english', coalesce(recipe.name, '')), 'A')
+            || setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(ingredient.name, ' ') FROM ingredient
+                WHERE ingredient.recipe_id = recipe.id
+            ), '')), 'B')
+            || setweight(to_tsvector('english', coalesce(recipe.description, '')), 'C')
+            || setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(step.text, ' ') FROM step
+                WHERE step.recipe_id = recipe.id
+            ), '')), 'D')
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_recipe_search_vector', table_name='recipe', postgresql_using='gin')
+    op.drop_column('recipe', 'search_vector')
@@ -5,5 +5,7 @@ setup(
     version="0.0.1",
     packages=find_packages(where="src"),
     package_dir={"": "src"},
-    install_requires=["fastapi", "uvicorn", "sqlalchemy", "psycopg2-binary", "python-jose", "passlib", "python-multipart", "alembic", "fastapi_pagination", "ingredient-parser-nlp", "python-magic"]
+    install_requires=["fastapi", "uvicorn", "sqlalchemy", "psycopg2-binary", "python-jose", "passlib", "python-multipart", "alembic", "fastapi_pagination", "ingredient-parser-nlp", "python-magic", "Pillow", "numpy", "scipy", "python-dateutil"],
+    extras_require={"s3": ["boto3"]},
+    entry_points={"console_scripts": ["recipes-admin=server.cli:main"]},
 )
@@ -1,18 +1,23 @@
 from fastapi import FastAPI, Request, Response
 from fastapi.routing import APIRoute
-from fastapi.staticfiles import StaticFiles
 from fastapi_pagination import add_pagination
+from fastapi_pagination.utils import disable_installed_extensions_check
 from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.types import Receive, Scope, Send
 
 from server.config import CONFIG
+from server.jobs import start_background_jobs, stop_background_jobs
 from server.routes import (
+    events,
     grocery_list_items,
     grocery_lists,
     meal_plan_items,
+    meal_plan_rules,
     recipes,
     tags,
     users,
 )
+from server.static import ImmutableStaticFiles
 from server.storage.database import SessionLocal
 from server.storage.models import User
 
@@ -21,6 +26,21 @@ def custom_generate_unique_id(route: APIRoute):
     return f"{route.tags[0]}-{route.name}"
 
 
+class DBSessionMiddleware(BaseHTTPMiddleware):
+    """Opens a DB session per request, except for static files.
+
+    Static responses skip BaseHTTPMiddleware entirely, it would otherwise
+    proxy every file chunk through a queue and hide the zero-copy extension
+    from the static file handler.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http" and scope["path"].startswith("/static/"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
 async def db_session_middleware(request: Request, call_next):
     response = Response("Internal server error", status_code=500)
     try:
@@ -57,17 +77,25 @@ async def setup_bootstrap_admin():
 
 def init_app() -> FastAPI:
     app = FastAPI(generate_unique_id_function=custom_generate_unique_id)
-    app.add_middleware(BaseHTTPMiddleware, dispatch=db_session_middleware)
+    app.add_middleware(DBSessionMiddleware, dispatch=db_session_middleware)
     app.add_event_handler("startup", setup_bootstrap_admin)
+    app.add_event_handler("startup", start_background_jobs)
+    app.add_event_handler("shutdown", stop_background_jobs)
 
     app.include_router(recipes.router)
     app.include_router(users.router)
     app.include_router(tags.router)
     app.include_router(meal_plan_items.router)
+    app.include_router(meal_plan_rules.router)
     app.include_router(grocery_lists.router)
     app.include_router(grocery_list_items.router)
+    app.include_router(events.router)
 
-    app.mount("/static", StaticFiles(directory=CONFIG.static_dir), name="static")
+    app.mount(
+        "/static", ImmutableStaticFiles(directory=CONFIG.static_dir), name="static"
+    )
     add_pagination(app)
+    # Meal plan items are paginated in memory, along with occurrences of rules
+    disable_installed_extensions_check()
 
     return app
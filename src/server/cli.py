@@ -0,0 +1,133 @@
+import argparse
+from datetime import timedelta
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from server.config import CONFIG
+from server.dedup import backfill_minhash
+from server.image_gc import run_image_gc
+from server.images import backfill_image_derivatives
+from server.nutrition import backfill_nutrition
+from server.partitions import run_meal_plan_partition_maintenance
+from server.storage.blobs import storage
+from server.storage.database import SessionLocal
+
+
+def run_backfill_image_derivatives(db: Session, args: argparse.Namespace):
+    processed = backfill_image_derivatives(
+        db, storage, args.batch_size, force=args.force
+    )
+    print(f"Generated image derivatives for {processed} recipes")
+
+
+def run_backfill_nutrition(db: Session, args: argparse.Namespace):
+    processed = backfill_nutrition(db, args.batch_size)
+    print(f"Parsed nutrition for {processed} recipes")
+
+
+def run_index_duplicates(db: Session, args: argparse.Namespace):
+    processed = backfill_minhash(db, args.batch_size)
+    print(f"Indexed {processed} recipes for duplicate detection")
+
+
+def run_gc_images(db: Session, args: argparse.Namespace):
+    report = run_image_gc(
+        storage,
+        timedelta(hours=args.grace_hours),
+        args.batch_size,
+        dry_run=args.dry_run,
+    )
+    if report is None:
+        print("Image garbage collection is already running elsewhere")
+        return
+
+    action = "Would reclaim" if args.dry_run else "Reclaimed"
+    print(
+        f"{action} {report.reclaimed_bytes} bytes from {report.deleted_files} files "
+        f"({report.deleted_blobs} blobs, {report.scanned_files} files scanned, "
+        f"{report.reconciled_blobs} reference counts corrected)"
+    )
+
+
+def run_maintain_meal_plan_partitions(db: Session, args: argparse.Namespace):
+    report = run_meal_plan_partition_maintenance(
+        args.months_ahead, args.archive_months, CONFIG.meal_plan_archive_tablespace
+    )
+    if report is None:
+        print("Meal plan partition maintenance is already running elsewhere")
+        return
+
+    print(
+        f"Archived {len(report.archived)} and created {len(report.created)} "
+        "meal plan partitions"
+    )
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="recipes-admin")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    backfill_parser = subparsers.add_parser(
+        "backfill-image-derivatives",
+        help="Generate thumbnails and responsive sizes for existing recipe images",
+    )
+    backfill_parser.add_argument("--batch-size", type=int, default=100)
+    backfill_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Regenerate derivatives even if they look up to date",
+    )
+    backfill_parser.set_defaults(func=run_backfill_image_derivatives)
+
+    nutrition_parser = subparsers.add_parser(
+        "backfill-nutrition",
+        help="Parse nutrition text of existing recipes into nutrient columns",
+    )
+    nutrition_parser.add_argument("--batch-size", type=int, default=500)
+    nutrition_parser.set_defaults(func=run_backfill_nutrition)
+
+    duplicates_parser = subparsers.add_parser(
+        "index-duplicates",
+        help="Compute MinHash signatures of existing recipes for duplicate detection",
+    )
+    duplicates_parser.add_argument("--batch-size", type=int, default=500)
+    duplicates_parser.set_defaults(func=run_index_duplicates)
+
+    gc_parser = subparsers.add_parser(
+        "gc-images", help="Delete image files no recipe references anymore"
+    )
+    gc_parser.add_argument(
+        "--grace-hours", type=float, default=CONFIG.image_gc_grace_period_hours
+    )
+    gc_parser.add_argument("--batch-size", type=int, default=CONFIG.image_gc_batch_size)
+    gc_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what would be deleted",
+    )
+    gc_parser.set_defaults(func=run_gc_images)
+
+    partitions_parser = subparsers.add_parser(
+        "maintain-meal-plan-partitions",
+        help="Create upcoming monthly meal plan partitions and archive old ones",
+    )
+    partitions_parser.add_argument(
+        "--months-ahead", type=int, default=CONFIG.meal_plan_partition_months_ahead
+    )
+    partitions_parser.add_argument(
+        "--archive-months", type=int, default=CONFIG.meal_plan_archive_months
+    )
+    partitions_parser.set_defaults(func=run_maintain_meal_plan_partitions)
+
+    args = parser.parse_args(argv)
+
+    db = SessionLocal()
+    try:
+        args.func(db, args)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import os
+from typing import List, Optional
 
 
 class Config:
@@ -13,6 +14,63 @@ class Config:
             "RECIPE_BOOTSTRAP_ADMIN_PASSWORD"
         ]
         self.static_dir: str = os.environ["RECIPE_STATIC_DIR"]
+        self.upload_staging_dir: str = os.environ.get(
+            "RECIPE_UPLOAD_STAGING_DIR", os.path.join(self.static_dir, ".staging")
+        )
+        self.storage_backend: str = os.environ.get("RECIPE_STORAGE_BACKEND", "local")
+        self.s3_bucket: str = os.environ.get("RECIPE_S3_BUCKET", "")
+        self.s3_prefix: str = os.environ.get("RECIPE_S3_PREFIX", "")
+        self.s3_public_url: str = os.environ.get("RECIPE_S3_PUBLIC_URL", "")
+        self.s3_endpoint_url: Optional[str] = os.environ.get("RECIPE_S3_ENDPOINT_URL")
+        self.max_image_size: int = int(
+            os.environ.get("RECIPE_MAX_IMAGE_SIZE", str(20 * 1024 * 1024))
+        )
+        self.image_derivative_widths: List[int] = sorted(
+            int(width)
+            for width in os.environ.get(
+                "RECIPE_IMAGE_DERIVATIVE_WIDTHS", "320,640,1280"
+            ).split(",")
+        )
+        self.image_workers: int = int(os.environ.get("RECIPE_IMAGE_WORKERS", "2"))
+        self.image_gc_grace_period_hours: float = float(
+            os.environ.get("RECIPE_IMAGE_GC_GRACE_PERIOD_HOURS", "24")
+        )
+        self.image_gc_interval_minutes: float = float(
+            os.environ.get("RECIPE_IMAGE_GC_INTERVAL_MINUTES", "60")
+        )
+        self.image_gc_batch_size: int = int(
+            os.environ.get("RECIPE_IMAGE_GC_BATCH_SIZE", "500")
+        )
+        self.autocomplete_timeout_ms: int = int(
+            os.environ.get("RECIPE_AUTOCOMPLETE_TIMEOUT_MS", "200")
+        )
+        self.autocomplete_cache_ttl_seconds: float = float(
+            os.environ.get("RECIPE_AUTOCOMPLETE_CACHE_TTL_SECONDS", "30")
+        )
+        self.similarity_cache_ttl_seconds: float = float(
+            os.environ.get("RECIPE_SIMILARITY_CACHE_TTL_SECONDS", "300")
+        )
+        self.similarity_cache_max_size: int = int(
+            os.environ.get("RECIPE_SIMILARITY_CACHE_MAX_SIZE", "100")
+        )
+        self.grocery_preview_cache_ttl_seconds: float = float(
+            os.environ.get("RECIPE_GROCERY_PREVIEW_CACHE_TTL_SECONDS", "3600")
+        )
+        self.meal_plan_archive_months: int = int(
+            os.environ.get("RECIPE_MEAL_PLAN_ARCHIVE_MONTHS", "6")
+        )
+        self.meal_plan_archive_tablespace: Optional[str] = os.environ.get(
+            "RECIPE_MEAL_PLAN_ARCHIVE_TABLESPACE"
+        )
+        self.meal_plan_partition_months_ahead: int = int(
+            os.environ.get("RECIPE_MEAL_PLAN_PARTITION_MONTHS_AHEAD", "3")
+        )
+        self.meal_plan_partition_interval_minutes: float = float(
+            os.environ.get("RECIPE_MEAL_PLAN_PARTITION_INTERVAL_MINUTES", "1440")
+        )
+        self.event_keepalive_seconds: float = float(
+            os.environ.get("RECIPE_EVENT_KEEPALIVE_SECONDS", "15")
+        )
 
 
 CONFIG = Config()
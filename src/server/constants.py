@@ -5,3 +5,20 @@ IMAGE_FORMAT_EXTENSION_MAP = {
 }
 
 ALLOWED_IMAGE_FORMATS = list(IMAGE_FORMAT_EXTENSION_MAP.keys())
+
+# libmagic only needs the leading bytes of a file to identify image formats
+IMAGE_SNIFF_SIZE = 8 * 1024
+IMAGE_CHUNK_SIZE = 64 * 1024
+
+# Image URLs never change content, so caches may keep them for a year
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Formats (and their Pillow save options) generated for every derivative width
+IMAGE_DERIVATIVE_FORMATS = {
+    "image/webp": (".webp", "WEBP", {"quality": 80, "method": 4}),
+    "image/jpeg": (".jpg", "JPEG", {"quality": 80, "optimize": True}),
+}
+THUMBNAIL_FORMAT = "image/jpeg"
+
+# Postgres text search configuration used for recipe full-text search
+SEARCH_CONFIG = "english"
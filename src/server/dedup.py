@@ -0,0 +1,234 @@
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.orm import Session, aliased
+
+from server.storage.models import Recipe, RecipeLSHBucket, Step
+
+NUM_PERMUTATIONS = 64
+# 16 bands of 4 rows make recipes with a Jaccard similarity of about 0.5 or
+# more likely to share a bucket, (1 / LSH_BANDS) ** (1 / LSH_ROWS)
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+DUPLICATE_THRESHOLD = 0.6
+
+# Largest prime below 2 ** 32, with a, b and x reduced modulo it a * x + b
+# can't overflow 64 bits
+PRIME = (1 << 32) - 5
+
+WORD_RE = re.compile(r"\w+")
+
+
+def _hash32(value: str) -> int:
+    # Python's hash() is salted per process, signatures must be stable
+    return int.from_bytes(
+        hashlib.blake2b(value.encode(), digest_size=4).digest(), "little"
+    )
+
+
+# Changing these invalidates every stored signature, run index-duplicates after
+PERMUTATION_A = np.array(
+    [_hash32(f"a{i}") % (PRIME - 1) + 1 for i in range(NUM_PERMUTATIONS)],
+    dtype=np.uint64,
+)
+PERMUTATION_B = np.array(
+    [_hash32(f"b{i}") % PRIME for i in range(NUM_PERMUTATIONS)], dtype=np.uint64
+)
+
+
+def recipe_shingles(
+    ingredient_names: Optional[Iterable[str]], step_texts: Iterable[str]
+) -> Set[str]:
+    """Normalized ingredient names and word shingles of the steps."""
+    shingles = {f"i:{name}" for name in ingredient_names or []}
+    words = [word for text in step_texts for word in WORD_RE.findall(text.lower())]
+    if 0 < len(words) < SHINGLE_SIZE:
+        shingles.add(f"s:{' '.join(words)}")
+    for start in range(len(words) - SHINGLE_SIZE + 1):
+        shingles.add(f"s:{' '.join(words[start : start + SHINGLE_SIZE])}")
+    return shingles
+
+
+def minhash_signature(shingles: Iterable[str]) -> Optional[np.ndarray]:
+    hashes = np.array(
+        [_hash32(shingle) % PRIME for shingle in shingles], dtype=np.uint64
+    )
+    if not len(hashes):
+        return None
+
+    permuted = (hashes[:, None] * PERMUTATION_A + PERMUTATION_B) % np.uint64(PRIME)
+    return permuted.min(axis=0)
+
+
+def lsh_buckets(signature: np.ndarray) -> List[int]:
+    """One signed 64 bit bucket per band of signature."""
+    return [
+        int.from_bytes(
+            hashlib.blake2b(band.tobytes(), digest_size=8).digest(),
+            "little",
+            signed=True,
+        )
+        for band in signature.reshape(LSH_BANDS, LSH_ROWS)
+    ]
+
+
+def index_recipe_minhash(db: Session, recipe_ids: Iterable[int]) -> None:
+    """Recompute the MinHash signature and LSH buckets of the given recipes.
+
+    Must run after the recipes' ingredients and steps have been flushed.
+    """
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+
+    step_texts: Dict[int, List[str]] = defaultdict(list)
+    for recipe_id, text in db.execute(
+        select(Step.recipe_id, Step.text)
+        .filter(Step.recipe_id.in_(recipe_ids))
+        .order_by(Step.recipe_id, Step.position)
+    ):
+        step_texts[recipe_id].append(text)
+
+    signatures = []
+    buckets = []
+    for recipe_id, user_id, ingredient_names in db.execute(
+        select(Recipe.id, Recipe.user_id, Recipe.ingredient_names).filter(
+            Recipe.id.in_(recipe_ids)
+        )
+    ):
+        signature = minhash_signature(
+            recipe_shingles(ingredient_names, step_texts[recipe_id])
+        )
+        signatures.append(
+            {
+                "id": recipe_id,
+                "minhash": None if signature is None else signature.tolist(),
+            }
+        )
+        if signature is not None:
+            buckets.extend(
+                {
+                    "recipe_id": recipe_id,
+                    "user_id": user_id,
+                    "band": band,
+                    "bucket": bucket,
+                }
+                for band, bucket in enumerate(lsh_buckets(signature))
+            )
+
+    db.execute(
+        delete(RecipeLSHBucket).filter(RecipeLSHBucket.recipe_id.in_(recipe_ids))
+    )
+    if signatures:
+        db.execute(update(Recipe), signatures)
+    if buckets:
+        db.execute(insert(RecipeLSHBucket), buckets)
+
+
+def backfill_minhash(db: Session, batch_size: int) -> int:
+    """Index every recipe for duplicate detection, one batch at a time."""
+    processed = 0
+    last_id = 0
+    while True:
+        recipe_ids = db.scalars(
+            select(Recipe.id)
+            .filter(Recipe.id > last_id)
+            .order_by(Recipe.id)
+            .limit(batch_size)
+        ).all()
+        if not recipe_ids:
+            break
+
+        index_recipe_minhash(db, recipe_ids)
+        processed += len(recipe_ids)
+
+        db.commit()
+        last_id = recipe_ids[-1]
+
+    return processed
+
+
+def _find(parents: Dict[int, int], recipe_id: int) -> int:
+    root = recipe_id
+    while parents.setdefault(root, root) != root:
+        root = parents[root]
+    # Path compression
+    while parents[recipe_id] != root:
+        parents[recipe_id], recipe_id = root, parents[recipe_id]
+    return root
+
+
+def duplicate_clusters(
+    db: Session, user_id: int, threshold: float = DUPLICATE_THRESHOLD
+) -> List[Tuple[List[Recipe], float]]:
+    """Groups of the user's recipes that are likely near duplicates.
+
+    Only recipes sharing an LSH bucket are compared, by the fraction of equal
+    MinHash values which estimates the Jaccard similarity of their shingles.
+    Pairs at or above threshold are merged into clusters, each returned with
+    the lowest similarity among its merged pairs, most similar first.
+    """
+    other = aliased(RecipeLSHBucket)
+    candidates = db.execute(
+        select(RecipeLSHBucket.recipe_id, other.recipe_id)
+        .join(
+            other,
+            (other.user_id == RecipeLSHBucket.user_id)
+            & (other.band == RecipeLSHBucket.band)
+            & (other.bucket == RecipeLSHBucket.bucket)
+            & (other.recipe_id > RecipeLSHBucket.recipe_id),
+        )
+        .filter(RecipeLSHBucket.user_id == user_id)
+        .distinct()
+    ).all()
+    if not candidates:
+        return []
+
+    candidate_ids = {recipe_id for pair in candidates for recipe_id in pair}
+    signatures = {
+        recipe_id: np.array(minhash, dtype=np.uint64)
+        for recipe_id, minhash in db.execute(
+            select(Recipe.id, Recipe.minhash).filter(Recipe.id.in_(candidate_ids))
+        )
+        if minhash is not None
+    }
+
+    parents: Dict[int, int] = {}
+    similarities: Dict[int, float] = {}
+    for first, second in candidates:
+        if first not in signatures or second not in signatures:
+            continue
+        similarity = float(np.mean(signatures[first] == signatures[second]))
+        if similarity < threshold:
+            continue
+
+        first_root, second_root = _find(parents, first), _find(parents, second)
+        lowest = min(
+            similarity,
+            similarities.pop(first_root, 1.0),
+            similarities.pop(second_root, 1.0),
+        )
+        if first_root != second_root:
+            parents[second_root] = first_root
+        similarities[first_root] = lowest
+
+    clusters: Dict[int, List[int]] = defaultdict(list)
+    for recipe_id in parents:
+        clusters[_find(parents, recipe_id)].append(recipe_id)
+
+    recipes = {
+        recipe.id: recipe
+        for recipe in db.scalars(select(Recipe).filter(Recipe.id.in_(list(parents))))
+    }
+    return sorted(
+        (
+            ([recipes[recipe_id] for recipe_id in sorted(members)], similarities[root])
+            for root, members in clusters.items()
+        ),
+        key=lambda cluster: (-cluster[1], cluster[0][0].id),
+    )
@@ -4,6 +4,7 @@ from jose import JWTError, jwt
 from sqlalchemy.orm import Session
 
 from server.config import CONFIG
+from server.storage.blobs import storage
 from server.storage.models import User
 from server.storage.storage_manager import StorageManager
 
@@ -44,3 +45,7 @@ def get_storage_manager(
     db: Session = Depends(get_db), user: User = Depends(get_current_user)
 ):
     return StorageManager(db, user)
+
+
+def get_blob_storage():
+    return storage
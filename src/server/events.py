@@ -0,0 +1,199 @@
+import asyncio
+import json
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, Optional, Set
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.logger import logger
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from server.config import CONFIG
+from server.storage.database import engine
+
+# Postgres channel carrying changes for every user, each worker filters them
+CHANNEL = "recipe_changes"
+# NOTIFY payloads must stay below 8000 bytes
+MAX_PAYLOAD_SIZE = 7900
+MAX_QUEUED_EVENTS = 100
+RECONNECT_DELAY_SECONDS = 5
+MAX_CONNECT_ATTEMPTS = 3
+
+RESYNC_EVENT = {"type": "resync", "data": None}
+# Queued to end a stream, so its client reconnects
+CLOSE_EVENT = {"type": "close", "data": None}
+
+
+class ChangeListenerUnavailable(Exception):
+    pass
+
+
+def notify_change(db: Session, user_id: int, event_type: str, data: Any) -> None:
+    """Tell user_id's open change streams, on any worker, about a change.
+
+    Postgres delivers the notification when the transaction commits and
+    drops it on rollback. Deltas too large for a notification are sent
+    without data, telling clients to fetch the resource again.
+    """
+    payload = json.dumps(
+        {"user_id": user_id, "type": event_type, "data": data}, default=str
+    )
+    if len(payload.encode()) > MAX_PAYLOAD_SIZE:
+        payload = json.dumps({"user_id": user_id, "type": event_type, "data": None})
+    db.execute(select(func.pg_notify(CHANNEL, payload)))
+
+
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class ChangeListener:
+    """LISTENs for change notifications and fans them out to local streams.
+
+    Each worker process holds one dedicated connection, watched by the
+    event loop, which is opened with the first subscriber. A subscriber
+    that can't keep up, or misses notifications while the connection is
+    re-established, receives a resync event instead. Connecting gives up
+    after MAX_CONNECT_ATTEMPTS, ending any open streams.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[int, Set[asyncio.Queue]] = defaultdict(set)
+        self.connection: Optional[Any] = None
+        self.connecting: Optional[asyncio.Task] = None
+
+    def _connect(self):
+        connection = engine.raw_connection()
+        # Keep the pool from handing out or recycling a LISTENing connection
+        connection.detach()
+        dbapi_connection = connection.dbapi_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+        return dbapi_connection
+
+    async def _start(self):
+        attempts = 0
+        while self.connection is None:
+            attempts += 1
+            try:
+                connection = await run_in_threadpool(self._connect)
+            except Exception:
+                logger.exception("Connecting the change listener failed")
+                if attempts >= MAX_CONNECT_ATTEMPTS:
+                    raise
+                await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+                continue
+
+            asyncio.get_running_loop().add_reader(
+                connection.fileno(), self._on_readable
+            )
+            self.connection = connection
+
+    async def _reconnect(self):
+        try:
+            await self._start()
+        except Exception:
+            self.close_streams()
+
+    async def ensure_started(self):
+        """Connect unless connected, raises ChangeListenerUnavailable if that fails."""
+        while self.connection is None:
+            if self.connecting is None or self.connecting.done():
+                self.connecting = asyncio.create_task(self._start())
+            connecting = self.connecting
+            try:
+                await asyncio.shield(connecting)
+            except asyncio.CancelledError:
+                # Cancelled by the last subscriber leaving, rather than our caller
+                if not connecting.cancelled():
+                    raise
+                continue
+            except Exception as e:
+                raise ChangeListenerUnavailable() from e
+            if self.connection is None:
+                raise ChangeListenerUnavailable()
+
+    def _on_readable(self):
+        try:
+            self.connection.poll()
+        except Exception:
+            logger.exception("Change listener connection lost, reconnecting")
+            self._disconnect()
+            self.broadcast(RESYNC_EVENT)
+            if self.subscribers:
+                self.connecting = asyncio.create_task(self._reconnect())
+            return
+
+        while self.connection.notifies:
+            notification = self.connection.notifies.pop(0)
+            event = json.loads(notification.payload)
+            self.dispatch(event.pop("user_id"), event)
+
+    def _disconnect(self):
+        if self.connection is None:
+            return
+        connection, self.connection = self.connection, None
+        try:
+            asyncio.get_running_loop().remove_reader(connection.fileno())
+        except (ValueError, OSError):
+            pass
+        connection.close()
+
+    def dispatch(self, user_id: int, event: Dict[str, Any]):
+        for queue in self.subscribers.get(user_id, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC_EVENT)
+
+    def broadcast(self, event: Dict[str, Any]):
+        for user_id in list(self.subscribers):
+            self.dispatch(user_id, event)
+
+    def close_streams(self):
+        for queues in self.subscribers.values():
+            for queue in queues:
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(CLOSE_EVENT)
+
+    async def subscribe(self, user_id: int) -> asyncio.Queue:
+        await self.ensure_started()
+        queue: asyncio.Queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+        self.subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        self.subscribers[user_id].discard(queue)
+        if not self.subscribers[user_id]:
+            del self.subscribers[user_id]
+        if not self.subscribers:
+            # A connection still being opened would be left LISTENing for no one
+            if self.connecting is not None and not self.connecting.done():
+                self.connecting.cancel()
+            self._disconnect()
+
+    async def stream(self, user_id: int) -> AsyncIterator[str]:
+        """Server-sent events for user_id, with comments as keepalives."""
+        queue = await self.subscribe(user_id)
+        try:
+            yield f"retry: {RECONNECT_DELAY_SECONDS * 1000}\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(
+                        queue.get(), CONFIG.event_keepalive_seconds
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event is CLOSE_EVENT:
+                    return
+                yield format_sse(event)
+        finally:
+            self.unsubscribe(user_id, queue)
+
+
+change_listener = ChangeListener()
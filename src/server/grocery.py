@@ -0,0 +1,412 @@
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Select, delete, select
+from sqlalchemy.orm import Session, selectinload
+
+from server.cache import TTLCache
+from server.config import CONFIG
+from server.events import notify_change
+from server.schemas import GroceryListItemSchema
+from server.search import normalize_ingredient_name
+from server.storage.models import (
+    GroceryList,
+    GroceryListItem,
+    Ingredient,
+    MealPlanItem,
+    MealPlanRule,
+    Recipe,
+    User,
+)
+from server.recurrence import expand_meal_plan_rules, rule_meal_plan_items
+from server.storage.utils import safe_query
+from server.units import UNITS, convert_base_quantity, normalize_quantity
+
+# (user ID, meal plan version, start date, end date) -> preview lines
+grocery_preview_cache: TTLCache[List[Dict[str, Any]]] = TTLCache(
+    CONFIG.grocery_preview_cache_ttl_seconds
+)
+
+
+def servings_scale(meal_plan_item: MealPlanItem) -> float:
+    recipe_servings = meal_plan_item.recipe.servings
+    if not recipe_servings:
+        return 1.0
+    return meal_plan_item.servings / recipe_servings
+
+
+def meal_plan_grocery_items(meal_plan_item: MealPlanItem) -> List[GroceryListItem]:
+    """Grocery list items for a meal plan item, scaled to its servings."""
+    scale = servings_scale(meal_plan_item)
+    return [
+        GroceryListItem(
+            active=True,
+            quantity=ingredient.quantity * scale,
+            unit=ingredient.unit,
+            name=ingredient.name,
+            comment=ingredient.comment,
+            recipe_name=meal_plan_item.recipe.name,
+            servings=meal_plan_item.servings,
+            extra_items=False,
+            meal_plan_item_id=meal_plan_item.id,
+            # Occurrences of rules aren't stored, their items are kept in sync
+            # with the rule instead
+            meal_plan_rule_id=(
+                meal_plan_item.meal_plan_rule_id if meal_plan_item.id is None else None
+            ),
+            ingredient_id=ingredient.id,
+        )
+        for ingredient in meal_plan_item.recipe.ingredients
+    ]
+
+
+def extra_grocery_item(name: str) -> GroceryListItem:
+    return GroceryListItem(
+        active=True,
+        quantity=0,
+        name=name,
+        recipe_name="Extra Items",
+        servings=1,
+        extra_items=True,
+    )
+
+
+def notify_grocery_list_changed(
+    db: Session,
+    grocery_list: GroceryList,
+    added: Iterable[GroceryListItem] = (),
+    updated: Iterable[GroceryListItem] = (),
+    removed_ids: Iterable[int] = (),
+) -> None:
+    """Push the changed items of a flushed grocery list to its owner."""
+    notify_change(
+        db,
+        grocery_list.user_id,
+        "grocery_list.updated",
+        {
+            "id": grocery_list.id,
+            "extra_items": grocery_list.extra_items,
+            "added": [
+                GroceryListItemSchema.model_validate(item).model_dump(mode="json")
+                for item in added
+            ],
+            "updated": [
+                {"id": item.id, "quantity": item.quantity, "servings": item.servings}
+                for item in updated
+            ],
+            "removed": list(removed_ids),
+        },
+    )
+
+
+def update_extra_items(
+    grocery_list: GroceryList, extra_items: str
+) -> Tuple[List[GroceryListItem], List[int]]:
+    """Set grocery_list's extra_items text and bring its extra items in line.
+
+    Lines are matched against the existing extra items by text, so unchanged
+    lines keep their rows and active state. Only removed lines are deleted
+    and only added lines inserted, a repeated line counts once per occurrence.
+    Returns the added items and the IDs of the removed ones.
+    """
+    grocery_list.extra_items = extra_items
+
+    lines = extra_items.split("\n") if extra_items != "" else []
+    wanted = Counter(lines)
+    removed_ids = []
+    for item in list(grocery_list.grocery_list_items):
+        if not item.extra_items:
+            continue
+        if wanted[item.name] > 0:
+            wanted[item.name] -= 1
+        else:
+            removed_ids.append(item.id)
+            grocery_list.grocery_list_items.remove(item)
+
+    added = []
+    for line in lines:
+        if wanted[line] > 0:
+            wanted[line] -= 1
+            added.append(extra_grocery_item(line))
+    grocery_list.grocery_list_items.extend(added)
+
+    return added, removed_ids
+
+
+def sync_grocery_lists(
+    db: Session,
+    user: User,
+    meal_plan_items: Sequence[MealPlanItem],
+    deleted: bool = False,
+) -> None:
+    """Apply changes of meal_plan_items to grocery lists covering their dates.
+
+    Only the items' own rows are touched. They're added when an item enters
+    a list's window, removed when it leaves or is deleted, rebuilt when its
+    recipe changed and otherwise rescaled in place, which keeps their
+    active state. meal_plan_items must have been flushed, changed lists are
+    flushed and pushed to their owner once for the whole batch.
+    """
+    if not meal_plan_items:
+        return
+
+    grocery_lists = db.scalars(
+        safe_query(select, [GroceryList], user).filter(
+            GroceryList.start_date.is_not(None), GroceryList.end_date.is_not(None)
+        )
+    ).all()
+
+    changes = []
+    for grocery_list in grocery_lists:
+        list_items: Dict[int, List[GroceryListItem]] = defaultdict(list)
+        for item in grocery_list.grocery_list_items:
+            if item.meal_plan_item_id is not None:
+                list_items[item.meal_plan_item_id].append(item)
+
+        added: List[GroceryListItem] = []
+        updated: List[GroceryListItem] = []
+        removed_ids: List[int] = []
+        for meal_plan_item in meal_plan_items:
+            items = list_items.get(meal_plan_item.id, [])
+            covered = (
+                not deleted
+                and grocery_list.start_date
+                <= meal_plan_item.date
+                <= grocery_list.end_date
+            )
+            if not covered and not items:
+                continue
+
+            ingredients = {
+                ingredient.id: ingredient
+                for ingredient in meal_plan_item.recipe.ingredients
+            }
+            if (
+                covered
+                and items
+                and all(item.ingredient_id in ingredients for item in items)
+            ):
+                scale = servings_scale(meal_plan_item)
+                for item in items:
+                    item.quantity = ingredients[item.ingredient_id].quantity * scale
+                    item.servings = meal_plan_item.servings
+                updated.extend(items)
+                continue
+
+            removed_ids.extend(item.id for item in items)
+            for item in items:
+                grocery_list.grocery_list_items.remove(item)
+            if covered:
+                new_items = meal_plan_grocery_items(meal_plan_item)
+                grocery_list.grocery_list_items.extend(new_items)
+                added.extend(new_items)
+
+        if added or updated or removed_ids:
+            changes.append((grocery_list, added, updated, removed_ids))
+
+    db.flush()
+
+    for grocery_list, added, updated, removed_ids in changes:
+        notify_grocery_list_changed(db, grocery_list, added, updated, removed_ids)
+
+
+def delete_meal_plan_grocery_items(db: Session, meal_plan_item_ids: Select) -> None:
+    """Delete the grocery list items of meal plan items about to be deleted.
+
+    meal_plan_item_ids selects the IDs, e.g. of a date window, so the items
+    are removed by one statement without loading the meal plan. It must run
+    before the meal plan items are deleted, whose trigger would otherwise
+    remove the rows without anyone being told. Changed lists are pushed to
+    their owner.
+    """
+    removed = db.execute(
+        delete(GroceryListItem)
+        .filter(GroceryListItem.meal_plan_item_id.in_(meal_plan_item_ids))
+        .returning(GroceryListItem.grocery_list_id, GroceryListItem.id)
+    ).all()
+
+    removed_ids: Dict[int, List[int]] = defaultdict(list)
+    for grocery_list_id, grocery_list_item_id in removed:
+        removed_ids[grocery_list_id].append(grocery_list_item_id)
+    if not removed_ids:
+        return
+
+    for grocery_list in db.scalars(
+        select(GroceryList).filter(GroceryList.id.in_(removed_ids))
+    ):
+        notify_grocery_list_changed(
+            db, grocery_list, removed_ids=removed_ids[grocery_list.id]
+        )
+
+
+def sync_grocery_lists_with_rule(
+    db: Session, user: User, meal_plan_rule: MealPlanRule, deleted: bool = False
+) -> None:
+    """Apply a change of meal_plan_rule to grocery lists.
+
+    The items of the rule's occurrences are rebuilt for each list's window,
+    or removed if the rule is being deleted. Changes to the rule's
+    exceptions count as changes to the rule. Changed lists are flushed and
+    pushed to their owner.
+    """
+    grocery_lists = db.scalars(
+        safe_query(select, [GroceryList], user).filter(
+            GroceryList.start_date.is_not(None), GroceryList.end_date.is_not(None)
+        )
+    ).all()
+
+    changes = []
+    for grocery_list in grocery_lists:
+        items = [
+            item
+            for item in grocery_list.grocery_list_items
+            if item.meal_plan_rule_id == meal_plan_rule.id
+        ]
+        removed_ids = [item.id for item in items]
+        for item in items:
+            grocery_list.grocery_list_items.remove(item)
+
+        added = []
+        if not deleted:
+            for meal_plan_item in rule_meal_plan_items(
+                meal_plan_rule, grocery_list.start_date, grocery_list.end_date
+            ):
+                added.extend(meal_plan_grocery_items(meal_plan_item))
+        grocery_list.grocery_list_items.extend(added)
+
+        if added or removed_ids:
+            changes.append((grocery_list, added, removed_ids))
+
+    db.flush()
+
+    for grocery_list, added, removed_ids in changes:
+        notify_grocery_list_changed(
+            db, grocery_list, added=added, removed_ids=removed_ids
+        )
+
+
+def _display_unit(units: Sequence[Optional[str]]) -> Optional[str]:
+    # Largest unit of the line, so 1 cup and 2 tbsp read as cups
+    convertible = [unit for unit in units if unit in UNITS]
+    if convertible:
+        return max(convertible, key=lambda unit: UNITS[unit][1])
+    return units[0]
+
+
+def consolidate_grocery_items(
+    items: Sequence[GroceryListItem],
+) -> List[Dict[str, Any]]:
+    """Merge items of the same ingredient into one line per unit dimension.
+
+    Quantities are converted to the base unit of their dimension, then all
+    lines are summed at once with a bincount over (normalized name,
+    dimension) groups. Each line is shown in the largest unit among its
+    items, which remain available as its breakdown.
+    """
+    groups: Dict[Tuple[str, Optional[str]], int] = {}
+    group_index = np.empty(len(items), dtype=np.int64)
+    base_quantities = np.empty(len(items))
+    inactive = np.empty(len(items))
+    units: List[Optional[str]] = []
+    for i, item in enumerate(items):
+        normalized = normalize_quantity(item.quantity, item.unit)
+        name = normalize_ingredient_name(item.name) or item.name.strip()
+        group_index[i] = groups.setdefault((name, normalized.dimension), len(groups))
+        base_quantities[i] = normalized.base_quantity
+        inactive[i] = not item.active
+        units.append(normalized.unit)
+
+    totals = np.bincount(group_index, weights=base_quantities, minlength=len(groups))
+    inactive_counts = np.bincount(group_index, weights=inactive, minlength=len(groups))
+
+    members: Dict[int, List[int]] = defaultdict(list)
+    for i, group in enumerate(group_index):
+        members[group].append(i)
+
+    lines = []
+    for (name, _), group in groups.items():
+        unit = _display_unit([units[i] for i in members[group]])
+        lines.append(
+            {
+                "name": name,
+                "quantity": round(convert_base_quantity(totals[group], unit), 3),
+                "unit": unit,
+                "active": bool(inactive_counts[group] == 0),
+                "items": [items[i] for i in members[group]],
+            }
+        )
+    return sorted(lines, key=lambda line: (line["name"], line["unit"] or ""))
+
+
+def grocery_list_preview(
+    db: Session, user: User, start_date: datetime, end_date: datetime
+) -> List[Dict[str, Any]]:
+    """Consolidated grocery list for a meal plan window, without storing it.
+
+    The ingredients of every meal plan item in the window are read with a
+    single query, plus a few for the rules overlapping it. Results are
+    cached under the user's meal_plan_version, which triggers bump on any
+    change to their meal plan or its recipes, so repeated previews are
+    served from memory until the plan changes. Admins see every user's meal
+    plan, which no single version covers, and aren't cached.
+    """
+    cache_key = None
+    if user.role == "user":
+        # Read afresh, the user may have been loaded before the plan changed
+        version = db.scalar(select(User.meal_plan_version).filter_by(id=user.id))
+        cache_key = (user.id, version, start_date, end_date)
+        cached = grocery_preview_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    query = (
+        select(
+            MealPlanItem.servings,
+            Recipe.name,
+            Recipe.servings,
+            Ingredient.quantity,
+            Ingredient.unit,
+            Ingredient.name,
+        )
+        .join(Recipe, Recipe.id == MealPlanItem.recipe_id)
+        .join(Ingredient, Ingredient.recipe_id == Recipe.id)
+        .filter(MealPlanItem.date >= start_date, MealPlanItem.date <= end_date)
+    )
+    if user.role == "user":
+        query = query.filter(Recipe.user_id == user.id)
+
+    items = [
+        GroceryListItem(
+            active=True,
+            quantity=quantity * (servings / recipe_servings if recipe_servings else 1),
+            unit=unit,
+            name=name,
+            recipe_name=recipe_name,
+        )
+        for servings, recipe_name, recipe_servings, quantity, unit, name in db.execute(
+            query
+        )
+    ]
+    for meal_plan_item in expand_meal_plan_rules(
+        db,
+        user,
+        start_date,
+        end_date,
+        options=[selectinload(MealPlanRule.recipe).selectinload(Recipe.ingredients)],
+    ):
+        items.extend(meal_plan_grocery_items(meal_plan_item))
+
+    preview = [
+        {
+            "name": line["name"],
+            "quantity": line["quantity"],
+            "unit": line["unit"],
+            "recipe_names": sorted({item.recipe_name for item in line["items"]}),
+        }
+        for line in consolidate_grocery_items(items)
+    ]
+    if cache_key is not None:
+        grocery_preview_cache.set(cache_key, preview)
+    return preview
@@ -0,0 +1,291 @@
+import re
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Set, TypeVar
+
+from fastapi.logger import logger
+from sqlalchemy import case, exists, func, select, update
+from sqlalchemy.orm import Session
+
+from server.constants import IMAGE_FORMAT_EXTENSION_MAP
+from server.storage.blobs import Storage, StoredObject
+from server.storage.database import engine
+from server.storage.models import ImageBlob, Recipe
+
+# Arbitrary key for pg_try_advisory_lock so only one process collects at a time
+IMAGE_GC_LOCK_ID = 0x1A6E_0C01
+
+BLOB_HASH_RE = re.compile(r"^blobs/[0-9a-f]{2}/[0-9a-f]{2}/(?P<hash>[0-9a-f]{64})")
+LEGACY_KEY_RE = re.compile(r"^(?P<stem>\d+/[^/]+?)(?P<derivative>_\d+w)?\.\w+$")
+
+T = TypeVar("T")
+
+
+class ImageGCReport(NamedTuple):
+    reconciled_blobs: int
+    deleted_blobs: int
+    scanned_files: int
+    deleted_files: int
+    reclaimed_bytes: int
+
+
+def batched(iterable: Iterable[T], size: int) -> Iterator[List[T]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def reconcile_blob_ref_counts(db: Session, batch_size: int) -> int:
+    """Recount blob references from recipes.
+
+    Reference counts can drift, e.g. when recipes are removed by the user
+    cascade in the database rather than through delete_recipe.
+    """
+    reconciled = 0
+    last_hash = ""
+    while True:
+        hashes = db.scalars(
+            select(ImageBlob.hash)
+            .filter(ImageBlob.hash > last_hash)
+            .order_by(ImageBlob.hash)
+            .limit(batch_size)
+        ).all()
+        if not hashes:
+            break
+
+        counts = (
+            select(ImageBlob.hash, func.count(Recipe.id).label("ref_count"))
+            .outerjoin(Recipe, Recipe.image_hash == ImageBlob.hash)
+            .filter(ImageBlob.hash.in_(hashes))
+            .group_by(ImageBlob.hash)
+            .subquery()
+        )
+        query = (
+            update(ImageBlob)
+            .filter(
+                ImageBlob.hash == counts.c.hash,
+                ImageBlob.ref_count != counts.c.ref_count,
+            )
+            .values(
+                ref_count=counts.c.ref_count,
+                orphaned_at=case(
+                    (
+                        counts.c.ref_count == 0,
+                        func.coalesce(ImageBlob.orphaned_at, datetime.utcnow()),
+                    ),
+                    else_=None,
+                ),
+            )
+        )
+        reconciled += db.execute(query).rowcount
+        db.commit()
+        last_hash = hashes[-1]
+
+    return reconciled
+
+
+def delete_orphaned_blobs(
+    db: Session,
+    storage: Storage,
+    cutoff: datetime,
+    batch_size: int,
+    dry_run: bool = False,
+) -> ImageGCReport:
+    """Delete blobs, and their derivatives, unreferenced since before cutoff.
+
+    Rows are locked while their files are removed, so an upload of the same
+    content waits for the delete to finish and then stores the blob again.
+    """
+    deleted_blobs = deleted_files = reclaimed_bytes = 0
+    last_hash = ""
+    while True:
+        blobs = db.scalars(
+            select(ImageBlob)
+            .filter(
+                ImageBlob.hash > last_hash,
+                ImageBlob.ref_count <= 0,
+                ImageBlob.orphaned_at < cutoff,
+                ~exists().where(Recipe.image_hash == ImageBlob.hash),
+            )
+            .order_by(ImageBlob.hash)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not blobs:
+            break
+
+        for blob in blobs:
+            stem = blob.key.rsplit(".", 1)[0]
+            for obj in list(storage.iter_objects(prefix=stem)):
+                if not dry_run:
+                    storage.delete(obj.key)
+                deleted_files += 1
+                reclaimed_bytes += obj.size
+
+            if not dry_run:
+                db.delete(blob)
+            deleted_blobs += 1
+
+        last_hash = blobs[-1].hash
+        db.commit()
+
+    return ImageGCReport(0, deleted_blobs, 0, deleted_files, reclaimed_bytes)
+
+
+def _referenced_objects(
+    db: Session, storage: Storage, objects: List[StoredObject]
+) -> Set[str]:
+    blob_hashes = {}
+    candidate_urls = {}
+    for obj in objects:
+        blob_match = BLOB_HASH_RE.match(obj.key)
+        if blob_match:
+            blob_hashes[obj.key] = blob_match.group("hash")
+            continue
+
+        legacy_match = LEGACY_KEY_RE.match(obj.key)
+        if legacy_match is None:
+            continue
+        if legacy_match.group("derivative"):
+            # Derivatives may use a different extension than their original
+            candidate_urls[obj.key] = [
+                storage.url(f"{legacy_match.group('stem')}{extension}")
+                for extension in IMAGE_FORMAT_EXTENSION_MAP.values()
+            ]
+        else:
+            candidate_urls[obj.key] = [storage.url(obj.key)]
+
+    referenced = set()
+    if blob_hashes:
+        existing_hashes = set(
+            db.scalars(
+                select(ImageBlob.hash).filter(
+                    ImageBlob.hash.in_(set(blob_hashes.values()))
+                )
+            ).all()
+        )
+        referenced.update(
+            key
+            for key, blob_hash in blob_hashes.items()
+            if blob_hash in existing_hashes
+        )
+
+    if candidate_urls:
+        urls = {url for key_urls in candidate_urls.values() for url in key_urls}
+        existing_urls = set(
+            db.scalars(select(Recipe.image_url).filter(Recipe.image_url.in_(urls)))
+        )
+        referenced.update(
+            key
+            for key, key_urls in candidate_urls.items()
+            if existing_urls.intersection(key_urls)
+        )
+
+    return referenced
+
+
+def delete_orphaned_files(
+    db: Session,
+    storage: Storage,
+    cutoff: datetime,
+    batch_size: int,
+    dry_run: bool = False,
+) -> ImageGCReport:
+    """Delete files in storage that no blob or recipe image URL accounts for.
+
+    This covers images uploaded before content addressed storage, blob files
+    whose upload transaction never committed and abandoned staging files.
+    Only recipe image locations are considered, anything else in storage is
+    left alone.
+    """
+    scanned_files = deleted_files = reclaimed_bytes = 0
+    for objects in batched(storage.iter_objects(), batch_size):
+        scanned_files += len(objects)
+        candidates = [
+            obj
+            for obj in objects
+            if obj.modified_at < cutoff
+            and (
+                obj.key.startswith(".staging/")
+                or BLOB_HASH_RE.match(obj.key)
+                or LEGACY_KEY_RE.match(obj.key)
+            )
+        ]
+        if not candidates:
+            continue
+
+        referenced = _referenced_objects(db, storage, candidates)
+        for obj in candidates:
+            if obj.key in referenced:
+                continue
+            if not dry_run:
+                storage.delete(obj.key)
+            deleted_files += 1
+            reclaimed_bytes += obj.size
+
+        db.commit()
+
+    return ImageGCReport(0, 0, scanned_files, deleted_files, reclaimed_bytes)
+
+
+def collect_orphaned_images(
+    db: Session,
+    storage: Storage,
+    grace_period: timedelta,
+    batch_size: int,
+    dry_run: bool = False,
+) -> ImageGCReport:
+    """Reclaim storage used by images no recipe references anymore.
+
+    Anything orphaned or written less than grace_period ago is kept, which
+    protects uploads whose transaction hasn't committed yet.
+    """
+    cutoff = datetime.utcnow() - grace_period
+
+    reconciled_blobs = 0
+    if not dry_run:
+        reconciled_blobs = reconcile_blob_ref_counts(db, batch_size)
+    blobs_report = delete_orphaned_blobs(db, storage, cutoff, batch_size, dry_run)
+    files_report = delete_orphaned_files(db, storage, cutoff, batch_size, dry_run)
+
+    report = ImageGCReport(
+        reconciled_blobs=reconciled_blobs,
+        deleted_blobs=blobs_report.deleted_blobs,
+        scanned_files=files_report.scanned_files,
+        deleted_files=blobs_report.deleted_files + files_report.deleted_files,
+        reclaimed_bytes=blobs_report.reclaimed_bytes + files_report.reclaimed_bytes,
+    )
+    logger.info(f"Image garbage collection finished: {report}")
+    return report
+
+
+def run_image_gc(
+    storage: Storage,
+    grace_period: timedelta,
+    batch_size: int,
+    dry_run: bool = False,
+) -> Optional[ImageGCReport]:
+    """Run collect_orphaned_images unless another process already is.
+
+    Returns None when the lock is held elsewhere. The session is bound to a
+    single connection so the session level advisory lock survives the per
+    batch commits.
+    """
+    with engine.connect() as connection:
+        locked = connection.execute(
+            select(func.pg_try_advisory_lock(IMAGE_GC_LOCK_ID))
+        ).scalar()
+        connection.commit()
+        if not locked:
+            logger.info("Image garbage collection already running elsewhere")
+            return None
+
+        try:
+            with Session(bind=connection) as db:
+                return collect_orphaned_images(
+                    db, storage, grace_period, batch_size, dry_run
+                )
+        finally:
+            connection.rollback()
+            connection.execute(select(func.pg_advisory_unlock(IMAGE_GC_LOCK_ID)))
+            connection.commit()
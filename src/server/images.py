@@ -0,0 +1,345 @@
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import magic
+from fastapi import HTTPException, UploadFile
+from fastapi.logger import logger
+from PIL import Image, ImageOps
+from sqlalchemy import case, event, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from server.config import CONFIG
+from server.constants import (
+    ALLOWED_IMAGE_FORMATS,
+    IMAGE_CHUNK_SIZE,
+    IMAGE_DERIVATIVE_FORMATS,
+    IMAGE_FORMAT_EXTENSION_MAP,
+    IMAGE_SNIFF_SIZE,
+    THUMBNAIL_FORMAT,
+)
+from server.storage.blobs import Storage
+from server.storage.database import SessionLocal
+from server.storage.models import ImageBlob, Recipe
+
+derivative_executor = ThreadPoolExecutor(
+    max_workers=CONFIG.image_workers, thread_name_prefix="image-derivatives"
+)
+
+# Session.info key of the derivatives to generate once committed
+SCHEDULED_DERIVATIVES_KEY = "scheduled_image_derivatives"
+
+
+class StagedImage(NamedTuple):
+    path: str
+    sha256: str
+    mime_type: str
+    size: int
+
+
+def sniff_image_format(head: bytes) -> str:
+    mime_type = magic.from_buffer(head, mime=True)
+    if mime_type not in ALLOWED_IMAGE_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"Image file format not supported: {mime_type}"
+        )
+    return mime_type
+
+
+def stage_image_upload(file: UploadFile) -> StagedImage:
+    """Stream an uploaded image into the staging directory.
+
+    Only the first IMAGE_SNIFF_SIZE bytes are used to detect the format, the
+    rest is copied in IMAGE_CHUNK_SIZE chunks while being hashed, so memory
+    use doesn't depend on the size of the upload. The staged file is removed
+    again if the upload is rejected.
+    """
+    head = file.file.read(IMAGE_SNIFF_SIZE)
+    mime_type = sniff_image_format(head)
+
+    os.makedirs(CONFIG.upload_staging_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=CONFIG.upload_staging_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            hasher = hashlib.sha256()
+            size = 0
+            chunk = head
+            while chunk:
+                size += len(chunk)
+                if size > CONFIG.max_image_size:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"Image file exceeds maximum size of {CONFIG.max_image_size} bytes",
+                    )
+                hasher.update(chunk)
+                f.write(chunk)
+                chunk = file.file.read(IMAGE_CHUNK_SIZE)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+    return StagedImage(tmp_file, hasher.hexdigest(), mime_type, size)
+
+
+def blob_key(sha256: str, mime_type: str) -> str:
+    extension = IMAGE_FORMAT_EXTENSION_MAP[mime_type]
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def acquire_image_blob(db: Session, staged: StagedImage, key: str) -> None:
+    query = (
+        insert(ImageBlob)
+        .values(
+            hash=staged.sha256,
+            key=key,
+            mime_type=staged.mime_type,
+            size=staged.size,
+            ref_count=1,
+        )
+        .on_conflict_do_update(
+            index_elements=[ImageBlob.hash],
+            set_={"ref_count": ImageBlob.ref_count + 1, "orphaned_at": None},
+        )
+    )
+    db.execute(query)
+
+
+def retain_image_blob(db: Session, image_hash: str) -> None:
+    query = (
+        update(ImageBlob)
+        .filter_by(hash=image_hash)
+        .values(ref_count=ImageBlob.ref_count + 1, orphaned_at=None)
+    )
+    db.execute(query)
+
+
+def release_image_blob(db: Session, image_hash: str) -> None:
+    query = (
+        update(ImageBlob)
+        .filter_by(hash=image_hash)
+        .values(
+            ref_count=ImageBlob.ref_count - 1,
+            orphaned_at=case(
+                (ImageBlob.ref_count <= 1, datetime.utcnow()),
+                else_=ImageBlob.orphaned_at,
+            ),
+        )
+    )
+    db.execute(query)
+
+
+def store_image_upload(
+    db: Session, storage: Storage, file: UploadFile
+) -> Tuple[str, str, bool]:
+    """Store an uploaded image under its content hash.
+
+    Returns the hash, the storage key and whether the blob was newly written,
+    identical uploads share a single blob and only bump its reference count.
+    """
+    staged = stage_image_upload(file)
+    key = blob_key(staged.sha256, staged.mime_type)
+    try:
+        # Take the reference before looking for the blob so garbage collection
+        # can't remove it between the check and the commit
+        acquire_image_blob(db, staged, key)
+        stored = not storage.exists(key)
+        if stored:
+            storage.put(key, staged.path, content_type=staged.mime_type)
+    finally:
+        if os.path.exists(staged.path):
+            os.unlink(staged.path)
+
+    return staged.sha256, key, stored
+
+
+def derivative_name(original: str, width: int, extension: str) -> str:
+    stem, _ = os.path.splitext(original)
+    return f"{stem}_{width}w{extension}"
+
+
+def derivative_urls(image_url: str) -> Tuple[str, Dict[str, str]]:
+    widths = CONFIG.image_derivative_widths
+    srcset = {}
+    for mime_type, (extension, _, _) in IMAGE_DERIVATIVE_FORMATS.items():
+        srcset[mime_type] = ", ".join(
+            f"{derivative_name(image_url, width, extension)} {width}w"
+            for width in widths
+        )
+
+    thumbnail_extension = IMAGE_DERIVATIVE_FORMATS[THUMBNAIL_FORMAT][0]
+    thumbnail_url = derivative_name(image_url, widths[0], thumbnail_extension)
+
+    return thumbnail_url, srcset
+
+
+def derivatives_exist(storage: Storage, key: str) -> bool:
+    """Whether every derivative of key was written, the last one is enough."""
+    widths = CONFIG.image_derivative_widths
+    extension = list(IMAGE_DERIVATIVE_FORMATS.values())[-1][0]
+    return storage.exists(derivative_name(key, widths[-1], extension))
+
+
+def set_recipe_image(
+    recipe: Recipe,
+    image_url: Optional[str],
+    image_hash: Optional[str],
+    derivatives: bool = True,
+) -> None:
+    """Point recipe at an image, and its derivatives if they're written.
+
+    Until then the original stands in for the thumbnail, with no srcset, so
+    clients never get URLs that don't exist yet.
+    """
+    recipe.image_url = image_url
+    recipe.image_hash = image_hash
+    if image_url is None:
+        recipe.thumbnail_url, recipe.srcset = None, None
+    elif derivatives:
+        recipe.thumbnail_url, recipe.srcset = derivative_urls(image_url)
+    else:
+        recipe.thumbnail_url, recipe.srcset = image_url, None
+
+
+def _put_image(
+    storage: Storage,
+    image: Image.Image,
+    key: str,
+    mime_type: str,
+    pil_format: str,
+    options: Dict[str, Any],
+):
+    os.makedirs(CONFIG.upload_staging_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=CONFIG.upload_staging_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            image.save(f, format=pil_format, **options)
+        storage.put(key, tmp_file, content_type=mime_type)
+    finally:
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+
+
+def generate_image_derivatives(storage: Storage, key: str) -> List[str]:
+    """Store a resized copy of key in every derivative format and width.
+
+    Images are never upscaled, so originals narrower than a configured width
+    get a same-size re-encode under that width's name to keep URLs uniform.
+    """
+    written = []
+    with storage.open(key) as f, Image.open(f) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+        for width in CONFIG.image_derivative_widths:
+            resized = image.copy()
+            resized.thumbnail((width, resized.height), Image.Resampling.LANCZOS)
+
+            for mime_type, format_info in IMAGE_DERIVATIVE_FORMATS.items():
+                extension, pil_format, options = format_info
+                frame = resized
+                if pil_format == "JPEG" and frame.mode != "RGB":
+                    frame = frame.convert("RGB")
+
+                derivative_key = derivative_name(key, width, extension)
+                _put_image(
+                    storage, frame, derivative_key, mime_type, pil_format, options
+                )
+                written.append(derivative_key)
+
+    return written
+
+
+def publish_image_derivatives(db: Session, storage: Storage, key: str) -> None:
+    """Point every recipe using the image at key to its written derivatives."""
+    image_url = storage.url(key)
+    thumbnail_url, srcset = derivative_urls(image_url)
+    db.execute(
+        update(Recipe)
+        .filter(Recipe.image_url == image_url)
+        .values(thumbnail_url=thumbnail_url, srcset=srcset)
+    )
+
+
+def _generate_image_derivatives_logged(storage: Storage, key: str) -> List[str]:
+    try:
+        written = generate_image_derivatives(storage, key)
+        with SessionLocal() as db:
+            publish_image_derivatives(db, storage, key)
+            db.commit()
+        return written
+    except Exception:
+        logger.exception(f"Failed to generate image derivatives for {key}")
+        raise
+
+
+def schedule_image_derivatives(db: Session, storage: Storage, key: str) -> None:
+    """Generate the derivatives of key in the background once db commits.
+
+    Recipes are pointed to them when they're written. Starting after the
+    commit means the job always sees the recipes that use the image. If it
+    fails they keep using the original image.
+    """
+    db.info.setdefault(SCHEDULED_DERIVATIVES_KEY, []).append((storage, key))
+
+
+@event.listens_for(Session, "after_commit")
+def start_scheduled_image_derivatives(db: Session):
+    for storage, key in db.info.pop(SCHEDULED_DERIVATIVES_KEY, ()):
+        derivative_executor.submit(_generate_image_derivatives_logged, storage, key)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_scheduled_image_derivatives(db: Session):
+    db.info.pop(SCHEDULED_DERIVATIVES_KEY, None)
+
+
+def backfill_image_derivatives(
+    db: Session, storage: Storage, batch_size: int, force: bool = False
+) -> int:
+    """Generate derivatives for recipes whose image predates the pipeline.
+
+    Recipes are walked in id order one batch at a time, committing after each
+    batch. Unless force is set, recipes whose derivative URLs already match
+    the configured widths are skipped.
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        recipes = db.scalars(
+            select(Recipe)
+            .filter(Recipe.image_url.is_not(None), Recipe.id > last_id)
+            .order_by(Recipe.id)
+            .limit(batch_size)
+        ).all()
+        if not recipes:
+            break
+
+        for recipe in recipes:
+            thumbnail_url, srcset = derivative_urls(recipe.image_url)
+            if (
+                not force
+                and recipe.thumbnail_url == thumbnail_url
+                and recipe.srcset == srcset
+            ):
+                continue
+
+            key = storage.key_for_url(recipe.image_url)
+            if key is None or not storage.exists(key):
+                logger.warning(
+                    f"Image for recipe {recipe.id} is missing: {recipe.image_url}"
+                )
+                continue
+
+            generate_image_derivatives(storage, key)
+            set_recipe_image(recipe, recipe.image_url, recipe.image_hash)
+            processed += 1
+
+        db.commit()
+        last_id = recipes[-1].id
+
+    return processed
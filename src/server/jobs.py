@@ -0,0 +1,52 @@
+import asyncio
+from datetime import timedelta
+from typing import Any, Callable, Set
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.logger import logger
+
+from server.config import CONFIG
+from server.image_gc import run_image_gc
+from server.partitions import run_meal_plan_partition_maintenance
+from server.storage.blobs import storage
+
+running_jobs: Set[asyncio.Task] = set()
+
+
+async def run_periodically(interval: timedelta, func: Callable, *args: Any):
+    while True:
+        await asyncio.sleep(interval.total_seconds())
+        try:
+            await run_in_threadpool(func, *args)
+        except Exception:
+            logger.exception(f"Periodic job {func.__name__} failed")
+
+
+def start_job(interval: timedelta, func: Callable, *args: Any):
+    task = asyncio.create_task(run_periodically(interval, func, *args))
+    running_jobs.add(task)
+
+
+async def start_background_jobs():
+    if CONFIG.image_gc_interval_minutes > 0:
+        start_job(
+            timedelta(minutes=CONFIG.image_gc_interval_minutes),
+            run_image_gc,
+            storage,
+            timedelta(hours=CONFIG.image_gc_grace_period_hours),
+            CONFIG.image_gc_batch_size,
+        )
+    if CONFIG.meal_plan_partition_interval_minutes > 0:
+        start_job(
+            timedelta(minutes=CONFIG.meal_plan_partition_interval_minutes),
+            run_meal_plan_partition_maintenance,
+            CONFIG.meal_plan_partition_months_ahead,
+            CONFIG.meal_plan_archive_months,
+            CONFIG.meal_plan_archive_tablespace,
+        )
+
+
+async def stop_background_jobs():
+    for task in running_jobs:
+        task.cancel()
+    running_jobs.clear()
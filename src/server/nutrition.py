@@ -0,0 +1,142 @@
+import re
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from server.storage.models import Recipe
+
+# Nutrient column -> names it goes by in free-form nutrition text
+NUTRIENT_ALIASES = {
+    "calories": ["calories", "calorie", "kcal", "cals", "cal"],
+    "protein": ["protein"],
+    "fat": ["total fat", "fat"],
+    "carbohydrates": ["carbohydrates", "carbohydrate", "carbs", "carb"],
+    "fiber": ["dietary fiber", "fiber", "fibre"],
+    "sugar": ["sugars", "sugar"],
+    "sodium": ["sodium"],
+}
+
+# Unit each nutrient column is stored in, as grams per unit
+NUTRIENT_UNITS = {
+    "protein": 1,
+    "fat": 1,
+    "carbohydrates": 1,
+    "fiber": 1,
+    "sugar": 1,
+    "sodium": 0.001,
+}
+
+UNIT_GRAMS = {"kg": 1000, "g": 1, "mg": 0.001, "mcg": 0.000001, "µg": 0.000001}
+
+VALUE_PATTERN = r"(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>kg|mg|mcg|µg|g)?"
+# Don't read "saturated fat" or "added sugars" as their totals
+QUALIFIER_PATTERN = r"(?<!saturated )(?<!trans )(?<!added )"
+
+# Index into the pattern pairs built by _nutrient_patterns
+LABEL_FIRST, VALUE_FIRST = 0, 1
+
+SEGMENT_SPLIT_RE = re.compile(r"[,;|/()\n]+|\band\b", re.I)
+VALUE_START_RE = re.compile(r"^\d")
+LABEL_START_RE = re.compile(
+    r"^(?:"
+    + "|".join(
+        re.escape(alias) for aliases in NUTRIENT_ALIASES.values() for alias in aliases
+    )
+    + r")\b",
+    re.I,
+)
+
+
+def _nutrient_patterns(aliases):
+    names = "|".join(re.escape(alias) for alias in aliases)
+    label_first = re.compile(
+        rf"{QUALIFIER_PATTERN}\b(?:{names})\b\s*[:=-]?\s*{VALUE_PATTERN}", re.I
+    )
+    value_first = re.compile(
+        rf"{VALUE_PATTERN}\b\s*(?:of\s+)?{QUALIFIER_PATTERN}(?:{names})\b", re.I
+    )
+    return label_first, value_first
+
+
+NUTRIENT_PATTERNS = {
+    nutrient: _nutrient_patterns(aliases)
+    for nutrient, aliases in NUTRIENT_ALIASES.items()
+}
+
+
+def parse_nutrition(text: Optional[str]) -> Dict[str, Optional[float]]:
+    """Extract numeric nutrient amounts from free-form nutrition text.
+
+    Understands both "300 calories, 12g protein" and "Protein: 12 g" styles.
+    The text is split on punctuation, and a segment starting with a number or
+    a nutrient name is read in that style throughout, so "Protein 12g Fat 5g"
+    doesn't attribute 12g to fat. Amounts are converted to the unit of their
+    column, nutrients that aren't mentioned are None.
+    """
+    nutrients: Dict[str, Optional[float]] = dict.fromkeys(NUTRIENT_ALIASES)
+    if not text:
+        return nutrients
+
+    for segment in SEGMENT_SPLIT_RE.split(text):
+        segment = segment.strip()
+        if not segment:
+            continue
+
+        if VALUE_START_RE.match(segment):
+            styles = [VALUE_FIRST]
+        elif LABEL_START_RE.match(segment):
+            styles = [LABEL_FIRST]
+        else:
+            styles = [VALUE_FIRST, LABEL_FIRST]
+
+        for nutrient, patterns in NUTRIENT_PATTERNS.items():
+            if nutrients[nutrient] is not None:
+                continue
+
+            for style in styles:
+                match = patterns[style].search(segment)
+                if match is None:
+                    continue
+
+                value = float(match.group("value"))
+                unit = match.group("unit")
+                if nutrient in NUTRIENT_UNITS and unit is not None:
+                    value = value * UNIT_GRAMS[unit.lower()] / NUTRIENT_UNITS[nutrient]
+                nutrients[nutrient] = round(value, 3)
+                break
+
+    return nutrients
+
+
+def set_recipe_nutrition(recipe: Recipe) -> None:
+    for nutrient, value in parse_nutrition(recipe.nutrition).items():
+        setattr(recipe, nutrient, value)
+
+
+def backfill_nutrition(db: Session, batch_size: int) -> int:
+    """Parse the nutrition text of every recipe into its nutrient columns.
+
+    Recipes are walked in id order one batch at a time, committing after each
+    batch so the backfill never holds long running locks.
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        recipes = db.scalars(
+            select(Recipe)
+            .filter(Recipe.id > last_id)
+            .order_by(Recipe.id)
+            .limit(batch_size)
+        ).all()
+        if not recipes:
+            break
+
+        for recipe in recipes:
+            set_recipe_nutrition(recipe)
+        processed += len(recipes)
+
+        db.commit()
+        last_id = recipes[-1].id
+
+    return processed
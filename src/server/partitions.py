@@ -0,0 +1,260 @@
+import re
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from dateutil.relativedelta import relativedelta
+from fastapi.logger import logger
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import Session
+
+from server.storage.database import engine
+from server.storage.models import MealPlanItem
+
+# Arbitrary key for pg_try_advisory_lock so only one process maintains at a time
+MEAL_PLAN_PARTITION_LOCK_ID = 0x1A6E_0C02
+
+DEFAULT_PARTITION = "meal_plan_item_default"
+ARCHIVE_PARTITION = "meal_plan_item_archive"
+
+MONTH_PARTITION_RE = re.compile(r"^meal_plan_item_(?P<year>\d{4})_(?P<month>\d{2})$")
+UPPER_BOUND_RE = re.compile(r"TO \('(?P<bound>[^']+)'\)")
+
+COLUMNS = ", ".join(column.name for column in MealPlanItem.__table__.columns)
+
+
+class MealPlanPartitionReport(NamedTuple):
+    archived: List[str]
+    created: List[str]
+
+
+def month_start(date: datetime) -> datetime:
+    return datetime(date.year, date.month, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"meal_plan_item_{month:%Y_%m}"
+
+
+def list_partitions(db: Session) -> Dict[str, str]:
+    """Partitions of meal_plan_item by name, with their bound expression."""
+    return dict(
+        db.execute(
+            text(
+                """
+                SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+                FROM pg_inherits
+                JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+                WHERE pg_inherits.inhparent = 'meal_plan_item'::regclass
+                """
+            )
+        ).all()
+    )
+
+
+def month_partitions(partitions: Dict[str, str]) -> Dict[str, datetime]:
+    months = {}
+    for name in partitions:
+        match = MONTH_PARTITION_RE.match(name)
+        if match:
+            months[name] = datetime(int(match["year"]), int(match["month"]), 1)
+    return months
+
+
+def archive_bound(partitions: Dict[str, str]) -> Optional[datetime]:
+    """Date the archive partition ends at, None if there's no archive yet."""
+    if ARCHIVE_PARTITION not in partitions:
+        return None
+    match = UPPER_BOUND_RE.search(partitions[ARCHIVE_PARTITION])
+    return datetime.fromisoformat(match["bound"])
+
+
+def move_rows(
+    db: Session,
+    source: str,
+    target: str,
+    start_date: Optional[datetime],
+    end_date: datetime,
+) -> None:
+    """Move rows of a window between partitions, or detached ones.
+
+    Statements on partitions don't fire the statement level triggers of
+    meal_plan_item, which is what a move wants: the meal plan is unchanged.
+    """
+    db.execute(
+        text(
+            f"""
+            WITH moved AS (
+                DELETE FROM {source}
+                WHERE (CAST(:start_date AS timestamp) IS NULL OR date >= :start_date)
+                AND date < :end_date
+                RETURNING {COLUMNS}
+            )
+            INSERT INTO {target} ({COLUMNS}) SELECT {COLUMNS} FROM moved
+            """
+        ),
+        {"start_date": start_date, "end_date": end_date},
+    )
+
+
+def create_month_partition(db: Session, month: datetime) -> str:
+    """Create the partition of month, taking over its rows from the default.
+
+    Rows of the month must leave the default partition before the new one
+    can be attached, so it's filled while still detached.
+    """
+    name = partition_name(month)
+    end = month + relativedelta(months=1)
+    db.execute(
+        text(
+            f"CREATE TABLE {name} "
+            "(LIKE meal_plan_item INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+        )
+    )
+    move_rows(db, DEFAULT_PARTITION, name, month, end)
+    db.execute(
+        text(
+            f"ALTER TABLE meal_plan_item ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{end.isoformat()}')"
+        )
+    )
+    return name
+
+
+def ensure_meal_plan_partitions(
+    db: Session, now: datetime, months_ahead: int, archive_months: int
+) -> List[str]:
+    """Create monthly partitions from the archive horizon to months_ahead.
+
+    Returns the names of the created partitions. Dates further ahead stay in
+    the default partition until their month comes into range.
+    """
+    partitions = list_partitions(db)
+    current = month_start(now)
+    month = current - relativedelta(months=archive_months)
+    bound = archive_bound(partitions)
+    if bound is not None:
+        month = max(month, bound)
+
+    created = []
+    while month <= current + relativedelta(months=months_ahead):
+        if partition_name(month) not in partitions:
+            created.append(create_month_partition(db, month))
+        month += relativedelta(months=1)
+
+    return created
+
+
+def archive_meal_plan_items(
+    db: Session,
+    now: datetime,
+    archive_months: int,
+    tablespace: Optional[str] = None,
+) -> List[str]:
+    """Merge months older than archive_months into the archive partition.
+
+    The archive covers every date before the horizon, so queries for recent
+    windows prune it along with the other months they don't cover. It's
+    detached while old months are merged into it, then attached again with
+    a CHECK constraint matching its new bound so attaching doesn't scan it.
+    A new archive is created in tablespace, e.g. one on cheaper storage.
+    Returns the names of the merged monthly partitions.
+    """
+    until = month_start(now) - relativedelta(months=archive_months)
+    partitions = list_partitions(db)
+    bound = archive_bound(partitions)
+    if bound is not None and until <= bound:
+        return []
+
+    if bound is not None:
+        db.execute(
+            text(f"ALTER TABLE meal_plan_item DETACH PARTITION {ARCHIVE_PARTITION}")
+        )
+    else:
+        db.execute(
+            text(
+                f"CREATE TABLE {ARCHIVE_PARTITION} "
+                "(LIKE meal_plan_item INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                + (f" TABLESPACE {tablespace}" if tablespace else "")
+            )
+        )
+
+    archived = sorted(
+        name for name, month in month_partitions(partitions).items() if month < until
+    )
+    for name in archived:
+        db.execute(
+            text(
+                f"INSERT INTO {ARCHIVE_PARTITION} ({COLUMNS}) "
+                f"SELECT {COLUMNS} FROM {name}"
+            )
+        )
+        db.execute(text(f"DROP TABLE {name}"))
+    move_rows(db, DEFAULT_PARTITION, ARCHIVE_PARTITION, None, until)
+
+    db.execute(
+        text(
+            f"ALTER TABLE {ARCHIVE_PARTITION} ADD CONSTRAINT "
+            f"{ARCHIVE_PARTITION}_bound CHECK (date IS NOT NULL "
+            f"AND date < '{until.isoformat()}')"
+        )
+    )
+    db.execute(
+        text(
+            f"ALTER TABLE meal_plan_item ATTACH PARTITION {ARCHIVE_PARTITION} "
+            f"FOR VALUES FROM (MINVALUE) TO ('{until.isoformat()}')"
+        )
+    )
+    db.execute(
+        text(
+            f"ALTER TABLE {ARCHIVE_PARTITION} DROP CONSTRAINT {ARCHIVE_PARTITION}_bound"
+        )
+    )
+
+    return archived
+
+
+def maintain_meal_plan_partitions(
+    db: Session,
+    now: datetime,
+    months_ahead: int,
+    archive_months: int,
+    tablespace: Optional[str] = None,
+) -> MealPlanPartitionReport:
+    archived = archive_meal_plan_items(db, now, archive_months, tablespace)
+    created = ensure_meal_plan_partitions(db, now, months_ahead, archive_months)
+    return MealPlanPartitionReport(archived=archived, created=created)
+
+
+def run_meal_plan_partition_maintenance(
+    months_ahead: int,
+    archive_months: int,
+    tablespace: Optional[str] = None,
+) -> Optional[MealPlanPartitionReport]:
+    """Run maintain_meal_plan_partitions unless another process already is.
+
+    Returns None when the lock is held elsewhere. Detaching and dropping
+    partitions lock meal_plan_item exclusively, so everything is done in one
+    short transaction.
+    """
+    with engine.connect() as connection:
+        locked = connection.execute(
+            select(func.pg_try_advisory_lock(MEAL_PLAN_PARTITION_LOCK_ID))
+        ).scalar()
+        connection.commit()
+        if not locked:
+            logger.info("Meal plan partition maintenance already running elsewhere")
+            return None
+
+        try:
+            with Session(bind=connection) as db:
+                report = maintain_meal_plan_partitions(
+                    db, datetime.utcnow(), months_ahead, archive_months, tablespace
+                )
+                db.commit()
+                return report
+        finally:
+            connection.rollback()
+            connection.execute(
+                select(func.pg_advisory_unlock(MEAL_PLAN_PARTITION_LOCK_ID))
+            )
+            connection.commit()
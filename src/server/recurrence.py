@@ -0,0 +1,154 @@
+from datetime import datetime, timezone
+from typing import Any, Iterable, List
+
+from dateutil.relativedelta import relativedelta
+from dateutil.rrule import DAILY, MONTHLY, WEEKLY, YEARLY, rrule, rruleset, rrulestr
+from sqlalchemy import or_, select
+from sqlalchemy.orm import Session, selectinload
+
+from server.storage.models import MealPlanItem, MealPlanRule, User
+from server.storage.utils import safe_query
+
+# Expanding a COUNT rule has to start at its first occurrence to know how
+# many are left, so its length is bounded instead
+MAX_RULE_COUNT = 1000
+
+PERIODS = {YEARLY: "years", MONTHLY: "months", WEEKLY: "weeks", DAILY: "days"}
+# Attempts at finding an earlier period starting on the same day of the
+# month, e.g. for rules starting on the 31st
+MAX_ALIGN_ATTEMPTS = 8
+
+
+def _naive_utc(date: datetime) -> datetime:
+    # Dates are stored without a time zone, in UTC
+    if date.tzinfo is None:
+        return date
+    return date.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def parse_rrule(rule: str, start_date: datetime) -> rrule:
+    """Parse an RRULE starting at start_date, raises ValueError if invalid.
+
+    Meal plan rules recur at most daily and have at most one occurrence a
+    day, so expanding any window costs no more than its number of days.
+    """
+    parsed = rrulestr(rule, dtstart=_naive_utc(start_date), ignoretz=True)
+    if isinstance(parsed, rruleset):
+        raise ValueError("only a single RRULE is supported")
+    if parsed._freq not in PERIODS:
+        raise ValueError("rules can't recur more often than daily")
+    if len(parsed._byhour) * len(parsed._byminute) * len(parsed._bysecond) > 1:
+        raise ValueError("rules can't have more than one occurrence a day")
+    if parsed._count is not None and parsed._count > MAX_RULE_COUNT:
+        raise ValueError(f"COUNT can't be more than {MAX_RULE_COUNT}")
+    return parsed
+
+
+def advance_rrule(parsed: rrule, start_date: datetime) -> rrule:
+    """The rule moved forward by whole periods to start just before start_date.
+
+    Occurrences from start_date on are unchanged, while expanding no longer
+    walks every period since the rule's start. Rules ending with COUNT
+    can't be moved as the occurrences before the window count towards it.
+    """
+    dtstart = parsed._dtstart
+    if parsed._count is not None or start_date <= dtstart:
+        return parsed
+
+    unit = PERIODS[parsed._freq]
+    if unit == "days":
+        periods = (start_date - dtstart).days
+    elif unit == "weeks":
+        periods = (start_date - dtstart).days // 7
+    else:
+        delta = relativedelta(start_date, dtstart)
+        periods = delta.years if unit == "years" else delta.years * 12 + delta.months
+    periods -= periods % parsed._interval
+
+    for _ in range(MAX_ALIGN_ATTEMPTS):
+        if periods <= 0:
+            break
+        moved = dtstart + relativedelta(**{unit: periods})
+        # Days of the month past the 28th are clamped in shorter months, the
+        # rule's days are derived from its start when it doesn't set them
+        if moved <= start_date and (
+            unit in ("days", "weeks") or moved.day == dtstart.day
+        ):
+            return parsed.replace(dtstart=moved)
+        periods -= parsed._interval
+
+    return parsed
+
+
+def rule_occurrences(
+    meal_plan_rule: MealPlanRule, start_date: datetime, end_date: datetime
+) -> List[datetime]:
+    """Dates of the rule's occurrences in a window, except its exceptions.
+
+    Expansion starts at the period just before the window, so a rule that
+    started long ago costs about as much as the occurrences actually read.
+    """
+    start_date, end_date = _naive_utc(start_date), _naive_utc(end_date)
+    if meal_plan_rule.end_date is not None:
+        end_date = min(end_date, meal_plan_rule.end_date)
+    if end_date < start_date:
+        return []
+
+    skipped = {exception.date for exception in meal_plan_rule.exceptions}
+    parsed = parse_rrule(meal_plan_rule.rrule, meal_plan_rule.start_date)
+    return [
+        date
+        for date in advance_rrule(parsed, start_date).between(
+            start_date, end_date, inc=True
+        )
+        if date not in skipped
+    ]
+
+
+def rule_meal_plan_items(
+    meal_plan_rule: MealPlanRule, start_date: datetime, end_date: datetime
+) -> List[MealPlanItem]:
+    """Meal plan items for the rule's occurrences in a window.
+
+    They're transient, without an ID, and must not be added to the session.
+    """
+    return [
+        MealPlanItem(
+            recipe=meal_plan_rule.recipe,
+            recipe_id=meal_plan_rule.recipe_id,
+            date=date,
+            servings=meal_plan_rule.servings,
+            meal_type=meal_plan_rule.meal_type,
+            user_id=meal_plan_rule.user_id,
+            meal_plan_rule_id=meal_plan_rule.id,
+        )
+        for date in rule_occurrences(meal_plan_rule, start_date, end_date)
+    ]
+
+
+def expand_meal_plan_rules(
+    db: Session,
+    user: User,
+    start_date: datetime,
+    end_date: datetime,
+    options: Iterable[Any] = (),
+) -> List[MealPlanItem]:
+    """Meal plan items for every occurrence of the user's rules in a window.
+
+    Only rules overlapping the window are read, options are applied to
+    their query, e.g. to load the recipes the caller needs.
+    """
+    meal_plan_rules = db.scalars(
+        safe_query(select, [MealPlanRule], user)
+        .filter(
+            MealPlanRule.start_date <= end_date,
+            or_(MealPlanRule.end_date.is_(None), MealPlanRule.end_date >= start_date),
+        )
+        .options(selectinload(MealPlanRule.exceptions), *options)
+    ).all()
+
+    return [
+        meal_plan_item
+        for meal_plan_rule in meal_plan_rules
+        for meal_plan_item in rule_meal_plan_items(meal_plan_rule, start_date, end_date)
+    ]
@@ -0,0 +1,24 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+
+from server.dependencies import get_current_user
+from server.events import ChangeListenerUnavailable, change_listener
+from server.storage.models import User
+
+router = APIRouter(prefix="/api/events", tags=["events"])
+
+
+@router.get("", response_class=StreamingResponse)
+async def stream_events(user: User = Depends(get_current_user)):
+    # Fail now rather than once the stream has started
+    try:
+        await change_listener.ensure_started()
+    except ChangeListenerUnavailable:
+        raise HTTPException(503, "Change notifications are unavailable")
+
+    return StreamingResponse(
+        change_listener.stream(user.id),
+        media_type="text/event-stream",
+        # Proxies must pass events through as they're written
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
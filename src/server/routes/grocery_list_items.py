@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy import select
+from collections import defaultdict
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import Boolean, Integer, column, select, update, values
 from sqlalchemy.orm import Session
 
 from server.dependencies import get_current_user, get_db
-from server.storage.models import GroceryListItem, User
+from server.events import notify_change
+from server.schemas import GroceryListItemToggleSchema
+from server.storage.models import GroceryList, GroceryListItem, User
 from server.storage.utils import safe_query
 
 router = APIRouter(prefix="/api/grocery_list_items", tags=["grocery_list_items"])
@@ -21,3 +26,51 @@ def toggle_grocery_list_item(
 
     db.add(grocery_list_item)
     db.flush()
+    notify_change(
+        db,
+        grocery_list_item.grocery_list.user_id,
+        "grocery_list_items.updated",
+        [{"id": grocery_list_item.id, "active": grocery_list_item.active}],
+    )
+
+
+@router.patch("", response_model=List[GroceryListItemToggleSchema])
+def toggle_grocery_list_items(
+    request_data: List[GroceryListItemToggleSchema],  # type: ignore
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    # Later changes to the same item win
+    changes = {change.id: change.active for change in request_data}
+    if not changes:
+        return []
+
+    changes_table = values(
+        column("id", Integer), column("active", Boolean), name="changes"
+    ).data(list(changes.items()))
+    # A core UPDATE, the ORM can't return columns of the joined grocery_list
+    items = GroceryListItem.__table__
+    query = (
+        update(items)
+        .where(
+            items.c.id == changes_table.c.id,
+            items.c.grocery_list_id == GroceryList.id,
+        )
+        .values(active=changes_table.c.active)
+        .returning(items.c.id, items.c.active, GroceryList.user_id)
+    )
+    if user.role == "user":
+        query = query.where(GroceryList.user_id == user.id)
+
+    updated = db.execute(query).all()
+    if len(updated) != len(changes):
+        missing = sorted(set(changes) - {item_id for item_id, _, _ in updated})
+        raise HTTPException(404, f"Grocery List Items with IDs {missing} do not exist")
+
+    states_by_user = defaultdict(list)
+    for item_id, active, owner_id in updated:
+        states_by_user[owner_id].append({"id": item_id, "active": active})
+    for owner_id, states in states_by_user.items():
+        notify_change(db, owner_id, "grocery_list_items.updated", states)
+
+    return [state for states in states_by_user.values() for state in states]
@@ -1,14 +1,29 @@
+from datetime import datetime
+from typing import List
+
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from server.dependencies import get_current_user, get_db
+from server.events import notify_change
+from server.grocery import (
+    consolidate_grocery_items,
+    extra_grocery_item,
+    grocery_list_preview,
+    meal_plan_grocery_items,
+    notify_grocery_list_changed,
+    update_extra_items,
+)
+from server.recurrence import expand_meal_plan_rules
 from server.schemas import (
     GroceryListCreateSchema,
+    GroceryListLineSchema,
+    GroceryListPreviewLineSchema,
     GroceryListSchema,
     GroceryListUpdateSchema,
 )
-from server.storage.models import GroceryList, GroceryListItem, MealPlanItem, User
+from server.storage.models import GroceryList, MealPlanItem, User
 from server.storage.utils import safe_query
 
 router = APIRouter(prefix="/api/grocery_lists", tags=["grocery_lists"])
@@ -31,51 +46,44 @@ def create_grocery_list(
 
     request_data = request_data.dict(exclude_unset=True)
 
-    start_date = request_data.pop("start_date")
-    end_date = request_data.pop("end_date")
-
     query = safe_query(select, [MealPlanItem], user).filter(
-        MealPlanItem.date >= start_date, MealPlanItem.date <= end_date
+        MealPlanItem.date >= request_data["start_date"],
+        MealPlanItem.date <= request_data["end_date"],
     )
     meal_plan_items = db.scalars(query).all()
+    meal_plan_items += expand_meal_plan_rules(
+        db, user, request_data["start_date"], request_data["end_date"]
+    )
 
     grocery_list = GroceryList(user_id=user.id, **request_data)
 
     for meal_plan_item in meal_plan_items:
-        for ingredient in meal_plan_item.recipe.ingredients:
-            grocery_list.grocery_list_items.append(
-                GroceryListItem(
-                    active=True,
-                    quantity=ingredient.quantity,
-                    unit=ingredient.unit,
-                    name=ingredient.name,
-                    comment=ingredient.comment,
-                    recipe_name=meal_plan_item.recipe.name,
-                    servings=meal_plan_item.recipe.servings,
-                    extra_items=False,
-                )
-            )
+        grocery_list.grocery_list_items.extend(meal_plan_grocery_items(meal_plan_item))
 
     if grocery_list.extra_items is not None:
         extra_items = grocery_list.extra_items.split("\n")
         for extra_item in extra_items:
-            grocery_list.grocery_list_items.append(
-                GroceryListItem(
-                    active=True,
-                    quantity=0,
-                    name=extra_item,
-                    recipe_name="Extra Items",
-                    servings=1,
-                    extra_items=True,
-                )
-            )
+            grocery_list.grocery_list_items.append(extra_grocery_item(extra_item))
 
     db.add(grocery_list)
     db.flush()
+    notify_change(
+        db, grocery_list.user_id, "grocery_list.created", {"id": grocery_list.id}
+    )
 
     return grocery_list
 
 
+@router.get("/preview", response_model=List[GroceryListPreviewLineSchema])
+def preview_grocery_list(
+    start_date: datetime,
+    end_date: datetime,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    return grocery_list_preview(db, user, start_date, end_date)
+
+
 @router.get("/{id}", response_model=GroceryListSchema)
 def get_grocery_list(
     id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
@@ -90,6 +98,20 @@ def get_grocery_list(
     return grocery_list
 
 
+@router.get("/{id}/consolidated", response_model=List[GroceryListLineSchema])
+def get_consolidated_grocery_list(
+    id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    grocery_list = db.scalars(
+        safe_query(select, [GroceryList], user).filter_by(id=id)
+    ).one_or_none()
+
+    if grocery_list is None:
+        raise HTTPException(404, f"Grocery List with ID {id} does not exist")
+
+    return consolidate_grocery_items(grocery_list.grocery_list_items)
+
+
 @router.put("/{id}", response_model=GroceryListSchema)
 def update_grocery_list(
     id: int,
@@ -103,29 +125,12 @@ def update_grocery_list(
         safe_query(select, [GroceryList], user).filter_by(id=id)
     ).one()
 
-    grocery_list.grocery_list_items[:] = [
-        item for item in grocery_list.grocery_list_items if not item.extra_items
-    ]
-
     extra_items = request_data.pop("extra_items", grocery_list.extra_items)
-    grocery_list.extra_items = extra_items
-
-    if extra_items != "":
-        extra_items_list = extra_items.split("\n")
-        for extra_item in extra_items_list:
-            grocery_list.grocery_list_items.append(
-                GroceryListItem(
-                    active=True,
-                    quantity=0,
-                    name=extra_item,
-                    recipe_name="Extra Items",
-                    servings=1,
-                    extra_items=True,
-                )
-            )
+    added, removed_ids = update_extra_items(grocery_list, extra_items)
 
     db.add(grocery_list)
     db.flush()
+    notify_grocery_list_changed(db, grocery_list, added=added, removed_ids=removed_ids)
 
     return grocery_list
 
@@ -143,5 +148,8 @@ def delete_grocery_list(
 
     db.delete(grocery_list)
     db.flush()
+    notify_change(
+        db, grocery_list.user_id, "grocery_list.deleted", {"id": grocery_list.id}
+    )
 
     return grocery_list
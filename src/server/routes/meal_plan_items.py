@@ -1,25 +1,63 @@
+import hashlib
+from collections import defaultdict
 from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
-from fastapi_pagination import Page
-from fastapi_pagination.ext.sqlalchemy import paginate
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from fastapi_pagination import Page, paginate
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session, contains_eager, joinedload
 
 from server.dependencies import get_current_user, get_db
+from server.events import notify_change
+from server.grocery import delete_meal_plan_grocery_items, sync_grocery_lists
+from server.recurrence import expand_meal_plan_rules
 from server.schemas import (
+    MealPlanCalendarSchema,
+    MealPlanEntrySchema,
+    MealPlanItemCopySchema,
     MealPlanItemCreateSchema,
     MealPlanItemSchema,
     MealPlanItemUpdateSchema,
     MealPlanItemListSchema,
+    RecipeSummarySchema,
 )
-from server.storage.models import MealPlanItem, Recipe, User
+from server.storage.models import MealPlanItem, MealPlanRule, Recipe, User
 from server.storage.utils import safe_query
 
 router = APIRouter(prefix="/api/meal_plan_items", tags=["meal_plan_items"])
 
 
-@router.get("", response_model=Page[MealPlanItemSchema])
+def notify_meal_plan_item_changed(
+    db: Session, meal_plan_item: MealPlanItem, event_type: str
+):
+    notify_change(
+        db,
+        meal_plan_item.recipe.user_id,
+        event_type,
+        MealPlanItemSchema.model_validate(meal_plan_item).model_dump(mode="json"),
+    )
+
+
+def notify_meal_plan_items_changed(
+    db: Session, meal_plan_items: List[MealPlanItem], event_type: str, data
+):
+    """Push one event per owner for a batch of meal plan items.
+
+    data turns an item into the event's entry for it.
+    """
+    entries_by_user = defaultdict(list)
+    for meal_plan_item in meal_plan_items:
+        entries_by_user[meal_plan_item.user_id].append(data(meal_plan_item))
+    for owner_id, entries in entries_by_user.items():
+        notify_change(db, owner_id, event_type, entries)
+
+
+def meal_plan_item_data(meal_plan_item: MealPlanItem):
+    return MealPlanItemSchema.model_validate(meal_plan_item).model_dump(mode="json")
+
+
+@router.get("", response_model=Page[MealPlanEntrySchema])
 def list_meal_plan_items(
     start_date: datetime,
     end_date: datetime,
@@ -27,17 +65,100 @@ def list_meal_plan_items(
     user: User = Depends(get_current_user),
     params: MealPlanItemListSchema = Depends(),  # type: ignore
 ):
+    """Meal plan items of a window, including occurrences of rules.
+
+    Occurrences are expanded for the window only and have no ID, the page
+    is cut from the window's items sorted by date.
+    """
     query = (
         safe_query(select, [MealPlanItem], user)
         .filter(MealPlanItem.date >= start_date, MealPlanItem.date <= end_date)
         .order_by(MealPlanItem.date)
     )
 
-    for param_key, param_val in params.dict(exclude_unset=True).items():
-        if param_val is not None:
-            query = query.filter(getattr(MealPlanItem, param_key) == param_val)
+    filters = {
+        param_key: param_val
+        for param_key, param_val in params.dict(exclude_unset=True).items()
+        if param_val is not None
+    }
+    for param_key, param_val in filters.items():
+        query = query.filter(getattr(MealPlanItem, param_key) == param_val)
 
-    return paginate(db, query)
+    occurrences = [
+        meal_plan_item
+        for meal_plan_item in expand_meal_plan_rules(db, user, start_date, end_date)
+        if all(
+            getattr(meal_plan_item, param_key) == param_val
+            for param_key, param_val in filters.items()
+        )
+    ]
+
+    return paginate(
+        sorted(
+            [*db.scalars(query).all(), *occurrences],
+            key=lambda meal_plan_item: meal_plan_item.date,
+        )
+    )
+
+
+@router.get("/calendar", response_model=MealPlanCalendarSchema)
+def get_meal_plan_calendar(
+    start_date: datetime,
+    end_date: datetime,
+    if_none_match: Optional[str] = Header(None),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Meal plan items of a window by day, with summaries of their recipes.
+
+    Unlike listing meal plan items this isn't paginated and reads items and
+    recipes with one join, rules overlapping the window with a couple more.
+    The response's ETag is a hash of its content, so clients revalidating
+    an unchanged window get an empty 304.
+    """
+    meal_plan_items = db.scalars(
+        safe_query(select, [MealPlanItem], user)
+        .join(MealPlanItem.recipe)
+        .options(
+            contains_eager(MealPlanItem.recipe).load_only(
+                *[getattr(Recipe, field) for field in RecipeSummarySchema.model_fields]
+            )
+        )
+        .filter(MealPlanItem.date >= start_date, MealPlanItem.date <= end_date)
+        .order_by(MealPlanItem.date, MealPlanItem.id)
+    ).all()
+    meal_plan_items += expand_meal_plan_rules(
+        db,
+        user,
+        start_date,
+        end_date,
+        options=[
+            joinedload(MealPlanRule.recipe).load_only(
+                *[getattr(Recipe, field) for field in RecipeSummarySchema.model_fields]
+            )
+        ],
+    )
+
+    days = defaultdict(list)
+    recipes = {}
+    for meal_plan_item in sorted(
+        meal_plan_items, key=lambda meal_plan_item: meal_plan_item.date
+    ):
+        days[meal_plan_item.date.date()].append(meal_plan_item)
+        recipes[meal_plan_item.recipe_id] = meal_plan_item.recipe
+
+    content = MealPlanCalendarSchema.model_validate(
+        {"days": days, "recipes": list(recipes.values())}
+    ).model_dump_json()
+    etag = f'"{hashlib.blake2b(content.encode(), digest_size=16).hexdigest()}"'
+
+    if if_none_match is not None and (
+        if_none_match.strip() == "*"
+        or etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    ):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return Response(content, media_type="application/json", headers={"ETag": etag})
 
 
 @router.post("", response_model=MealPlanItemSchema)
@@ -56,10 +177,87 @@ def create_meal_plan_item(
 
     db.add(meal_plan_item)
     db.flush()
+    sync_grocery_lists(db, user, [meal_plan_item])
+    notify_meal_plan_item_changed(db, meal_plan_item, "meal_plan_item.created")
 
     return meal_plan_item
 
 
+@router.post("/bulk", response_model=List[MealPlanItemSchema])
+def create_meal_plan_items(
+    request_data: List[MealPlanItemCreateSchema],  # type: ignore
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    request_data = [item.dict(exclude_unset=True) for item in request_data]
+    if not request_data:
+        return []
+
+    recipe_ids = {item["recipe_id"] for item in request_data}
+    recipes = {
+        recipe.id: recipe
+        for recipe in db.scalars(
+            safe_query(select, [Recipe], user).filter(Recipe.id.in_(recipe_ids))
+        )
+    }
+    if len(recipes) != len(recipe_ids):
+        missing = sorted(recipe_ids - set(recipes))
+        raise HTTPException(404, f"Recipes with IDs {missing} do not exist")
+
+    meal_plan_items = [
+        MealPlanItem(recipe=recipes[item["recipe_id"]], **item) for item in request_data
+    ]
+
+    # Flushed as a single multi-row INSERT
+    db.add_all(meal_plan_items)
+    db.flush()
+    sync_grocery_lists(db, user, meal_plan_items)
+    notify_meal_plan_items_changed(
+        db, meal_plan_items, "meal_plan_items.created", meal_plan_item_data
+    )
+
+    return meal_plan_items
+
+
+@router.post("/copy", response_model=List[MealPlanItemSchema])
+def copy_meal_plan_items(
+    request_data: MealPlanItemCopySchema,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Copy the meal plan items of a window to start at target_date.
+
+    Items are copied within the database by an INSERT ... SELECT.
+    """
+    shift = request_data.target_date - request_data.start_date
+    source = safe_query(
+        select,
+        [
+            MealPlanItem.recipe_id,
+            MealPlanItem.date + shift,
+            MealPlanItem.servings,
+            MealPlanItem.meal_type,
+        ],
+        user,
+    ).filter(
+        MealPlanItem.date >= request_data.start_date,
+        MealPlanItem.date <= request_data.end_date,
+    )
+
+    meal_plan_items = db.scalars(
+        insert(MealPlanItem)
+        .from_select(["recipe_id", "date", "servings", "meal_type"], source)
+        .returning(MealPlanItem),
+    ).all()
+
+    sync_grocery_lists(db, user, meal_plan_items)
+    notify_meal_plan_items_changed(
+        db, meal_plan_items, "meal_plan_items.created", meal_plan_item_data
+    )
+
+    return sorted(meal_plan_items, key=lambda item: (item.date, item.id))
+
+
 @router.get("/{id}", response_model=MealPlanItemSchema)
 def get_meal_plan_item(
     id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
@@ -85,6 +283,10 @@ def update_meal_plan_item(
 
     db.add(meal_plan_item)
     db.flush()
+    if "recipe_id" in request_data:
+        db.expire(meal_plan_item, ["recipe"])
+    sync_grocery_lists(db, user, [meal_plan_item])
+    notify_meal_plan_item_changed(db, meal_plan_item, "meal_plan_item.updated")
 
     return meal_plan_item
 
@@ -97,7 +299,56 @@ def delete_meal_plan_item(
         safe_query(select, [MealPlanItem], user).filter_by(id=id)
     ).one()
 
+    sync_grocery_lists(db, user, [meal_plan_item], deleted=True)
     db.delete(meal_plan_item)
     db.flush()
+    notify_change(
+        db,
+        meal_plan_item.recipe.user_id,
+        "meal_plan_item.deleted",
+        {"id": meal_plan_item.id},
+    )
 
     return meal_plan_item
+
+
+@router.delete("", response_model=List[MealPlanItemSchema])
+def delete_meal_plan_items(
+    start_date: datetime,
+    end_date: datetime,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Delete the meal plan items of a date window.
+
+    Both deletes filter on the window, so only its partitions are read, and
+    the deleted items come back with RETURNING instead of being loaded first.
+    """
+    window = (MealPlanItem.date >= start_date, MealPlanItem.date <= end_date)
+    delete_meal_plan_grocery_items(
+        db,
+        safe_query(select, [MealPlanItem], user)
+        .filter(*window)
+        .with_only_columns(MealPlanItem.id),
+    )
+    meal_plan_items = sorted(
+        db.scalars(
+            safe_query(delete, [MealPlanItem], user)
+            .filter(*window)
+            .returning(MealPlanItem)
+        ).all(),
+        key=lambda meal_plan_item: (meal_plan_item.date, meal_plan_item.id),
+    )
+    resp = [
+        MealPlanItemSchema.model_validate(meal_plan_item)
+        for meal_plan_item in meal_plan_items
+    ]
+
+    notify_meal_plan_items_changed(
+        db,
+        meal_plan_items,
+        "meal_plan_items.deleted",
+        lambda meal_plan_item: meal_plan_item.id,
+    )
+
+    return resp
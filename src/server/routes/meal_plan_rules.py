@@ -0,0 +1,228 @@
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi_pagination import Page
+from fastapi_pagination.ext.sqlalchemy import paginate
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from server.dependencies import get_current_user, get_db
+from server.events import notify_change
+from server.grocery import sync_grocery_lists, sync_grocery_lists_with_rule
+from server.recurrence import parse_rrule, rule_occurrences
+from server.schemas import (
+    MealPlanItemSchema,
+    MealPlanItemUpdateSchema,
+    MealPlanRuleCreateSchema,
+    MealPlanRuleSchema,
+    MealPlanRuleUpdateSchema,
+)
+from server.storage.models import (
+    MealPlanItem,
+    MealPlanRule,
+    MealPlanRuleException,
+    Recipe,
+    User,
+)
+from server.storage.utils import safe_query
+
+router = APIRouter(prefix="/api/meal_plan_rules", tags=["meal_plan_rules"])
+
+
+def get_recipe(db: Session, user: User, recipe_id: int) -> Recipe:
+    recipe = db.scalars(
+        safe_query(select, [Recipe], user).filter_by(id=recipe_id)
+    ).one_or_none()
+
+    if recipe is None:
+        raise HTTPException(404, f"Recipe with ID {recipe_id} does not exist")
+
+    return recipe
+
+
+def get_meal_plan_rule(db: Session, user: User, id: int) -> MealPlanRule:
+    meal_plan_rule = db.scalars(
+        safe_query(select, [MealPlanRule], user).filter_by(id=id)
+    ).one_or_none()
+
+    if meal_plan_rule is None:
+        raise HTTPException(404, f"Meal Plan Rule with ID {id} does not exist")
+
+    return meal_plan_rule
+
+
+def get_occurrence(meal_plan_rule: MealPlanRule, date: datetime) -> datetime:
+    occurrences = rule_occurrences(meal_plan_rule, date, date)
+    if not occurrences:
+        raise HTTPException(
+            404,
+            f"Meal Plan Rule with ID {meal_plan_rule.id} has no occurrence on {date}",
+        )
+
+    return occurrences[0]
+
+
+def validate_rrule(meal_plan_rule: MealPlanRule):
+    try:
+        parse_rrule(meal_plan_rule.rrule, meal_plan_rule.start_date)
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid recurrence rule: {e}")
+
+
+def notify_meal_plan_rule_changed(
+    db: Session, meal_plan_rule: MealPlanRule, event_type: str
+):
+    notify_change(
+        db,
+        meal_plan_rule.user_id,
+        event_type,
+        MealPlanRuleSchema.model_validate(meal_plan_rule).model_dump(mode="json"),
+    )
+
+
+@router.get("", response_model=Page[MealPlanRuleSchema])
+def list_meal_plan_rules(
+    db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    query = safe_query(select, [MealPlanRule], user).order_by(MealPlanRule.id)
+
+    return paginate(db, query)
+
+
+@router.post("", response_model=MealPlanRuleSchema)
+def create_meal_plan_rule(
+    request_data: MealPlanRuleCreateSchema,  # type: ignore
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    request_data = request_data.dict(exclude_unset=True)
+
+    recipe = get_recipe(db, user, request_data["recipe_id"])
+
+    meal_plan_rule = MealPlanRule(recipe=recipe, user_id=recipe.user_id, **request_data)
+    validate_rrule(meal_plan_rule)
+
+    db.add(meal_plan_rule)
+    db.flush()
+    sync_grocery_lists_with_rule(db, user, meal_plan_rule)
+    notify_meal_plan_rule_changed(db, meal_plan_rule, "meal_plan_rule.created")
+
+    return meal_plan_rule
+
+
+@router.get("/{id}", response_model=MealPlanRuleSchema)
+def get_meal_plan_rule_by_id(
+    id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    return get_meal_plan_rule(db, user, id)
+
+
+@router.put("/{id}", response_model=MealPlanRuleSchema)
+def update_meal_plan_rule(
+    id: int,
+    request_data: MealPlanRuleUpdateSchema,  # type: ignore
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    request_data = request_data.dict(exclude_unset=True)
+
+    meal_plan_rule = get_meal_plan_rule(db, user, id)
+
+    if "recipe_id" in request_data:
+        recipe = get_recipe(db, user, request_data.pop("recipe_id"))
+        meal_plan_rule.recipe = recipe
+        meal_plan_rule.user_id = recipe.user_id
+
+    for key, val in request_data.items():
+        setattr(meal_plan_rule, key, val)
+    validate_rrule(meal_plan_rule)
+
+    db.add(meal_plan_rule)
+    db.flush()
+    sync_grocery_lists_with_rule(db, user, meal_plan_rule)
+    notify_meal_plan_rule_changed(db, meal_plan_rule, "meal_plan_rule.updated")
+
+    return meal_plan_rule
+
+
+@router.delete("/{id}", response_model=MealPlanRuleSchema)
+def delete_meal_plan_rule(
+    id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    meal_plan_rule = get_meal_plan_rule(db, user, id)
+    resp = MealPlanRuleSchema.model_validate(meal_plan_rule)
+
+    sync_grocery_lists_with_rule(db, user, meal_plan_rule, deleted=True)
+    db.delete(meal_plan_rule)
+    db.flush()
+    notify_change(
+        db, meal_plan_rule.user_id, "meal_plan_rule.deleted", {"id": meal_plan_rule.id}
+    )
+
+    return resp
+
+
+@router.put("/{id}/occurrences/{date}", response_model=MealPlanItemSchema)
+def override_meal_plan_rule_occurrence(
+    id: int,
+    date: datetime,
+    request_data: MealPlanItemUpdateSchema,  # type: ignore
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    """Replace an occurrence of a rule by a stored meal plan item.
+
+    The item starts out as the occurrence with request_data applied, later
+    changes to the rule no longer affect it.
+    """
+    request_data = request_data.dict(exclude_unset=True)
+
+    meal_plan_rule = get_meal_plan_rule(db, user, id)
+    occurrence = get_occurrence(meal_plan_rule, date)
+
+    recipe = meal_plan_rule.recipe
+    if "recipe_id" in request_data:
+        recipe = get_recipe(db, user, request_data.pop("recipe_id"))
+
+    meal_plan_item = MealPlanItem(
+        recipe=recipe,
+        date=occurrence,
+        servings=meal_plan_rule.servings,
+        meal_type=meal_plan_rule.meal_type,
+        meal_plan_rule_id=meal_plan_rule.id,
+    )
+    for key, val in request_data.items():
+        setattr(meal_plan_item, key, val)
+
+    meal_plan_rule.exceptions.append(MealPlanRuleException(date=occurrence))
+    db.add(meal_plan_item)
+    db.flush()
+    sync_grocery_lists_with_rule(db, user, meal_plan_rule)
+    sync_grocery_lists(db, user, [meal_plan_item])
+    notify_meal_plan_rule_changed(db, meal_plan_rule, "meal_plan_rule.updated")
+    notify_change(
+        db,
+        meal_plan_item.user_id,
+        "meal_plan_item.created",
+        MealPlanItemSchema.model_validate(meal_plan_item).model_dump(mode="json"),
+    )
+
+    return meal_plan_item
+
+
+@router.delete("/{id}/occurrences/{date}", response_model=MealPlanRuleSchema)
+def skip_meal_plan_rule_occurrence(
+    id: int,
+    date: datetime,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    meal_plan_rule = get_meal_plan_rule(db, user, id)
+    occurrence = get_occurrence(meal_plan_rule, date)
+
+    meal_plan_rule.exceptions.append(MealPlanRuleException(date=occurrence))
+    db.flush()
+    sync_grocery_lists_with_rule(db, user, meal_plan_rule)
+    notify_meal_plan_rule_changed(db, meal_plan_rule, "meal_plan_rule.updated")
+
+    return meal_plan_rule
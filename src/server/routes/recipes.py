@@ -1,29 +1,58 @@
 import re
-import os
-import uuid
-import magic
 
 from typing import List
 
-from fastapi import APIRouter, Depends, UploadFile, HTTPException
+from fastapi import APIRouter, Depends, Query, UploadFile, HTTPException
 from fastapi_pagination import Page
 from fastapi_pagination.ext.sqlalchemy import paginate
 from ingredient_parser import parse_ingredient
-from sqlalchemy import select
+from sqlalchemy import Table, insert, literal, select
 from sqlalchemy.orm import Session
 from sqlalchemy.sql.expression import func
 
-from server.dependencies import get_current_user, get_db
+from server.dedup import DUPLICATE_THRESHOLD, duplicate_clusters, index_recipe_minhash
+from server.dependencies import get_blob_storage, get_current_user, get_db
 from server.schemas import (
+    FacetedPage,
     RecipeCreateSchema,
+    RecipeDuplicateClusterSchema,
     RecipeSchema,
     RecipeUpdateSchema,
     RecipeListSchema,
+    RecipeMatchSchema,
+    RecipeNameSchema,
+    RecipeSimilarSchema,
 )
-from server.storage.models import Ingredient, Recipe, Step, Tag, User
-from server.storage.utils import safe_query
-from server.config import CONFIG
-from server.constants import ALLOWED_IMAGE_FORMATS, IMAGE_FORMAT_EXTENSION_MAP
+from server.images import (
+    derivatives_exist,
+    release_image_blob,
+    retain_image_blob,
+    schedule_image_derivatives,
+    set_recipe_image,
+    store_image_upload,
+)
+from server.nutrition import set_recipe_nutrition
+from server.search import (
+    cached_autocomplete,
+    cookable_recipes,
+    filter_by_tags,
+    index_recipe_ingredients,
+    refresh_search_vectors,
+    search_recipes,
+    tag_facets,
+)
+from server.similarity import similar_recipes, similarity_cache
+from server.storage.blobs import Storage
+from server.storage.models import (
+    Ingredient,
+    Recipe,
+    RecipeLSHBucket,
+    RecipeTagAssoc,
+    Step,
+    Tag,
+    User,
+)
+from server.storage.utils import apply_filters, safe_query
 
 router = APIRouter(prefix="/api/recipes", tags=["recipes"])
 
@@ -56,14 +85,44 @@ def parse_ingredients(data: List[str]) -> List[Ingredient]:
     return ingredients
 
 
-@router.get("", response_model=Page[RecipeSchema])
+def copy_recipe_rows(db: Session, table: Table, recipe_id: int, clone_id: int) -> None:
+    columns = [
+        column for column in table.columns if column.name not in ("id", "recipe_id")
+    ]
+    db.execute(
+        insert(table).from_select(
+            ["recipe_id", *[column.name for column in columns]],
+            select(literal(clone_id), *columns).filter(table.c.recipe_id == recipe_id),
+        )
+    )
+
+
+@router.get("", response_model=FacetedPage[RecipeSchema])
 def list_recipes(
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
     params: RecipeListSchema = Depends(),  # type: ignore
     sort: str = "alpha",
+    tags_all: List[int] = Query([]),
+    tags_any: List[int] = Query([]),
+    tags_none: List[int] = Query([]),
+    facets: bool = False,
 ):
     query = safe_query(select, [Recipe], user)
+
+    filters = {
+        param_key: param_val
+        for param_key, param_val in params.dict(exclude_unset=True).items()
+        if param_val is not None
+    }
+    query = apply_filters(query, Recipe, filters)
+    query = filter_by_tags(query, tags_all, tags_any, tags_none)
+
+    tag_counts = None
+    if facets:
+        filtered = bool(filters or tags_all or tags_any or tags_none)
+        tag_counts = tag_facets(db, user, query if filtered else None)
+
     if sort == "alpha":
         query = query.order_by(Recipe.name)
     elif sort == "rand":
@@ -71,11 +130,58 @@ def list_recipes(
     else:
         raise HTTPException(status_code=400, detail=f"Sort type unsupported: {sort}")
 
-    for param_key, param_val in params.dict(exclude_unset=True).items():
-        if param_val is not None:
-            query = query.filter(getattr(Recipe, param_key) == param_val)
+    return paginate(db, query, additional_data={"facets": tag_counts})
 
-    return paginate(db, query)
+
+@router.get("/search", response_model=Page[RecipeSchema])
+def search(
+    q: str, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    query = safe_query(select, [Recipe], user)
+    return paginate(db, search_recipes(query, q))
+
+
+@router.get("/autocomplete", response_model=List[RecipeNameSchema])
+def autocomplete(
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    return cached_autocomplete(db, user, Recipe, q, limit)
+
+
+@router.get("/cookable", response_model=Page[RecipeMatchSchema])
+def list_cookable_recipes(
+    ingredients: List[str] = Query(),
+    min_coverage: float = 0,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    query = cookable_recipes(
+        safe_query(select, [Recipe], user), ingredients, min_coverage
+    )
+    return paginate(
+        db,
+        query,
+        transformer=lambda rows: [
+            {"recipe": recipe, "coverage": coverage, "missing": missing}
+            for recipe, coverage, missing in rows
+        ],
+        unique=False,
+    )
+
+
+@router.get("/duplicates", response_model=List[RecipeDuplicateClusterSchema])
+def list_duplicate_recipes(
+    threshold: float = Query(DUPLICATE_THRESHOLD, gt=0, le=1),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    return [
+        {"recipes": recipes, "similarity": similarity}
+        for recipes, similarity in duplicate_clusters(db, user.id, threshold)
+    ]
 
 
 @router.post("/{id}/upload_image", response_model=RecipeSchema)
@@ -84,31 +190,23 @@ def upload_recipe_image(
     file: UploadFile,
     db: Session = Depends(get_db),
     user: User = Depends(get_current_user),
+    storage: Storage = Depends(get_blob_storage),
 ):
-    file_data = file.file.read()
-    mime_type = magic.from_buffer(file_data, mime=True)
-    if mime_type not in ALLOWED_IMAGE_FORMATS:
-        raise HTTPException(
-            status_code=400, detail=f"Image file format not supported: {mime_type}"
-        )
-    extension = IMAGE_FORMAT_EXTENSION_MAP[mime_type]
-
     recipe = db.scalars(safe_query(select, [Recipe], user).filter_by(id=id)).one()
-    user_id = recipe.user_id
-    dst_folder = os.path.join(CONFIG.static_dir, str(user_id))
-    os.makedirs(dst_folder, exist_ok=True)
 
-    filename = f"{uuid.uuid4()}{extension}"
-    dst_file = os.path.join(dst_folder, filename)
-    with open(dst_file, "wb") as f:
-        f.write(file_data)
+    image_hash, key, stored = store_image_upload(db, storage, file)
+    # A blob that was already stored may still be waiting for its derivatives,
+    # or have failed to get them
+    derivatives = not stored and derivatives_exist(storage, key)
 
-    if recipe.image_url:
-        os.unlink(recipe.image_url)
+    if recipe.image_hash is not None:
+        release_image_blob(db, recipe.image_hash)
 
-    recipe.image_url = f"/static/{user_id}/{filename}"
+    set_recipe_image(recipe, storage.url(key), image_hash, derivatives)
     db.add(recipe)
     db.flush()
+    if not derivatives:
+        schedule_image_derivatives(db, storage, key)
     return recipe
 
 
@@ -139,12 +237,64 @@ def create_recipe(
         tag = db.scalars(safe_query(select, [Tag], user).filter_by(id=tag_id)).one()
         recipe.tags.append(tag)
 
+    index_recipe_ingredients(recipe)
+    set_recipe_nutrition(recipe)
+
     db.add(recipe)
     db.flush()
+    refresh_search_vectors(db, [recipe.id])
+    index_recipe_minhash(db, [recipe.id])
+    similarity_cache.invalidate(db, recipe.user_id, recipe.id)
 
     return recipe
 
 
+@router.post("/{id}/clone", response_model=RecipeSchema)
+def clone_recipe(
+    id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
+):
+    """Copy a recipe with its ingredients, steps, tags and image.
+
+    Rows are copied within the database by INSERT ... SELECT, one statement
+    per table whatever the size of the recipe. Nothing is parsed again, the
+    search vector and MinHash signature are copied along with the content
+    they're derived from.
+    """
+    recipe = db.scalars(
+        safe_query(select, [Recipe], user).filter_by(id=id)
+    ).one_or_none()
+
+    if recipe is None:
+        raise HTTPException(404, f"Recipe with ID {id} does not exist")
+
+    recipe_columns = [
+        column
+        for column in Recipe.__table__.columns
+        if column.name != "id" and column.computed is None
+    ]
+    clone_id = db.scalar(
+        insert(Recipe)
+        .from_select(
+            [column.name for column in recipe_columns],
+            select(*recipe_columns).filter(Recipe.id == id),
+        )
+        .returning(Recipe.id)
+    )
+    for table in [
+        Ingredient.__table__,
+        Step.__table__,
+        RecipeTagAssoc.__table__,
+        RecipeLSHBucket.__table__,
+    ]:
+        copy_recipe_rows(db, table, id, clone_id)
+
+    if recipe.image_hash is not None:
+        retain_image_blob(db, recipe.image_hash)
+    similarity_cache.invalidate(db, recipe.user_id, clone_id)
+
+    return db.get(Recipe, clone_id)
+
+
 @router.get("/{id}", response_model=RecipeSchema)
 def get_recipe(
     id: int, db: Session = Depends(get_db), user: User = Depends(get_current_user)
@@ -152,6 +302,26 @@ def get_recipe(
     return db.scalars(safe_query(select, [Recipe], user).filter_by(id=id)).one()
 
 
+@router.get("/{id}/similar", response_model=List[RecipeSimilarSchema])
+def list_similar_recipes(
+    id: int,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    recipe = db.scalars(
+        safe_query(select, [Recipe], user).filter_by(id=id)
+    ).one_or_none()
+
+    if recipe is None:
+        raise HTTPException(404, f"Recipe with ID {id} does not exist")
+
+    return [
+        {"recipe": similar, "score": score}
+        for similar, score in similar_recipes(db, recipe, limit)
+    ]
+
+
 @router.put("/{id}", response_model=RecipeSchema)
 def update_recipe(
     id: int,
@@ -170,9 +340,13 @@ def update_recipe(
     for key, val in request_data.items():
         setattr(recipe, key, val)
 
+    if "nutrition" in request_data:
+        set_recipe_nutrition(recipe)
+
     if ingredients_data:
         recipe.ingredients.clear()
         recipe.ingredients.extend(parse_ingredients(ingredients_data))
+        index_recipe_ingredients(recipe)
 
     if steps_data:
         recipe.steps.clear()
@@ -187,6 +361,10 @@ def update_recipe(
 
     db.add(recipe)
     db.flush()
+    refresh_search_vectors(db, [recipe.id])
+    if ingredients_data or steps_data:
+        index_recipe_minhash(db, [recipe.id])
+    similarity_cache.invalidate(db, recipe.user_id, recipe.id)
 
     return recipe
 
@@ -198,7 +376,11 @@ def delete_recipe(
     recipe = db.scalars(safe_query(select, [Recipe], user).filter_by(id=id)).one()
     resp = RecipeSchema.model_validate(recipe)
 
+    if recipe.image_hash is not None:
+        release_image_blob(db, recipe.image_hash)
+
     db.delete(recipe)
     db.flush()
+    similarity_cache.invalidate(db, recipe.user_id, recipe.id)
 
     return resp
@@ -1,13 +1,20 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query
 from fastapi_pagination import Page
 from fastapi_pagination.ext.sqlalchemy import paginate
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
 from server.dependencies import get_current_user, get_db
-from server.schemas import TagCreateSchema, TagSchema, TagUpdateSchema, TagListSchema
+from server.schemas import (
+    TagCreateSchema,
+    TagListSchema,
+    TagNameSchema,
+    TagSchema,
+    TagUpdateSchema,
+)
+from server.search import cached_autocomplete
 from server.storage.models import Tag, User, Recipe
 from server.storage.utils import safe_query
 
@@ -29,6 +36,16 @@ def list_tags(
     return paginate(db, query)
 
 
+@router.get("/autocomplete", response_model=List[TagNameSchema])
+def autocomplete(
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user),
+):
+    return cached_autocomplete(db, user, Tag, q, limit)
+
+
 @router.post("", response_model=TagSchema)
 def create_tag(
     request_data: TagCreateSchema,  # type: ignore
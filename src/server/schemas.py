@@ -1,19 +1,25 @@
-from datetime import datetime
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, Generic, List, Optional, TypeVar
 
+from fastapi_pagination import Page
 from pydantic import BaseModel
 
+from server.nutrition import NUTRIENT_ALIASES
 from server.storage.models import (
     GroceryList,
     GroceryListItem,
     Ingredient,
     MealPlanItem,
+    MealPlanRule,
+    MealPlanRuleException,
     Recipe,
     Step,
     Tag,
     User,
 )
-from server.storage.utils import sqlalchemy_to_pydantic
+from server.storage.utils import range_filter_fields, sqlalchemy_to_pydantic
+
+T = TypeVar("T")
 
 
 class Token(BaseModel):
@@ -21,7 +27,9 @@ class Token(BaseModel):
     token_type: str
 
 
-UserSchema = sqlalchemy_to_pydantic(User, exclude_fields=["hashed_password"])
+UserSchema = sqlalchemy_to_pydantic(
+    User, exclude_fields=["hashed_password", "meal_plan_version"]
+)
 UserCreateSchema = sqlalchemy_to_pydantic(
     User,
     include_fields=["username"],
@@ -43,29 +51,44 @@ UserListSchema = sqlalchemy_to_pydantic(
 )
 
 TagSchema = sqlalchemy_to_pydantic(Tag)
+TagNameSchema = sqlalchemy_to_pydantic(
+    Tag, include_fields=["id", "name"], name="TagName"
+)
 TagCreateSchema = sqlalchemy_to_pydantic(
     Tag,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=["id", "user_id", "recipe_count"],
     treat_default_as_optional=True,
     name="TagCreate",
 )
 TagUpdateSchema = sqlalchemy_to_pydantic(
     Tag,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=["id", "user_id", "recipe_count"],
     all_fields_optional=True,
     name="TagUpdate",
 )
 TagListSchema = sqlalchemy_to_pydantic(
     Tag,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=["id", "user_id", "recipe_count"],
     all_fields_optional=True,
     name="TagList",
 )
 
+
+class TagFacetSchema(BaseModel):
+    id: int
+    name: str
+    count: int
+
+
+class FacetedPage(Page[T], Generic[T]):
+    facets: Optional[List[TagFacetSchema]] = None
+
+
 IngredientSchema = sqlalchemy_to_pydantic(Ingredient)
 StepSchema = sqlalchemy_to_pydantic(Step)
 RecipeSchema = sqlalchemy_to_pydantic(
     Recipe,
+    exclude_fields=["search_vector", "ingredient_names", "minhash"],
     additional_attributes={
         "ingredients": (List[IngredientSchema], ...),
         "steps": (List[StepSchema], ...),
@@ -74,7 +97,18 @@ RecipeSchema = sqlalchemy_to_pydantic(
 )
 RecipeCreateSchema = sqlalchemy_to_pydantic(
     Recipe,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=[
+        "id",
+        "user_id",
+        "image_hash",
+        "thumbnail_url",
+        "srcset",
+        "search_vector",
+        "ingredient_names",
+        "minhash",
+        "total_time",
+        *NUTRIENT_ALIASES,
+    ],
     treat_default_as_optional=True,
     additional_attributes={
         "tag_ids": (List[int], []),
@@ -85,7 +119,18 @@ RecipeCreateSchema = sqlalchemy_to_pydantic(
 )
 RecipeUpdateSchema = sqlalchemy_to_pydantic(
     Recipe,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=[
+        "id",
+        "user_id",
+        "image_hash",
+        "thumbnail_url",
+        "srcset",
+        "search_vector",
+        "ingredient_names",
+        "minhash",
+        "total_time",
+        *NUTRIENT_ALIASES,
+    ],
     all_fields_optional=True,
     additional_attributes={
         "tag_ids": (List[int], []),
@@ -96,21 +141,51 @@ RecipeUpdateSchema = sqlalchemy_to_pydantic(
 )
 RecipeListSchema = sqlalchemy_to_pydantic(
     Recipe,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=[
+        "id",
+        "user_id",
+        "image_hash",
+        "thumbnail_url",
+        "srcset",
+        "search_vector",
+        "ingredient_names",
+        "minhash",
+    ],
     all_fields_optional=True,
+    additional_attributes=range_filter_fields(Recipe),
     name="RecipeList",
 )
+RecipeNameSchema = sqlalchemy_to_pydantic(
+    Recipe, include_fields=["id", "name"], name="RecipeName"
+)
+
+
+class RecipeMatchSchema(BaseModel):
+    recipe: RecipeSchema  # type: ignore
+    coverage: float
+    missing: List[str]
+
+
+class RecipeSimilarSchema(BaseModel):
+    recipe: RecipeSchema  # type: ignore
+    score: float
+
+
+class RecipeDuplicateClusterSchema(BaseModel):
+    recipes: List[RecipeSchema]  # type: ignore
+    similarity: float
+
 
 MealPlanItemSchema = sqlalchemy_to_pydantic(MealPlanItem)
 MealPlanItemCreateSchema = sqlalchemy_to_pydantic(
     MealPlanItem,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=["id", "user_id", "meal_plan_rule_id"],
     treat_default_as_optional=True,
     name="MealPlanItemCreate",
 )
 MealPlanItemUpdateSchema = sqlalchemy_to_pydantic(
     MealPlanItem,
-    exclude_fields=["id", "user_id"],
+    exclude_fields=["id", "user_id", "meal_plan_rule_id"],
     all_fields_optional=True,
     name="MealPlanItemUpdate",
 )
@@ -121,7 +196,84 @@ MealPlanItemListSchema = sqlalchemy_to_pydantic(
     name="MealPlanItemList",
 )
 
+# Listed meal plan items, which include occurrences of rules without an ID
+MealPlanEntrySchema = sqlalchemy_to_pydantic(
+    MealPlanItem,
+    exclude_fields=["id"],
+    additional_attributes={"id": (Optional[int], None)},
+    name="MealPlanEntry",
+)
+
+MealPlanRuleExceptionSchema = sqlalchemy_to_pydantic(MealPlanRuleException)
+MealPlanRuleSchema = sqlalchemy_to_pydantic(
+    MealPlanRule,
+    additional_attributes={
+        "exceptions": (List[MealPlanRuleExceptionSchema], ...)  # type: ignore
+    },
+)
+MealPlanRuleCreateSchema = sqlalchemy_to_pydantic(
+    MealPlanRule,
+    exclude_fields=["id", "user_id"],
+    treat_default_as_optional=True,
+    name="MealPlanRuleCreate",
+)
+MealPlanRuleUpdateSchema = sqlalchemy_to_pydantic(
+    MealPlanRule,
+    exclude_fields=["id", "user_id"],
+    all_fields_optional=True,
+    name="MealPlanRuleUpdate",
+)
+
+
+class MealPlanItemCopySchema(BaseModel):
+    start_date: datetime
+    end_date: datetime
+    # Where start_date lands, every copied item is shifted by the same amount
+    target_date: datetime
+
+
+RecipeSummarySchema = sqlalchemy_to_pydantic(
+    Recipe,
+    include_fields=[
+        "id",
+        "name",
+        "image_url",
+        "thumbnail_url",
+        "srcset",
+        "servings",
+        "total_time",
+        "favorite",
+    ],
+    name="RecipeSummary",
+)
+
+
+class MealPlanCalendarSchema(BaseModel):
+    # Meal plan items by day, only days with items are present
+    days: Dict[date, List[MealPlanEntrySchema]]  # type: ignore
+    recipes: List[RecipeSummarySchema]  # type: ignore
+
+
 GroceryListItemSchema = sqlalchemy_to_pydantic(GroceryListItem)
+GroceryListItemToggleSchema = sqlalchemy_to_pydantic(
+    GroceryListItem, include_fields=["id", "active"], name="GroceryListItemToggle"
+)
+
+
+class GroceryListLineSchema(BaseModel):
+    name: str
+    quantity: float
+    unit: Optional[str]
+    active: bool
+    items: List[GroceryListItemSchema]  # type: ignore
+
+
+class GroceryListPreviewLineSchema(BaseModel):
+    name: str
+    quantity: float
+    unit: Optional[str]
+    recipe_names: List[str]
+
 
 GroceryListSchema = sqlalchemy_to_pydantic(
     GroceryList,
@@ -0,0 +1,273 @@
+import re
+from typing import Any, Dict, Iterable, List, Optional, Type, Union
+
+from fastapi import HTTPException
+from psycopg2.errors import QueryCanceled
+
+from sqlalchemy import (
+    Float,
+    Select,
+    String,
+    all_,
+    any_,
+    bindparam,
+    cast,
+    exists,
+    func,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import InstrumentedAttribute, Session
+
+from server.cache import TTLCache
+from server.config import CONFIG
+from server.constants import SEARCH_CONFIG
+from server.storage.models import Ingredient, Recipe, RecipeTagAssoc, Step, Tag, User
+from server.storage.utils import safe_query, statement_timeout
+
+NON_WORD_RE = re.compile(r"[^\w\s]+")
+LIKE_SPECIAL_RE = re.compile(r"([\\%_])")
+
+autocomplete_cache: TTLCache[List[Dict[str, Any]]] = TTLCache(
+    CONFIG.autocomplete_cache_ttl_seconds
+)
+
+
+def _weighted(text, weight: str):
+    return func.setweight(
+        func.to_tsvector(SEARCH_CONFIG, func.coalesce(text, "")), weight
+    )
+
+
+def recipe_search_vector():
+    """Expression building a recipe's tsvector from its own row.
+
+    Name ranks highest, then ingredient names, description and step text.
+    """
+    ingredient_names = (
+        select(func.string_agg(Ingredient.name, " "))
+        .filter(Ingredient.recipe_id == Recipe.id)
+        .scalar_subquery()
+    )
+    step_text = (
+        select(func.string_agg(Step.text, " "))
+        .filter(Step.recipe_id == Recipe.id)
+        .scalar_subquery()
+    )
+    return (
+        _weighted(Recipe.name, "A")
+        .op("||")(_weighted(ingredient_names, "B"))
+        .op("||")(_weighted(Recipe.description, "C"))
+        .op("||")(_weighted(step_text, "D"))
+    )
+
+
+def refresh_search_vectors(
+    db: Session, recipe_ids: Optional[Iterable[int]] = None
+) -> None:
+    """Recompute search_vector for the given recipes, or all if None.
+
+    Must run after the recipes' ingredients and steps have been flushed.
+    """
+    query = update(Recipe).values(search_vector=recipe_search_vector())
+    if recipe_ids is not None:
+        query = query.filter(Recipe.id.in_(list(recipe_ids)))
+    db.execute(query, execution_options={"synchronize_session": False})
+
+
+def search_recipes(query: Select, q: str) -> Select:
+    ts_query = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    rank = func.ts_rank_cd(Recipe.search_vector, ts_query)
+    return query.filter(Recipe.search_vector.op("@@")(ts_query)).order_by(
+        rank.desc(), Recipe.id
+    )
+
+
+def filter_by_tags(
+    query: Select,
+    tags_all: Iterable[int] = (),
+    tags_any: Iterable[int] = (),
+    tags_none: Iterable[int] = (),
+) -> Select:
+    """Restrict query to recipes with all of tags_all, at least one of
+    tags_any and none of tags_none.
+
+    Each condition is a semi or anti join against recipe_tag_assoc, so
+    Postgres can drive them from the tag_id index instead of loading tags.
+    """
+    tags_all, tags_any, tags_none = set(tags_all), set(tags_any), set(tags_none)
+
+    if tags_all:
+        tagged_all = (
+            select(RecipeTagAssoc.recipe_id)
+            .filter(RecipeTagAssoc.tag_id.in_(tags_all))
+            .group_by(RecipeTagAssoc.recipe_id)
+            .having(func.count() == len(tags_all))
+        )
+        query = query.filter(Recipe.id.in_(tagged_all))
+
+    if tags_any:
+        query = query.filter(
+            exists().where(
+                RecipeTagAssoc.recipe_id == Recipe.id,
+                RecipeTagAssoc.tag_id.in_(tags_any),
+            )
+        )
+
+    if tags_none:
+        query = query.filter(
+            ~exists().where(
+                RecipeTagAssoc.recipe_id == Recipe.id,
+                RecipeTagAssoc.tag_id.in_(tags_none),
+            )
+        )
+
+    return query
+
+
+def tag_facets(
+    db: Session, user: User, recipes: Optional[Select] = None
+) -> List[Dict[str, Any]]:
+    """Number of recipes per tag, among recipes if given.
+
+    Without a recipe query the denormalized Tag.recipe_count is read directly,
+    otherwise the matching recipes are counted per tag in one grouped query.
+    """
+    query = safe_query(select, [Tag], user)
+    if recipes is None:
+        query = query.with_only_columns(
+            Tag.id, Tag.name, Tag.recipe_count.label("count")
+        ).filter(Tag.recipe_count > 0)
+    else:
+        recipe_ids = recipes.with_only_columns(Recipe.id).order_by(None)
+        query = (
+            query.with_only_columns(Tag.id, Tag.name, func.count().label("count"))
+            .join(RecipeTagAssoc, RecipeTagAssoc.tag_id == Tag.id)
+            .filter(RecipeTagAssoc.recipe_id.in_(recipe_ids))
+            .group_by(Tag.id)
+        )
+
+    query = query.order_by(Tag.name, Tag.id)
+    return [dict(row) for row in db.execute(query).mappings()]
+
+
+def normalize_ingredient_name(name: str) -> str:
+    """Reduce an ingredient name to the form stored in the ingredient index.
+
+    Lowercases, drops punctuation and naively singularizes the last word, so
+    "Red Chiles," and "red chile" index to the same entry.
+    """
+    words = NON_WORD_RE.sub(" ", name.lower()).split()
+    if not words:
+        return ""
+
+    last = words[-1]
+    if last.endswith("ies") and len(last) > 4:
+        last = last[:-3] + "y"
+    elif last.endswith("oes") and len(last) > 4:
+        last = last[:-2]
+    elif last.endswith("s") and not last.endswith(("ss", "us")) and len(last) > 3:
+        last = last[:-1]
+    words[-1] = last
+
+    return " ".join(words)
+
+
+def normalize_ingredient_names(names: Iterable[Optional[str]]) -> List[str]:
+    normalized = {normalize_ingredient_name(name) for name in names if name}
+    normalized.discard("")
+    return sorted(normalized)
+
+
+def index_recipe_ingredients(recipe: Recipe) -> None:
+    recipe.ingredient_names = normalize_ingredient_names(
+        ingredient.name for ingredient in recipe.ingredients
+    )
+
+
+def cookable_recipes(
+    query: Select, ingredients: Iterable[str], min_coverage: float = 0
+) -> Select:
+    """Rank recipes by the fraction of their ingredients that are on hand.
+
+    Only recipes sharing at least one ingredient are considered, which the
+    GIN index on ingredient_names answers without scanning every recipe.
+    """
+    on_hand = bindparam(
+        "on_hand", normalize_ingredient_names(ingredients), type_=ARRAY(String)
+    )
+
+    names = func.unnest(Recipe.ingredient_names).table_valued("name").render_derived()
+    matched = (
+        select(func.count())
+        .select_from(names)
+        .filter(names.c.name == any_(on_hand))
+        .scalar_subquery()
+    )
+    missing_names = (
+        func.unnest(Recipe.ingredient_names).table_valued("name").render_derived()
+    )
+    missing = func.array(
+        select(missing_names.c.name)
+        .filter(missing_names.c.name != all_(on_hand))
+        .scalar_subquery()
+    )
+    coverage = cast(matched, Float) / func.cardinality(Recipe.ingredient_names)
+
+    return (
+        query.add_columns(coverage.label("coverage"), missing.label("missing"))
+        .filter(Recipe.ingredient_names.overlap(on_hand))
+        .filter(coverage >= min_coverage)
+        .order_by(coverage.desc(), matched.desc(), Recipe.name, Recipe.id)
+    )
+
+
+def autocomplete_names(
+    db: Session, query: Select, column: InstrumentedAttribute, q: str, limit: int
+) -> List[Dict[str, Any]]:
+    """Best matches for q among the rows of query, as (id, name) mappings.
+
+    Prefix matches come first, then fuzzy matches by trigram similarity. Both
+    are answered by the pg_trgm GIN index on column.
+    """
+    prefix = LIKE_SPECIAL_RE.sub(r"\\\1", q) + "%"
+    is_prefix = column.ilike(prefix, escape="\\")
+    query = (
+        query.filter(or_(is_prefix, column.op("%")(q)))
+        .order_by(is_prefix.desc(), func.similarity(column, q).desc(), column)
+        .limit(limit)
+    )
+    return [dict(row) for row in db.execute(query).mappings()]
+
+
+def cached_autocomplete(
+    db: Session, user: User, model: Union[Type[Recipe], Type[Tag]], q: str, limit: int
+) -> List[Dict[str, Any]]:
+    """autocomplete_names over the user's rows of model, cached per prefix.
+
+    Lookups running past CONFIG.autocomplete_timeout_ms are cancelled with a
+    503, a typeahead answer that late is no longer useful to the client.
+    """
+    q = q.strip()
+    if not q:
+        return []
+
+    key = (model.__tablename__, user.id, q.lower(), limit)
+    results = autocomplete_cache.get(key)
+    if results is None:
+        query = safe_query(select, [model], user).with_only_columns(
+            model.id, model.name
+        )
+        try:
+            with statement_timeout(db, CONFIG.autocomplete_timeout_ms):
+                results = autocomplete_names(db, query, model.name, q, limit)
+        except OperationalError as e:
+            if isinstance(e.orig, QueryCanceled):
+                raise HTTPException(status_code=503, detail="Autocomplete timed out")
+            raise
+        autocomplete_cache.set(key, results)
+
+    return results
@@ -0,0 +1,275 @@
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from server.cache import TTLCache
+from server.config import CONFIG
+from server.storage.models import Recipe, RecipeTagAssoc
+
+# Session.info key of the recipes to mark pending again once committed
+INVALIDATED_KEY = "similarity_invalidated"
+
+
+def recipe_features(
+    ingredient_names: Optional[List[str]], tag_ids: Iterable[int]
+) -> List[str]:
+    return [f"i:{name}" for name in ingredient_names or []] + [
+        f"t:{tag_id}" for tag_id in tag_ids
+    ]
+
+
+class RecipeSimilarityIndex:
+    """Sparse ingredient and tag vectors for one user's recipes.
+
+    Each recipe is a row of binary features. Weighted by inverse document
+    frequency and L2 normalized, a sparse matrix-vector product gives the
+    cosine similarity to every other recipe at once. The weights are
+    applied when scoring rather than stored in the matrix, so a change to
+    one recipe doesn't touch the other rows: the changed recipe's row is
+    emptied and its new features appended as a new row, while document
+    frequencies are adjusted by the difference. Emptied rows are dropped
+    on the next full load.
+    """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.pending: Set[int] = set()
+        self.loaded_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+        # Feature -> column, only grows until the next full load
+        self.vocabulary: Dict[str, int] = {}
+        self.matrix = sparse.csr_matrix((0, 0))
+        # Recipe ID of each row, -1 for emptied rows
+        self.recipe_ids = np.empty(0, dtype=np.int64)
+        self.rows: Dict[int, int] = {}
+        self.document_frequency = np.empty(0, dtype=np.int64)
+        self.weights = np.empty(0)
+        self.norms = np.empty(0)
+
+    def _feature_query(self):
+        tag_ids = func.array_remove(func.array_agg(RecipeTagAssoc.tag_id), None)
+        return (
+            select(Recipe.id, Recipe.ingredient_names, tag_ids)
+            .outerjoin(RecipeTagAssoc, RecipeTagAssoc.recipe_id == Recipe.id)
+            .filter(Recipe.user_id == self.user_id)
+            .group_by(Recipe.id)
+        )
+
+    def _feature_rows(self, features: Iterable[List[str]]) -> sparse.csr_matrix:
+        indptr = [0]
+        indices: List[int] = []
+        for row_features in features:
+            indices.extend(
+                sorted(
+                    {
+                        self.vocabulary.setdefault(feature, len(self.vocabulary))
+                        for feature in row_features
+                    }
+                )
+            )
+            indptr.append(len(indices))
+
+        return sparse.csr_matrix(
+            (np.ones(len(indices)), np.array(indices, dtype=np.int64), indptr),
+            shape=(len(indptr) - 1, len(self.vocabulary)),
+        )
+
+    def _reweight(self):
+        # Squared inverse document frequencies, so that a row's dot product
+        # with weighted query features is the weighted vectors' dot product
+        idf = np.log((1 + len(self.rows)) / (1 + self.document_frequency)) + 1
+        self.weights = idf**2
+        norms = np.sqrt(self.matrix @ self.weights)
+        norms[norms == 0] = 1
+        self.norms = norms
+
+    def load(self, db: Session):
+        features = {
+            recipe_id: recipe_features(ingredient_names, tag_ids)
+            for recipe_id, ingredient_names, tag_ids in db.execute(
+                self._feature_query()
+            )
+        }
+        self.vocabulary = {}
+        self.matrix = self._feature_rows(features.values())
+        self.recipe_ids = np.fromiter(features, dtype=np.int64, count=len(features))
+        self.rows = {recipe_id: row for row, recipe_id in enumerate(features)}
+        self.document_frequency = np.bincount(
+            self.matrix.indices, minlength=len(self.vocabulary)
+        )
+        self.pending.clear()
+        self.loaded_at = time.monotonic()
+        self._reweight()
+
+    def refresh(self, db: Session):
+        if not self.pending:
+            return
+
+        recipe_ids = list(self.pending)
+        features = {
+            recipe_id: recipe_features(ingredient_names, tag_ids)
+            for recipe_id, ingredient_names, tag_ids in db.execute(
+                self._feature_query().filter(Recipe.id.in_(recipe_ids))
+            )
+        }
+        self.pending.clear()
+
+        stale = [
+            self.rows.pop(recipe_id)
+            for recipe_id in recipe_ids
+            if recipe_id in self.rows
+        ]
+        self.recipe_ids[stale] = -1
+
+        # Empty the stale rows, in place of rebuilding the others
+        kept = np.ones(self.matrix.shape[0], dtype=bool)
+        kept[stale] = False
+        row_lengths = np.where(kept, np.diff(self.matrix.indptr), 0)
+        kept_entries = np.repeat(kept, np.diff(self.matrix.indptr))
+        self.document_frequency -= np.bincount(
+            self.matrix.indices[~kept_entries],
+            minlength=len(self.document_frequency),
+        )
+        indices = self.matrix.indices[kept_entries]
+        indptr = np.concatenate([[0], np.cumsum(row_lengths)])
+
+        # Then append rows for the current features of the changed recipes
+        added = self._feature_rows(features.values())
+        first_row = self.matrix.shape[0]
+        self.rows.update(
+            (recipe_id, first_row + i) for i, recipe_id in enumerate(features)
+        )
+        self.recipe_ids = np.concatenate(
+            [
+                self.recipe_ids,
+                np.fromiter(features, dtype=np.int64, count=len(features)),
+            ]
+        )
+        indices = np.concatenate([indices, added.indices])
+        indptr = np.concatenate([indptr, added.indptr[1:] + indptr[-1]])
+        self.matrix = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(self.recipe_ids), len(self.vocabulary)),
+        )
+        document_frequency = np.bincount(added.indices, minlength=len(self.vocabulary))
+        document_frequency[: len(self.document_frequency)] += self.document_frequency
+        self.document_frequency = document_frequency
+        self._reweight()
+
+    def similar(self, recipe_id: int, limit: int) -> List[Tuple[int, float]]:
+        row = self.rows.get(recipe_id)
+        if row is None:
+            return []
+
+        columns = self.matrix.indices[
+            self.matrix.indptr[row] : self.matrix.indptr[row + 1]
+        ]
+        query = np.zeros(self.matrix.shape[1])
+        query[columns] = self.weights[columns]
+        scores = (self.matrix @ query) / (self.norms * self.norms[row])
+        scores[row] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        # Highest score first, ties by id so results are stable
+        candidates = candidates[
+            np.lexsort((self.recipe_ids[candidates], -scores[candidates]))
+        ]
+        return [
+            (int(self.recipe_ids[candidate]), float(scores[candidate]))
+            for candidate in candidates
+        ]
+
+
+class SimilarityIndexCache:
+    """Per user similarity indexes, kept in memory between requests.
+
+    Routes that change recipes mark them with invalidate, which only
+    reaches the current process, so indexes expire after
+    CONFIG.similarity_cache_ttl_seconds and are loaded afresh to pick up
+    changes made by other workers. Only the most recently used
+    CONFIG.similarity_cache_max_size users keep an index.
+
+    Recipes are marked again once the session commits. A lookup that
+    refreshes between the change and its commit still reads the old row
+    and takes the recipe off pending, so it's only up to date after the
+    commit.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.indexes: TTLCache[RecipeSimilarityIndex] = TTLCache(ttl, max_size)
+        self.lock = threading.Lock()
+
+    def get(self, db: Session, user_id: int) -> RecipeSimilarityIndex:
+        with self.lock:
+            index = self.indexes.get(user_id)
+            if index is None:
+                index = RecipeSimilarityIndex(user_id)
+                self.indexes.set(user_id, index)
+
+        with index.lock:
+            if index.loaded_at is None:
+                index.load(db)
+            else:
+                index.refresh(db)
+
+        return index
+
+    def invalidate(self, db: Session, user_id: int, recipe_id: int):
+        self.mark_pending(user_id, recipe_id)
+        db.info.setdefault(INVALIDATED_KEY, set()).add((user_id, recipe_id))
+
+    def mark_pending(self, user_id: int, recipe_id: int):
+        index = self.indexes.get(user_id)
+        if index is not None:
+            with index.lock:
+                index.pending.add(recipe_id)
+
+    def clear(self):
+        self.indexes.clear()
+
+
+similarity_cache = SimilarityIndexCache(
+    CONFIG.similarity_cache_ttl_seconds, CONFIG.similarity_cache_max_size
+)
+
+
+@event.listens_for(Session, "after_commit")
+def mark_committed_recipes_pending(db: Session):
+    for user_id, recipe_id in db.info.pop(INVALIDATED_KEY, ()):
+        similarity_cache.mark_pending(user_id, recipe_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_rolled_back_recipes(db: Session):
+    db.info.pop(INVALIDATED_KEY, None)
+
+
+def similar_recipes(
+    db: Session, recipe: Recipe, limit: int
+) -> List[Tuple[Recipe, float]]:
+    """Recipes of the same user most similar to recipe by cosine similarity."""
+    index = similarity_cache.get(db, recipe.user_id)
+    with index.lock:
+        matches = index.similar(recipe.id, limit)
+    if not matches:
+        return []
+
+    recipes = {
+        similar.id: similar
+        for similar in db.scalars(
+            select(Recipe).filter(Recipe.id.in_([id for id, _ in matches]))
+        )
+    }
+    return [
+        (recipes[recipe_id], score)
+        for recipe_id, score in matches
+        if recipe_id in recipes
+    ]
@@ -0,0 +1,191 @@
+import os
+import re
+from email.utils import formatdate
+from hashlib import md5
+from mimetypes import guess_type
+from typing import List, Optional, Tuple
+
+import anyio
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from server.constants import IMAGE_CHUNK_SIZE, IMMUTABLE_CACHE_CONTROL
+
+# Blob hashes and legacy uuid4 names, optionally followed by a derivative width
+IMMUTABLE_FILENAME_RE = re.compile(
+    r"^(?P<stem>([0-9a-f]{64}|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})(_\d+w)?)\.\w+$"
+)
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single byte range into inclusive (start, end) offsets.
+
+    Returns None for headers that should be ignored, such as other units or
+    multiple ranges, in which case the whole file is sent.
+    """
+    units, _, byte_range = range_header.partition("=")
+    if units.strip().lower() != "bytes" or "," in byte_range:
+        return None
+
+    raw_start, _, raw_end = byte_range.strip().partition("-")
+    try:
+        if raw_start == "":
+            suffix_length = int(raw_end)
+            if suffix_length <= 0 or size == 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix_length, 0), size - 1
+
+        start = int(raw_start)
+        end = int(raw_end) if raw_end else size - 1
+    except ValueError:
+        return None
+
+    if start < 0 or start >= size or end < start:
+        raise RangeNotSatisfiable()
+
+    return start, min(end, size - 1)
+
+
+def etag_matches(etag: str, header_value: str) -> bool:
+    candidates = [value.strip() for value in header_value.split(",")]
+    return "*" in candidates or etag in [
+        candidate.removeprefix("W/") for candidate in candidates
+    ]
+
+
+class ImmutableFileResponse(Response):
+    """File response with strong ETags, byte range and zero-copy support."""
+
+    chunk_size = IMAGE_CHUNK_SIZE
+
+    def __init__(self, path: str, stat_result: os.stat_result, scope: Scope):
+        self.path = path
+        self.send_header_only = scope["method"] == "HEAD"
+        self.background = None
+        self.offset = 0
+        self.length = stat_result.st_size
+
+        filename = os.path.basename(path)
+        match = IMMUTABLE_FILENAME_RE.match(filename)
+        if match:
+            # Name is derived from the content, so it's stable across hosts
+            etag = f'"{match.group("stem")}"'
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            etag_base = f"{filename}-{stat_result.st_mtime_ns}-{stat_result.st_size}"
+            etag = f'"{md5(etag_base.encode(), usedforsecurity=False).hexdigest()}"'
+            cache_control = "no-cache"
+
+        headers = {
+            "accept-ranges": "bytes",
+            "cache-control": cache_control,
+            "etag": etag,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        }
+        self.media_type = guess_type(filename)[0] or "application/octet-stream"
+        self.status_code = 200
+
+        request_headers = Headers(scope=scope)
+        if_none_match = request_headers.get("if-none-match")
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+
+        if if_none_match is not None and etag_matches(etag, if_none_match):
+            self.status_code = 304
+            self.length = 0
+        elif range_header is not None and (if_range is None or if_range == etag):
+            try:
+                byte_range = parse_range(range_header, stat_result.st_size)
+            except RangeNotSatisfiable:
+                self.status_code = 416
+                self.length = 0
+                headers["content-range"] = f"bytes */{stat_result.st_size}"
+            else:
+                if byte_range is not None:
+                    start, end = byte_range
+                    content_range = f"bytes {start}-{end}/{stat_result.st_size}"
+                    self.status_code = 206
+                    self.offset = start
+                    self.length = end - start + 1
+                    headers["content-range"] = content_range
+
+        if self.status_code != 304:
+            headers["content-length"] = str(self.length)
+
+        self.init_headers(headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+
+        if self.send_header_only or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopy" in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": "http.response.zerocopy",
+                        "file": file,
+                        "offset": self.offset,
+                        "count": self.length,
+                        "more_body": False,
+                    }
+                )
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    }
+                )
+            if remaining > 0:
+                # File shrank under us, close the response rather than hang
+                await send(
+                    {"type": "http.response.body", "body": b"", "more_body": False}
+                )
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles serving content addressed images with long lived caching.
+
+    Paths with a component starting with "." (like the upload staging
+    directory) are never served.
+    """
+
+    def lookup_path(self, path: str) -> Tuple[str, Optional[os.stat_result]]:
+        parts: List[str] = path.split(os.sep)
+        if any(part.startswith(".") and part != "." for part in parts):
+            return "", None
+        return super().lookup_path(path)
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        return ImmutableFileResponse(str(full_path), stat_result, scope)
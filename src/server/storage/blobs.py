@@ -0,0 +1,223 @@
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import BinaryIO, Iterator, NamedTuple, Optional
+
+from server.config import CONFIG
+from server.constants import IMMUTABLE_CACHE_CONTROL
+
+
+class StoredObject(NamedTuple):
+    key: str
+    size: int
+    modified_at: datetime
+
+
+class Storage(ABC):
+    """Flat key/value store for image files.
+
+    Keys are "/" separated relative paths. Objects are written once from a
+    local file and never modified afterwards, which is what makes it safe to
+    serve them with immutable cache headers.
+    """
+
+    @abstractmethod
+    def put(self, key: str, src_file: str, content_type: Optional[str] = None):
+        """Move the local file src_file into storage under key."""
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def iter_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        ...
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        ...
+
+    @abstractmethod
+    def key_for_url(self, url: str) -> Optional[str]:
+        """Inverse of url, or None if the URL doesn't point into this storage."""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of key if the backend keeps objects on local disk."""
+        return None
+
+
+class LocalStorage(Storage):
+    def __init__(self, root: str, url_prefix: str = "/static"):
+        self.root = root
+        self.url_prefix = url_prefix
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != os.path.normpath(self.root):
+            raise ValueError(f"Storage key escapes storage root: {key}")
+        return path
+
+    def put(self, key: str, src_file: str, content_type: Optional[str] = None):
+        dst_file = self._path(key)
+        os.makedirs(os.path.dirname(dst_file), exist_ok=True)
+        try:
+            os.replace(src_file, dst_file)
+        except OSError:
+            # Staging area lives on another filesystem, copy next to the
+            # destination first so readers never see a partial file
+            fd, tmp_file = tempfile.mkstemp(
+                dir=os.path.dirname(dst_file), suffix=".tmp"
+            )
+            try:
+                with os.fdopen(fd, "wb") as dst, open(src_file, "rb") as src:
+                    shutil.copyfileobj(src, dst)
+                os.replace(tmp_file, dst_file)
+            except BaseException:
+                if os.path.exists(tmp_file):
+                    os.unlink(tmp_file)
+                raise
+            os.unlink(src_file)
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._path(key), "rb")
+
+    def iter_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        # Same semantics as an S3 prefix, which needn't end at a directory
+        if not prefix.endswith("/"):
+            directory = self._path(os.path.dirname(prefix))
+        else:
+            directory = self._path(prefix)
+        for dirpath, _, filenames in os.walk(directory):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, "/")
+                if not key.startswith(prefix):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield StoredObject(
+                    key=key,
+                    size=stat.st_size,
+                    modified_at=datetime.utcfromtimestamp(stat.st_mtime),
+                )
+
+    def url(self, key: str) -> str:
+        return f"{self.url_prefix}/{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        if not url.startswith(f"{self.url_prefix}/"):
+            return None
+        return url[len(self.url_prefix) + 1 :]
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self._path(key)
+
+
+class S3Storage(Storage):
+    """Storage backed by any S3 compatible object store.
+
+    boto3 is only required when this backend is configured, install it with
+    the "s3" extra.
+    """
+
+    def __init__(
+        self,
+        bucket: str,
+        public_url: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+    ):
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client_error = ClientError
+        self.bucket = bucket
+        self.public_url = public_url.rstrip("/")
+        self.prefix = prefix
+
+    def put(self, key: str, src_file: str, content_type: Optional[str] = None):
+        extra_args = {"CacheControl": IMMUTABLE_CACHE_CONTROL}
+        if content_type is not None:
+            extra_args["ContentType"] = content_type
+
+        self.client.upload_file(
+            src_file, self.bucket, f"{self.prefix}{key}", ExtraArgs=extra_args
+        )
+        os.unlink(src_file)
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")
+        except self.client_error as e:
+            if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=f"{self.prefix}{key}")
+
+    def open(self, key: str) -> BinaryIO:
+        # Spool to disk past a few MB so large images don't sit in memory
+        f = tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+        self.client.download_fileobj(self.bucket, f"{self.prefix}{key}", f)
+        f.seek(0)
+        return f  # type: ignore
+
+    def iter_objects(self, prefix: str = "") -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        pages = paginator.paginate(Bucket=self.bucket, Prefix=f"{self.prefix}{prefix}")
+        for page in pages:
+            for obj in page.get("Contents", []):
+                yield StoredObject(
+                    key=obj["Key"][len(self.prefix) :],
+                    size=obj["Size"],
+                    modified_at=obj["LastModified"].replace(tzinfo=None),
+                )
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{self.prefix}{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        base = f"{self.public_url}/{self.prefix}"
+        if not url.startswith(base):
+            return None
+        return url[len(base) :]
+
+
+def create_storage() -> Storage:
+    if CONFIG.storage_backend == "local":
+        return LocalStorage(CONFIG.static_dir)
+    if CONFIG.storage_backend == "s3":
+        return S3Storage(
+            CONFIG.s3_bucket,
+            CONFIG.s3_public_url,
+            prefix=CONFIG.s3_prefix,
+            endpoint_url=CONFIG.s3_endpoint_url,
+        )
+    raise ValueError(f"Unsupported storage backend: {CONFIG.storage_backend}")
+
+
+storage = create_storage()
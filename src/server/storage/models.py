@@ -1,15 +1,23 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from sqlalchemy import (
+    DDL,
+    BigInteger,
     Boolean,
+    Computed,
     DateTime,
+    FetchedValue,
     Float,
     ForeignKey,
+    Index,
     Integer,
+    JSON,
     String,
     UniqueConstraint,
+    event,
 )
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
 from sqlalchemy.ext.associationproxy import AssociationProxy, association_proxy
 from sqlalchemy.orm import Mapped, mapped_column, relationship, synonym
 
@@ -17,6 +25,11 @@ from pydantic import ConfigDict
 
 from server.storage.database import Base
 
+# Trigram indexes for autocomplete use the pg_trgm operator classes
+event.listen(
+    Base.metadata, "before_create", DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+)
+
 
 class User(Base):
     __tablename__ = "user"
@@ -25,6 +38,10 @@ class User(Base):
     username: Mapped[str] = mapped_column(String, nullable=False, unique=True)
     hashed_password: Mapped[str] = mapped_column(String, nullable=False)
     role: Mapped[str] = mapped_column(String, nullable=False)
+    # Bumped by triggers whenever the user's meal plan or its recipes change
+    meal_plan_version: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     user_id: Mapped[int] = synonym("id")
 
     recipes: Mapped[List["Recipe"]] = relationship("Recipe", back_populates="user")
@@ -38,15 +55,39 @@ class Recipe(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
-    image_url: Mapped[Optional[str]] = mapped_column(String)
+    image_url: Mapped[Optional[str]] = mapped_column(String, index=True)
+    image_hash: Mapped[Optional[str]] = mapped_column(
+        String, ForeignKey("image_blob.hash", ondelete="SET NULL"), index=True
+    )
+    thumbnail_url: Mapped[Optional[str]] = mapped_column(String)
+    srcset: Mapped[Optional[Dict[str, str]]] = mapped_column(JSON)
     source: Mapped[str] = mapped_column(String, nullable=False, default="")
     servings: Mapped[int] = mapped_column(Integer, nullable=False, default=1)
     servings_type: Mapped[str] = mapped_column(String, nullable=False, default="")
     prep_time: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
     cook_time: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    total_time: Mapped[int] = mapped_column(
+        Integer, Computed("prep_time + cook_time", persisted=True), nullable=False
+    )
     description: Mapped[str] = mapped_column(String, nullable=False, default="")
     nutrition: Mapped[str] = mapped_column(String, nullable=False, default="")
+    # Parsed from nutrition on write, per serving
+    calories: Mapped[Optional[float]] = mapped_column(Float)
+    protein: Mapped[Optional[float]] = mapped_column(Float)
+    fat: Mapped[Optional[float]] = mapped_column(Float)
+    carbohydrates: Mapped[Optional[float]] = mapped_column(Float)
+    fiber: Mapped[Optional[float]] = mapped_column(Float)
+    sugar: Mapped[Optional[float]] = mapped_column(Float)
+    sodium: Mapped[Optional[float]] = mapped_column(Float)
     favorite: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
+    search_vector: Mapped[Optional[str]] = mapped_column(TSVECTOR, deferred=True)
+    ingredient_names: Mapped[Optional[List[str]]] = mapped_column(
+        ARRAY(String), deferred=True
+    )
+    # MinHash signature of ingredient names and step shingles, see server.dedup
+    minhash: Mapped[Optional[List[int]]] = mapped_column(
+        ARRAY(BigInteger), deferred=True
+    )
     user_id: Mapped[int] = mapped_column(
         Integer,
         ForeignKey("user.id", ondelete="CASCADE"),
@@ -67,12 +108,74 @@ class Recipe(Base):
         passive_deletes=True,
     )
 
+    __table_args__ = (
+        Index("ix_recipe_user_id_total_time", "user_id", "total_time"),
+        Index("ix_recipe_user_id_prep_time", "user_id", "prep_time"),
+        Index("ix_recipe_user_id_servings", "user_id", "servings"),
+        Index("ix_recipe_user_id_favorite", "user_id", "favorite"),
+        Index("ix_recipe_user_id_calories", "user_id", "calories"),
+        Index("ix_recipe_user_id_protein", "user_id", "protein"),
+        Index("ix_recipe_search_vector", "search_vector", postgresql_using="gin"),
+        Index("ix_recipe_ingredient_names", "ingredient_names", postgresql_using="gin"),
+        Index(
+            "ix_recipe_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
+
+
+class RecipeLSHBucket(Base):
+    """LSH band of a recipe's MinHash signature, hashed to a bucket."""
+
+    __tablename__ = "recipe_lsh_bucket"
+
+    recipe_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("recipe.id", ondelete="CASCADE"),
+        primary_key=True,
+        nullable=False,
+    )
+    band: Mapped[int] = mapped_column(Integer, primary_key=True, nullable=False)
+    bucket: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        Index(
+            "ix_recipe_lsh_bucket_user_id_band_bucket",
+            "user_id",
+            "band",
+            "bucket",
+            "recipe_id",
+        ),
+    )
+
+
+class ImageBlob(Base):
+    __tablename__ = "image_blob"
+
+    hash: Mapped[str] = mapped_column(String, primary_key=True)
+    key: Mapped[str] = mapped_column(String, nullable=False)
+    mime_type: Mapped[str] = mapped_column(String, nullable=False)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    ref_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    orphaned_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+
 
 class Tag(Base):
     __tablename__ = "tag"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     name: Mapped[str] = mapped_column(String, nullable=False)
+    # Maintained by triggers on recipe_tag_assoc
+    recipe_count: Mapped[int] = mapped_column(
+        Integer, nullable=False, default=0, server_default="0"
+    )
     user_id: Mapped[int] = mapped_column(
         Integer,
         ForeignKey("user.id", ondelete="CASCADE"),
@@ -87,7 +190,15 @@ class Tag(Base):
     )
     user: Mapped["User"] = relationship("User", back_populates="tags")
 
-    __table_args__ = (UniqueConstraint("user_id", "name"),)
+    __table_args__ = (
+        UniqueConstraint("user_id", "name"),
+        Index(
+            "ix_tag_name_trgm",
+            "name",
+            postgresql_using="gin",
+            postgresql_ops={"name": "gin_trgm_ops"},
+        ),
+    )
 
 
 class RecipeTagAssoc(Base):
@@ -106,6 +217,52 @@ class RecipeTagAssoc(Base):
         nullable=False,
     )
 
+    # The primary key covers lookups by recipe, this one lookups by tag
+    __table_args__ = (
+        Index("ix_recipe_tag_assoc_tag_id_recipe_id", "tag_id", "recipe_id"),
+    )
+
+
+# Statement level triggers keep tag.recipe_count in sync, including for rows
+# removed by ON DELETE CASCADE, with one UPDATE per tag and statement
+RECIPE_TAG_COUNT_TRIGGERS = """
+CREATE FUNCTION recipe_tag_assoc_inserted() RETURNS trigger AS $$
+BEGIN
+    UPDATE tag SET recipe_count = tag.recipe_count + delta.count
+    FROM (SELECT tag_id, count(*) AS count FROM new_rows GROUP BY tag_id) AS delta
+    WHERE tag.id = delta.tag_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION recipe_tag_assoc_deleted() RETURNS trigger AS $$
+BEGIN
+    UPDATE tag SET recipe_count = tag.recipe_count - delta.count
+    FROM (SELECT tag_id, count(*) AS count FROM old_rows GROUP BY tag_id) AS delta
+    WHERE tag.id = delta.tag_id;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER recipe_tag_assoc_count_insert
+    AFTER INSERT ON recipe_tag_assoc REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_tag_assoc_inserted();
+
+CREATE TRIGGER recipe_tag_assoc_count_delete
+    AFTER DELETE ON recipe_tag_assoc REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION recipe_tag_assoc_deleted();
+"""
+
+event.listen(RecipeTagAssoc.__table__, "after_create", DDL(RECIPE_TAG_COUNT_TRIGGERS))
+event.listen(
+    RecipeTagAssoc.__table__,
+    "before_drop",
+    DDL(
+        "DROP FUNCTION IF EXISTS recipe_tag_assoc_inserted, "
+        "recipe_tag_assoc_deleted CASCADE"
+    ),
+)
+
 
 class Ingredient(Base):
     __tablename__ = "ingredient"
@@ -138,17 +295,337 @@ class Step(Base):
 
 
 class MealPlanItem(Base):
+    """An entry of the meal plan.
+
+    The table is partitioned by month of date, see server.partitions, so
+    the partition key is part of the primary key. IDs are still unique on
+    their own, they come from one sequence.
+    """
+
     __tablename__ = "meal_plan_item"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     recipe_id: Mapped[int] = mapped_column(
         Integer, ForeignKey("recipe.id", ondelete="CASCADE"), nullable=False
     )
-    date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    date: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
     servings: Mapped[int] = mapped_column(Integer, nullable=False)
     meal_type: Mapped[str] = mapped_column(String, nullable=False, default="Dinner")
+    # Copied from the recipe by MEAL_PLAN_ITEM_USER_ID_TRIGGER, so a user's
+    # meal plan can be read by date range without joining recipes
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+        server_default=FetchedValue(),
+        server_onupdate=FetchedValue(),
+    )
+    # Rule the item was generated from, either an occurrence being expanded,
+    # which has no ID, or one that was overridden and stored
+    meal_plan_rule_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("meal_plan_rule.id", ondelete="SET NULL")
+    )
     recipe: Mapped["Recipe"] = relationship("Recipe")
-    user_id: AssociationProxy[int] = association_proxy("recipe", "user_id")
+
+    __table_args__ = (
+        Index("ix_meal_plan_item_user_id_date", "user_id", "date"),
+        # For the meal plan version triggers, and recipe deletes cascading
+        Index("ix_meal_plan_item_recipe_id", "recipe_id"),
+        {"postgresql_partition_by": "RANGE (date)"},
+    )
+
+
+# Catches dates no monthly partition has been created for yet
+MEAL_PLAN_ITEM_DEFAULT_PARTITION = (
+    "CREATE TABLE meal_plan_item_default PARTITION OF meal_plan_item DEFAULT"
+)
+
+event.listen(
+    MealPlanItem.__table__, "after_create", DDL(MEAL_PLAN_ITEM_DEFAULT_PARTITION)
+)
+
+
+MEAL_PLAN_ITEM_USER_ID_TRIGGER = """
+CREATE FUNCTION meal_plan_item_set_user_id() RETURNS trigger AS $$
+BEGIN
+    NEW.user_id := (SELECT user_id FROM recipe WHERE id = NEW.recipe_id);
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_user_id
+    BEFORE INSERT OR UPDATE OF recipe_id ON meal_plan_item
+    FOR EACH ROW EXECUTE FUNCTION meal_plan_item_set_user_id();
+"""
+
+event.listen(
+    MealPlanItem.__table__, "after_create", DDL(MEAL_PLAN_ITEM_USER_ID_TRIGGER)
+)
+event.listen(
+    MealPlanItem.__table__,
+    "before_drop",
+    DDL("DROP FUNCTION IF EXISTS meal_plan_item_set_user_id CASCADE"),
+)
+
+
+# Triggers bumping user.meal_plan_version for changes to meal plan items, or
+# to the recipes and ingredients they use, however they're made. Recipes and
+# ingredients only count while a meal plan item or rule uses the recipe, and
+# recipes only for the columns grocery lists read, so background writes such
+# as search vectors don't invalidate anything. Deleting a recipe deletes its
+# meal plan items and rules, whose own triggers bump the version.
+MEAL_PLAN_VERSION_TRIGGERS = """
+CREATE FUNCTION meal_plan_items_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM new_rows);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_recipes_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN new_rows ON recipe.id = new_rows.recipe_id
+            WHERE EXISTS (SELECT FROM meal_plan_item WHERE meal_plan_item.recipe_id = recipe.id)
+            OR EXISTS (SELECT FROM meal_plan_rule WHERE meal_plan_rule.recipe_id = recipe.id)
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT recipe.user_id FROM recipe JOIN old_rows ON recipe.id = old_rows.recipe_id
+            WHERE EXISTS (SELECT FROM meal_plan_item WHERE meal_plan_item.recipe_id = recipe.id)
+            OR EXISTS (SELECT FROM meal_plan_rule WHERE meal_plan_rule.recipe_id = recipe.id)
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_recipe_changed() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT FROM meal_plan_item WHERE meal_plan_item.recipe_id = NEW.id)
+        OR EXISTS (SELECT FROM meal_plan_rule WHERE meal_plan_rule.recipe_id = NEW.id)
+    THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id = NEW.user_id;
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_item REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_item REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_changed();
+
+CREATE TRIGGER meal_plan_item_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_item REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_insert
+    AFTER INSERT ON ingredient REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_update
+    AFTER UPDATE ON ingredient REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+CREATE TRIGGER ingredient_meal_plan_version_delete
+    AFTER DELETE ON ingredient REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_recipes_changed();
+
+-- Transition tables can't be combined with a column list, so this one is
+-- per row, for the rows whose columns actually changed
+CREATE TRIGGER recipe_meal_plan_version_update
+    AFTER UPDATE OF name, servings ON recipe
+    FOR EACH ROW
+    WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.servings IS DISTINCT FROM NEW.servings)
+    EXECUTE FUNCTION meal_plan_recipe_changed();
+"""
+
+# meal_plan_item is created after, and dropped before, the other tables
+event.listen(MealPlanItem.__table__, "after_create", DDL(MEAL_PLAN_VERSION_TRIGGERS))
+event.listen(
+    MealPlanItem.__table__,
+    "before_drop",
+    DDL(
+        "DROP FUNCTION IF EXISTS meal_plan_items_changed, "
+        "meal_plan_recipes_changed, meal_plan_recipe_changed CASCADE"
+    ),
+)
+
+
+# Foreign keys can't reference the ID of a partitioned table on its own, so
+# grocery list items of deleted meal plan items are removed by a trigger
+MEAL_PLAN_ITEM_GROCERY_CLEANUP_TRIGGER = """
+CREATE FUNCTION meal_plan_items_deleted() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM grocery_list_item
+    WHERE meal_plan_item_id IN (SELECT id FROM old_rows);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_item_grocery_cleanup
+    AFTER DELETE ON meal_plan_item REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_items_deleted();
+"""
+
+event.listen(
+    MealPlanItem.__table__,
+    "after_create",
+    DDL(MEAL_PLAN_ITEM_GROCERY_CLEANUP_TRIGGER),
+)
+event.listen(
+    MealPlanItem.__table__,
+    "before_drop",
+    DDL("DROP FUNCTION IF EXISTS meal_plan_items_deleted CASCADE"),
+)
+
+
+class MealPlanRule(Base):
+    """A recurring meal plan item, expanded when a window of the plan is read.
+
+    rrule is an RFC 5545 RRULE, e.g. "FREQ=WEEKLY;BYDAY=TU", starting at
+    start_date which also sets the time of day of each occurrence.
+    """
+
+    __tablename__ = "meal_plan_rule"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    recipe_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("recipe.id", ondelete="CASCADE"), nullable=False
+    )
+    rrule: Mapped[str] = mapped_column(String, nullable=False)
+    start_date: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    # No occurrences after end_date, the rule may also end itself with UNTIL
+    # or COUNT
+    end_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    servings: Mapped[int] = mapped_column(Integer, nullable=False)
+    meal_type: Mapped[str] = mapped_column(String, nullable=False, default="Dinner")
+    user_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("user.id", ondelete="CASCADE"),
+        nullable=False,
+    )
+    recipe: Mapped["Recipe"] = relationship("Recipe")
+    exceptions: Mapped[List["MealPlanRuleException"]] = relationship(
+        "MealPlanRuleException",
+        back_populates="meal_plan_rule",
+        cascade="all, delete-orphan",
+    )
+
+    __table_args__ = (
+        Index("ix_meal_plan_rule_user_id_start_date", "user_id", "start_date"),
+        Index("ix_meal_plan_rule_recipe_id", "recipe_id"),
+    )
+
+
+class MealPlanRuleException(Base):
+    """An occurrence of a rule that was skipped, or overridden by a stored
+    meal plan item."""
+
+    __tablename__ = "meal_plan_rule_exception"
+
+    meal_plan_rule_id: Mapped[int] = mapped_column(
+        Integer,
+        ForeignKey("meal_plan_rule.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    date: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    meal_plan_rule: Mapped["MealPlanRule"] = relationship(
+        "MealPlanRule", back_populates="exceptions"
+    )
+
+
+# Bump user.meal_plan_version for rule changes, like MEAL_PLAN_VERSION_TRIGGERS
+MEAL_PLAN_RULE_VERSION_TRIGGERS = """
+CREATE FUNCTION meal_plan_rules_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM new_rows);
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (SELECT user_id FROM old_rows);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION meal_plan_rule_exceptions_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT meal_plan_rule.user_id FROM meal_plan_rule
+            JOIN new_rows ON meal_plan_rule.id = new_rows.meal_plan_rule_id
+        );
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE "user" SET meal_plan_version = "user".meal_plan_version + 1
+        WHERE "user".id IN (
+            SELECT meal_plan_rule.user_id FROM meal_plan_rule
+            JOIN old_rows ON meal_plan_rule.id = old_rows.meal_plan_rule_id
+        );
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER meal_plan_rule_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_rule REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rules_changed();
+
+CREATE TRIGGER meal_plan_rule_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_rule REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rules_changed();
+
+CREATE TRIGGER meal_plan_rule_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_rule REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rules_changed();
+
+CREATE TRIGGER meal_plan_rule_exception_meal_plan_version_insert
+    AFTER INSERT ON meal_plan_rule_exception REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rule_exceptions_changed();
+
+CREATE TRIGGER meal_plan_rule_exception_meal_plan_version_update
+    AFTER UPDATE ON meal_plan_rule_exception REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rule_exceptions_changed();
+
+CREATE TRIGGER meal_plan_rule_exception_meal_plan_version_delete
+    AFTER DELETE ON meal_plan_rule_exception REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION meal_plan_rule_exceptions_changed();
+"""
+
+# meal_plan_rule_exception is created after, and dropped before, meal_plan_rule
+event.listen(
+    MealPlanRuleException.__table__,
+    "after_create",
+    DDL(MEAL_PLAN_RULE_VERSION_TRIGGERS),
+)
+event.listen(
+    MealPlanRuleException.__table__,
+    "before_drop",
+    DDL(
+        "DROP FUNCTION IF EXISTS meal_plan_rules_changed, "
+        "meal_plan_rule_exceptions_changed CASCADE"
+    ),
+)
 
 
 class GroceryList(Base):
@@ -156,6 +633,10 @@ class GroceryList(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     extra_items: Mapped[str] = mapped_column(String, nullable=False, default="")
+    # Meal plan window the list was built from, kept in sync with meal plan
+    # changes. Lists without one are snapshots.
+    start_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    end_date: Mapped[Optional[datetime]] = mapped_column(DateTime)
     user_id: Mapped[int] = mapped_column(
         Integer,
         ForeignKey("user.id", ondelete="CASCADE"),
@@ -174,13 +655,23 @@ class GroceryListItem(Base):
         Integer, ForeignKey("grocery_list.id", ondelete="CASCADE"), nullable=False
     )
     active: Mapped[bool] = mapped_column(Boolean, nullable=False, default=False)
-    quantity: Mapped[float] = mapped_column(Integer, nullable=False)
+    quantity: Mapped[float] = mapped_column(Float, nullable=False)
     unit: Mapped[Optional[str]] = mapped_column(String)
     name: Mapped[str] = mapped_column(String, nullable=False)
     comment: Mapped[Optional[str]] = mapped_column(String)
     recipe_name: Mapped[str] = mapped_column(String, nullable=False)
     servings: Mapped[int] = mapped_column(Integer, nullable=False)
     extra_items: Mapped[bool] = mapped_column(Boolean, nullable=False)
+    # Source of items added from the meal plan, removed along with it by
+    # MEAL_PLAN_ITEM_GROCERY_CLEANUP_TRIGGER
+    meal_plan_item_id: Mapped[Optional[int]] = mapped_column(Integer, index=True)
+    # Source of items added for an occurrence of a meal plan rule
+    meal_plan_rule_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("meal_plan_rule.id", ondelete="CASCADE"), index=True
+    )
+    ingredient_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("ingredient.id", ondelete="SET NULL")
+    )
     grocery_list: Mapped["GroceryList"] = relationship(
         "GroceryList", back_populates="grocery_list_items"
     )
@@ -1,9 +1,13 @@
+import operator
+from contextlib import contextmanager
+from datetime import date, datetime
 from inspect import get_annotations
 from typing import (
     Any,
     Callable,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
     Tuple,
@@ -13,8 +17,9 @@ from typing import (
 )
 
 from pydantic import BaseConfig, BaseModel, create_model
-from sqlalchemy import Delete, Select, Update
+from sqlalchemy import Delete, Select, Update, func, select
 from sqlalchemy.inspection import inspect
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.properties import ColumnProperty
 
 from server.storage.database import Base
@@ -22,6 +27,14 @@ from server.storage.models import User
 
 SQLAlchemyModelClass = TypeVar("SQLAlchemyModelClass", bound=Base)
 
+RANGE_FILTER_OPERATORS = {
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+}
+RANGE_FILTER_TYPES = (int, float, date, datetime)
+
 SelectSignature = Callable[..., Select[Tuple[SQLAlchemyModelClass]]]
 UpdateSignature = Callable[[Type[SQLAlchemyModelClass]], Update]
 DeleteSignature = Callable[[Type[SQLAlchemyModelClass]], Delete]
@@ -95,6 +108,54 @@ def sqlalchemy_to_pydantic(
     return pydantic_model
 
 
+def range_filter_fields(
+    model_cls: Type[SQLAlchemyModelClass],
+    include_fields: Optional[Iterable[str]] = None,
+) -> Dict[str, Tuple[Any, Any]]:
+    """Optional "<column>__<op>" fields for each orderable column of model_cls.
+
+    Meant as additional_attributes for sqlalchemy_to_pydantic, the resulting
+    schema is the allowlist apply_filters compiles into SQL. Primary and
+    foreign keys are skipped unless named in include_fields.
+    """
+    insp = inspect(model_cls)
+    annotations = get_annotations(model_cls)
+    fields = {}
+    for attr in insp.column_attrs:
+        column = attr.columns[0]
+        if include_fields is not None:
+            if attr.key not in include_fields:
+                continue
+        elif column.primary_key or column.foreign_keys:
+            continue
+
+        col_type = annotations[attr.key].__args__[0]
+        if getattr(col_type, "__name__", None) == "Optional":
+            col_type = col_type.__args__[0]
+        if col_type not in RANGE_FILTER_TYPES:
+            continue
+
+        for op in RANGE_FILTER_OPERATORS:
+            fields[f"{attr.key}__{op}"] = (Optional[col_type], None)
+
+    return fields
+
+
+def apply_filters(
+    query: Select, model_cls: Type[SQLAlchemyModelClass], filters: Dict[str, Any]
+) -> Select:
+    """Filter query by equality for plain keys and by range for "__<op>" keys."""
+    for key, value in filters.items():
+        column_name, _, op = key.partition("__")
+        column = getattr(model_cls, column_name)
+        if op:
+            query = query.filter(RANGE_FILTER_OPERATORS[op](column, value))
+        else:
+            query = query.filter(column == value)
+
+    return query
+
+
 @overload
 def safe_query(
     query_func: SelectSignature,
@@ -133,3 +194,21 @@ def safe_query(
         query = query.filter_by(user_id=user.id)
 
     return query
+
+
+@contextmanager
+def statement_timeout(db: Session, timeout_ms: int) -> Iterator[None]:
+    """Cancel statements in the block that run longer than timeout_ms.
+
+    The block runs in a savepoint, so a cancelled statement only rolls back
+    the block's own work and leaves the rest of the transaction usable.
+    """
+    previous = db.scalar(select(func.current_setting("statement_timeout")))
+    try:
+        with db.begin_nested():
+            db.execute(
+                select(func.set_config("statement_timeout", str(timeout_ms), True))
+            )
+            yield
+    finally:
+        db.execute(select(func.set_config("statement_timeout", previous, True)))
@@ -6,12 +6,19 @@ from datetime import datetime, timedelta
 os.environ["RECIPE_DATABASE_URL"] = "postgresql:///test_recipes"
 os.environ["RECIPE_SECRET_KEY"] = secrets.token_hex(32)
 
+from unittest.mock import patch
+
 from fastapi.testclient import TestClient
 
 from server.storage import models
 from server.storage.database import SessionLocal, Base, engine
 from server.routes.users import hash_password
-from server.dependencies import get_db
+from server.config import CONFIG
+from server.dependencies import get_blob_storage, get_db
+from server.storage.blobs import LocalStorage
+from server.dedup import index_recipe_minhash
+from server.nutrition import set_recipe_nutrition
+from server.search import index_recipe_ingredients, refresh_search_vectors
 
 from server.app import init_app
 
@@ -102,6 +109,8 @@ def db():
                         ),
                     ]
                 )
+                index_recipe_ingredients(recipe)
+                set_recipe_nutrition(recipe)
                 user.recipes.append(recipe)
 
         db.add_all([admin, user_1, user_2])
@@ -124,6 +133,10 @@ def db():
         db.add(grocery_list)
 
         db.flush()
+        refresh_search_vectors(db)
+        index_recipe_minhash(
+            db, [recipe.id for user in [user_1, user_2] for recipe in user.recipes]
+        )
         db.commit()
 
         DB_SEEDED = True
@@ -139,3 +152,12 @@ def db():
 @pytest.fixture(scope="function")
 def client():
     return TestClient(app)
+
+
+@pytest.fixture(scope="function")
+def blob_storage(tmp_path):
+    storage = LocalStorage(str(tmp_path / "static"))
+    app.dependency_overrides[get_blob_storage] = lambda: storage
+    with patch.object(CONFIG, "upload_staging_dir", str(tmp_path / "staging")):
+        yield storage
+    del app.dependency_overrides[get_blob_storage]
@@ -0,0 +1,175 @@
+import asyncio
+import threading
+
+from unittest.mock import patch
+
+from sqlalchemy.orm import Session
+
+from server.events import (
+    CLOSE_EVENT,
+    MAX_QUEUED_EVENTS,
+    RESYNC_EVENT,
+    ChangeListener,
+    ChangeListenerUnavailable,
+    format_sse,
+    notify_change,
+)
+from server.storage import models
+from server.storage.database import engine
+from server.tests.utils import get_token
+
+
+def test_change_listener():
+    async def listen():
+        listener = ChangeListener()
+        queue = await listener.subscribe(1)
+        other_queue = await listener.subscribe(2)
+
+        # Notifications are only sent once committed
+        with Session(engine) as db:
+            notify_change(db, 1, "grocery_list.deleted", {"id": 5})
+            db.rollback()
+            notify_change(db, 1, "grocery_list.deleted", {"id": 6})
+            db.commit()
+
+        event = await asyncio.wait_for(queue.get(), 5)
+        assert event == {"type": "grocery_list.deleted", "data": {"id": 6}}
+        assert queue.empty()
+        assert other_queue.empty()
+
+        listener.unsubscribe(1, queue)
+        listener.unsubscribe(2, other_queue)
+        assert listener.connection is None
+
+    asyncio.run(listen())
+
+
+@patch("server.events.RECONNECT_DELAY_SECONDS", 0)
+def test_change_listener_unavailable(client):
+    async def listen():
+        listener = ChangeListener()
+        with patch.object(listener, "_connect", side_effect=OSError) as connect:
+            try:
+                await listener.subscribe(1)
+            except ChangeListenerUnavailable:
+                pass
+            else:
+                assert False, "subscribed without a connection"
+        assert connect.call_count == 3
+        assert not listener.subscribers
+
+        # Open streams end when reconnecting fails
+        queue: asyncio.Queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+        listener.subscribers[1].add(queue)
+        with patch.object(listener, "_connect", side_effect=OSError):
+            await listener._reconnect()
+        assert queue.get_nowait() == CLOSE_EVENT
+
+    asyncio.run(listen())
+
+    user_1_token = get_token("user_1")
+    with patch(
+        "server.routes.events.change_listener", ChangeListener()
+    ) as listener, patch.object(listener, "_connect", side_effect=OSError):
+        response = client.get(
+            "/api/events", headers={"Authorization": f"Bearer {user_1_token}"}
+        )
+    assert response.status_code == 503
+
+
+def test_change_listener_unsubscribe_while_connecting():
+    async def listen():
+        listener = ChangeListener()
+        release = threading.Event()
+        connection = listener._connect()
+
+        def connect():
+            release.wait(5)
+            return connection
+
+        with patch.object(listener, "_connect", connect):
+            subscribing = asyncio.create_task(listener.subscribe(1))
+            await asyncio.sleep(0.1)
+            connecting = listener.connecting
+
+            # The last subscriber leaving stops the pending connection
+            queue: asyncio.Queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+            listener.subscribers[2].add(queue)
+            listener.unsubscribe(2, queue)
+            await asyncio.sleep(0)
+            assert connecting.cancelled()
+
+            # While a new subscriber's connection is opened in its place
+            release.set()
+            queue = await asyncio.wait_for(subscribing, 5)
+            assert listener.connection is connection
+        listener.unsubscribe(1, queue)
+        assert listener.connection is None
+
+    asyncio.run(listen())
+
+
+def test_change_listener_overflow():
+    listener = ChangeListener()
+    queue: asyncio.Queue = asyncio.Queue(MAX_QUEUED_EVENTS)
+    listener.subscribers[1].add(queue)
+
+    for i in range(MAX_QUEUED_EVENTS + 1):
+        listener.dispatch(1, {"type": "grocery_list.deleted", "data": {"id": i}})
+
+    # Slow clients are told to re-fetch instead of getting a partial stream
+    assert queue.qsize() == 1
+    assert queue.get_nowait() == RESYNC_EVENT
+
+
+def test_format_sse():
+    event = {"type": "grocery_list_items.updated", "data": [{"id": 1, "active": True}]}
+    assert format_sse(event) == (
+        "event: grocery_list_items.updated\n" 'data: [{"id": 1, "active": true}]\n\n'
+    )
+
+
+def test_grocery_list_notifications(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    grocery_list = db.query(models.GroceryList).filter_by(user_id=user_1.id).one()
+
+    response = client.put(
+        f"/api/grocery_lists/{grocery_list.id}",
+        headers=headers,
+        json={"extra_items": "Item 1\nItem 2"},
+    )
+    assert response.status_code == 200
+    items = {item["name"]: item for item in response.json()["grocery_list_items"]}
+
+    with patch("server.grocery.notify_change") as notify:
+        response = client.put(
+            f"/api/grocery_lists/{grocery_list.id}",
+            headers=headers,
+            json={"extra_items": "Item 1\nItem 3"},
+        )
+    assert response.status_code == 200
+    removed = items.pop("Item 2")
+    items.update((item["name"], item) for item in response.json()["grocery_list_items"])
+
+    notify.assert_called_once()
+    _, user_id, event_type, data = notify.call_args.args
+    assert user_id == user_1.id
+    assert event_type == "grocery_list.updated"
+    assert [item["id"] for item in data["added"]] == [items["Item 3"]["id"]]
+    assert data["removed"] == [removed["id"]]
+
+    with patch("server.routes.grocery_list_items.notify_change") as notify:
+        response = client.patch(
+            "/api/grocery_list_items",
+            headers=headers,
+            json=[{"id": items["Item 1"]["id"], "active": False}],
+        )
+    assert response.status_code == 200
+    notify.assert_called_once()
+    assert notify.call_args.args[1:] == (
+        user_1.id,
+        "grocery_list_items.updated",
+        [{"id": items["Item 1"]["id"], "active": False}],
+    )
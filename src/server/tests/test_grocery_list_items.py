@@ -33,3 +33,67 @@ def test_toggle_grocery_list_item(db, client):
         db.query(models.GroceryListItem).filter_by(id=gli.id).one_or_none()
     )
     assert grocery_list_item.active == False
+
+
+def test_toggle_grocery_list_items(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+    grocery_list = db.query(models.GroceryList).filter_by(user_id=user_1.id).one()
+    other_grocery_list = models.GroceryList(user_id=user_2.id)
+    items = [
+        models.GroceryListItem(
+            active=True,
+            quantity=1,
+            name=f"Item {i}",
+            recipe_name="Extra Items",
+            servings=1,
+            extra_items=True,
+        )
+        for i in range(4)
+    ]
+    grocery_list.grocery_list_items.extend(items[:3])
+    other_grocery_list.grocery_list_items.append(items[3])
+    db.add(other_grocery_list)
+    db.flush()
+
+    response = client.patch(
+        "/api/grocery_list_items",
+        headers=headers,
+        json=[
+            {"id": items[0].id, "active": False},
+            {"id": items[1].id, "active": False},
+            {"id": items[1].id, "active": True},
+            {"id": items[2].id, "active": False},
+        ],
+    )
+    assert response.status_code == 200
+    assert sorted(response.json(), key=lambda item: item["id"]) == [
+        {"id": items[0].id, "active": False},
+        {"id": items[1].id, "active": True},
+        {"id": items[2].id, "active": False},
+    ]
+
+    db.expire_all()
+    assert [item.active for item in items] == [False, True, False, True]
+
+    # Items of other users fail the whole batch
+    response = client.patch(
+        "/api/grocery_list_items",
+        headers=headers,
+        json=[
+            {"id": items[0].id, "active": True},
+            {"id": items[3].id, "active": False},
+        ],
+    )
+    assert response.status_code == 404
+    assert (
+        response.json()["detail"]
+        == f"Grocery List Items with IDs [{items[3].id}] do not exist"
+    )
+
+    response = client.patch("/api/grocery_list_items", headers=headers, json=[])
+    assert response.status_code == 200
+    assert response.json() == []
@@ -1,7 +1,9 @@
 from datetime import datetime, timedelta
 
+from server.grocery import grocery_preview_cache
 from server.tests.utils import get_token
 from server.storage import models
+from server.units import MASS, VOLUME, normalize_quantity
 
 
 def test_create_grocery_lists(db, client):
@@ -146,6 +148,36 @@ def test_update_grocery_list(db, client):
     assert grocery_list["extra_items"] == ""
     assert len(grocery_list["grocery_list_items"]) == 0
 
+    # Unchanged lines keep their rows and active state
+    response = client.put(
+        f"/api/grocery_lists/{gl.id}",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+        json={"extra_items": "Item 5\nItem 6"},
+    )
+    assert response.status_code == 200
+    items = {item["name"]: item for item in response.json()["grocery_list_items"]}
+    response = client.put(
+        f"/api/grocery_list_items/{items['Item 5']['id']}/toggle",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 204
+
+    response = client.put(
+        f"/api/grocery_lists/{gl.id}",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+        json={"extra_items": "Item 5\nItem 7\nItem 7"},
+    )
+    assert response.status_code == 200
+    grocery_list_items = response.json()["grocery_list_items"]
+    assert sorted(item["name"] for item in grocery_list_items) == [
+        "Item 5",
+        "Item 7",
+        "Item 7",
+    ]
+    item_5 = next(item for item in grocery_list_items if item["name"] == "Item 5")
+    assert item_5["id"] == items["Item 5"]["id"]
+    assert item_5["active"] is False
+
     # Wrong type for extra items
     response = client.put(
         f"/api/grocery_lists/{gl.id}",
@@ -188,3 +220,273 @@ def test_delete_grocery_list(db, client):
     )
     assert response.status_code == 404
     assert response.json()["detail"] == "Grocery List with ID 1 does not exist"
+
+
+def test_grocery_list_tracks_meal_plan(db, client):
+    user_2_token = get_token("user_2")
+    headers = {"Authorization": f"Bearer {user_2_token}"}
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_2.id).first()
+
+    now = datetime.utcnow()
+    response = client.post(
+        "/api/grocery_lists",
+        headers=headers,
+        json={
+            "start_date": (now - timedelta(days=7)).isoformat(),
+            "end_date": (now + timedelta(days=7)).isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    grocery_list = response.json()
+    assert len(grocery_list["grocery_list_items"]) == 50
+
+    def get_items():
+        response = client.get(
+            f"/api/grocery_lists/{grocery_list['id']}", headers=headers
+        )
+        assert response.status_code == 200
+        return response.json()["grocery_list_items"]
+
+    # Added meal plan items bring their ingredients, scaled to their servings
+    response = client.post(
+        "/api/meal_plan_items",
+        headers=headers,
+        json={"recipe_id": recipe.id, "date": now.isoformat(), "servings": 8},
+    )
+    assert response.status_code == 200
+    meal_plan_item_id = response.json()["id"]
+
+    items = get_items()
+    assert len(items) == 55
+    added = [item for item in items if item["meal_plan_item_id"] == meal_plan_item_id]
+    assert {item["name"]: item["quantity"] for item in added}["salt"] == 4
+    assert all(item["servings"] == 8 for item in added)
+
+    # Rescaling keeps rows and their toggles
+    salt = next(item for item in added if item["name"] == "salt")
+    response = client.put(
+        f"/api/grocery_list_items/{salt['id']}/toggle", headers=headers
+    )
+    assert response.status_code == 204
+
+    response = client.put(
+        f"/api/meal_plan_items/{meal_plan_item_id}",
+        headers=headers,
+        json={"servings": 2},
+    )
+    assert response.status_code == 200
+
+    items = get_items()
+    assert len(items) == 55
+    salt = next(item for item in items if item["id"] == salt["id"])
+    assert salt["quantity"] == 1
+    assert salt["servings"] == 2
+    assert salt["active"] is False
+
+    # Moving an item out of the window removes only its rows
+    response = client.put(
+        f"/api/meal_plan_items/{meal_plan_item_id}",
+        headers=headers,
+        json={"date": (now + timedelta(days=30)).isoformat()},
+    )
+    assert response.status_code == 200
+    items = get_items()
+    assert len(items) == 50
+    assert all(item["meal_plan_item_id"] != meal_plan_item_id for item in items)
+
+    response = client.put(
+        f"/api/meal_plan_items/{meal_plan_item_id}",
+        headers=headers,
+        json={"date": now.isoformat()},
+    )
+    assert response.status_code == 200
+    assert len(get_items()) == 55
+
+    response = client.delete(
+        f"/api/meal_plan_items/{meal_plan_item_id}", headers=headers
+    )
+    assert response.status_code == 200
+    assert len(get_items()) == 50
+
+
+def test_normalize_quantity():
+    assert normalize_quantity(2, "Tablespoons.") == (VOLUME, "tbsp", 2 * 14.7868)
+    assert normalize_quantity(1, "cup") == (VOLUME, "cup", 236.588)
+    assert normalize_quantity(2, "lbs") == (MASS, "lb", 2 * 453.592)
+    assert normalize_quantity(3, "Cloves") == ("clove", "clove", 3)
+    assert normalize_quantity(1, None) == (None, None, 1)
+
+
+def test_consolidated_grocery_list(db, client):
+    user_2_token = get_token("user_2")
+    headers = {"Authorization": f"Bearer {user_2_token}"}
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+
+    recipe = models.Recipe(name="Brine", user_id=user_2.id, servings=2)
+    recipe.ingredients.extend(
+        [
+            models.Ingredient(
+                quantity=1, unit="tablespoons", name="Salt", input="", position=0
+            ),
+            models.Ingredient(
+                quantity=2, unit="cups", name="water", input="", position=1
+            ),
+        ]
+    )
+    db.add(recipe)
+    db.flush()
+    db.add(
+        models.MealPlanItem(
+            recipe_id=recipe.id,
+            date=datetime.utcnow() - timedelta(days=1),
+            servings=4,
+        )
+    )
+    db.flush()
+
+    response = client.post(
+        "/api/grocery_lists",
+        headers=headers,
+        json={
+            "start_date": (datetime.utcnow() - timedelta(days=7)).isoformat(),
+            "end_date": datetime.utcnow().isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    grocery_list = response.json()
+    assert len(grocery_list["grocery_list_items"]) == 52
+
+    response = client.get(
+        f"/api/grocery_lists/{grocery_list['id']}/consolidated", headers=headers
+    )
+    assert response.status_code == 200
+    lines = {line["name"]: line for line in response.json()}
+    assert sorted(lines) == [
+        "onion",
+        "oregano",
+        "red chile",
+        "salt",
+        "water",
+        "whole peeled tomato",
+    ]
+
+    # 20 tsp from the seeded recipes and 2 tbsp from the doubled brine
+    assert lines["salt"]["unit"] == "tbsp"
+    assert abs(lines["salt"]["quantity"] - (20 * 4.92892 / 14.7868 + 2)) < 1e-3
+    assert len(lines["salt"]["items"]) == 11
+    assert lines["water"]["quantity"] == 4
+    assert lines["water"]["unit"] == "cup"
+    assert lines["water"]["active"] is True
+    assert lines["onion"]["quantity"] == 10
+    assert lines["onion"]["unit"] == "small"
+
+
+def test_grocery_list_preview(db, client, monkeypatch):
+    grocery_preview_cache.clear()
+    user_2_token = get_token("user_2")
+    headers = {"Authorization": f"Bearer {user_2_token}"}
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+
+    recipe = models.Recipe(name="Brine", user_id=user_2.id, servings=2)
+    recipe.ingredients.extend(
+        [
+            models.Ingredient(
+                quantity=1, unit="tablespoons", name="Salt", input="", position=0
+            ),
+            models.Ingredient(
+                quantity=2, unit="cups", name="water", input="", position=1
+            ),
+        ]
+    )
+    db.add(recipe)
+    db.flush()
+    date = datetime.utcnow() + timedelta(days=30)
+    db.add(models.MealPlanItem(recipe_id=recipe.id, date=date, servings=4))
+    db.flush()
+
+    params = {
+        "start_date": (date - timedelta(days=1)).isoformat(),
+        "end_date": (date + timedelta(days=1)).isoformat(),
+    }
+    grocery_list_count = db.query(models.GroceryList).count()
+    grocery_list_item_count = db.query(models.GroceryListItem).count()
+
+    response = client.get("/api/grocery_lists/preview", params=params, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [
+        {"name": "salt", "quantity": 2, "unit": "tbsp", "recipe_names": ["Brine"]},
+        {"name": "water", "quantity": 4, "unit": "cup", "recipe_names": ["Brine"]},
+    ]
+    # Nothing is stored
+    assert db.query(models.GroceryList).count() == grocery_list_count
+    assert db.query(models.GroceryListItem).count() == grocery_list_item_count
+
+    # Repeated previews are served from the cache
+    def consolidate(items):
+        raise AssertionError("Preview wasn't cached")
+
+    monkeypatch.setattr("server.grocery.consolidate_grocery_items", consolidate)
+    response = client.get("/api/grocery_lists/preview", params=params, headers=headers)
+    assert response.status_code == 200
+    assert len(response.json()) == 2
+    monkeypatch.undo()
+
+    # Changing the meal plan, or a recipe on it, invalidates the preview
+    response = client.post(
+        "/api/meal_plan_items",
+        headers=headers,
+        json={"recipe_id": recipe.id, "date": date.isoformat(), "servings": 2},
+    )
+    assert response.status_code == 200
+    response = client.get("/api/grocery_lists/preview", params=params, headers=headers)
+    assert response.status_code == 200
+    assert [line["quantity"] for line in response.json()] == [3, 6]
+
+    recipe.ingredients[1].quantity = 4
+    db.flush()
+    response = client.get("/api/grocery_lists/preview", params=params, headers=headers)
+    assert response.status_code == 200
+    assert [line["quantity"] for line in response.json()] == [3, 12]
+
+    # Only changes the preview reads count, to recipes on the meal plan
+    def meal_plan_version():
+        db.expire(user_2)
+        return user_2.meal_plan_version
+
+    version = meal_plan_version()
+    recipe.favorite = True
+    recipe.nutrition = "120 calories"
+    unplanned = models.Recipe(name="Stock", user_id=user_2.id, servings=4)
+    unplanned.ingredients.append(
+        models.Ingredient(quantity=1, unit="", name="onion", input="", position=0)
+    )
+    db.add(unplanned)
+    db.flush()
+    unplanned.name = "Vegetable Stock"
+    unplanned.ingredients[0].quantity = 2
+    db.flush()
+    assert meal_plan_version() == version
+
+    recipe.name = "Salt Brine"
+    db.flush()
+    assert meal_plan_version() == version + 1
+    response = client.get("/api/grocery_lists/preview", params=params, headers=headers)
+    assert response.json()[0]["recipe_names"] == ["Salt Brine"]
+
+    # Deleting a recipe removes it from the meal plan
+    db.delete(recipe)
+    db.flush()
+    assert meal_plan_version() > version + 1
+    response = client.get("/api/grocery_lists/preview", params=params, headers=headers)
+    assert response.json() == []
+
+    # Other users' meal plans aren't included
+    user_1_token = get_token("user_1")
+    response = client.get(
+        "/api/grocery_lists/preview",
+        params=params,
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == []
@@ -0,0 +1,132 @@
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+from server.image_gc import collect_orphaned_images
+from server.storage import models
+
+OLD_MTIME = time.time() - 2 * 60 * 60
+
+
+def write_object(storage, key, data=b"image", old=True):
+    path = storage.local_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+    if old:
+        os.utime(path, (OLD_MTIME, OLD_MTIME))
+
+
+def blob_key(image_hash):
+    return f"blobs/{image_hash[:2]}/{image_hash[2:4]}/{image_hash}"
+
+
+def test_collect_orphaned_images(db, blob_storage):
+    user_1 = db.query(models.User).filter_by(username="user_1").one_or_none()
+    recipes = db.query(models.Recipe).filter_by(user_id=user_1.id).all()
+
+    # Blob referenced by a recipe
+    used_hash = "a" * 64
+    db.add(
+        models.ImageBlob(
+            hash=used_hash,
+            key=f"{blob_key(used_hash)}.jpg",
+            mime_type="image/jpeg",
+            size=5,
+            ref_count=1,
+        )
+    )
+    db.flush()
+    recipes[0].image_hash = used_hash
+    recipes[0].image_url = blob_storage.url(f"{blob_key(used_hash)}.jpg")
+    write_object(blob_storage, f"{blob_key(used_hash)}.jpg")
+    write_object(blob_storage, f"{blob_key(used_hash)}_320w.webp")
+
+    # Blob orphaned long ago
+    orphan_hash = "b" * 64
+    db.add(
+        models.ImageBlob(
+            hash=orphan_hash,
+            key=f"{blob_key(orphan_hash)}.jpg",
+            mime_type="image/jpeg",
+            size=6,
+            ref_count=0,
+            orphaned_at=datetime.utcnow() - timedelta(days=2),
+        )
+    )
+    write_object(blob_storage, f"{blob_key(orphan_hash)}.jpg", b"orphan")
+    write_object(blob_storage, f"{blob_key(orphan_hash)}_320w.webp", b"small")
+
+    # Blob with a drifted reference count is only orphaned, not deleted yet
+    drifted_hash = "c" * 64
+    db.add(
+        models.ImageBlob(
+            hash=drifted_hash,
+            key=f"{blob_key(drifted_hash)}.jpg",
+            mime_type="image/jpeg",
+            size=5,
+            ref_count=3,
+        )
+    )
+    write_object(blob_storage, f"{blob_key(drifted_hash)}.jpg")
+
+    # Blob file without a row
+    write_object(blob_storage, f"{blob_key('d' * 64)}.png", b"no row")
+
+    # Legacy upload still in use, with a derivative
+    legacy_name = str(uuid.uuid4())
+    recipes[1].image_url = blob_storage.url(f"{user_1.id}/{legacy_name}.png")
+    write_object(blob_storage, f"{user_1.id}/{legacy_name}.png")
+    write_object(blob_storage, f"{user_1.id}/{legacy_name}_320w.jpg")
+
+    # Legacy upload replaced by a later upload, and one that's too recent
+    old_name = str(uuid.uuid4())
+    write_object(blob_storage, f"{user_1.id}/{old_name}.jpg", b"legacy")
+    write_object(blob_storage, f"{user_1.id}/{old_name}_320w.webp", b"legacy")
+    recent_name = str(uuid.uuid4())
+    write_object(blob_storage, f"{user_1.id}/{recent_name}.jpg", old=False)
+
+    # Abandoned staging file and unrelated static file
+    write_object(blob_storage, ".staging/tmpabc.tmp", b"staged")
+    write_object(blob_storage, "favicon.ico")
+    db.flush()
+
+    # Dry run doesn't delete anything
+    with patch.object(db, "commit", db.flush):
+        report = collect_orphaned_images(
+            db, blob_storage, timedelta(hours=1), batch_size=2, dry_run=True
+        )
+    assert report.deleted_blobs == 1
+    assert report.deleted_files == 6
+    assert len(list(blob_storage.iter_objects())) == 13
+
+    with patch.object(db, "commit", db.flush):
+        report = collect_orphaned_images(
+            db, blob_storage, timedelta(hours=1), batch_size=2
+        )
+
+    assert report.reconciled_blobs == 1
+    assert report.deleted_blobs == 1
+    assert report.deleted_files == 6
+    assert report.reclaimed_bytes == len(b"orphansmallno rowlegacylegacystaged")
+
+    remaining = sorted(obj.key for obj in blob_storage.iter_objects())
+    assert remaining == sorted(
+        [
+            f"{blob_key(used_hash)}.jpg",
+            f"{blob_key(used_hash)}_320w.webp",
+            f"{blob_key(drifted_hash)}.jpg",
+            f"{user_1.id}/{legacy_name}.png",
+            f"{user_1.id}/{legacy_name}_320w.jpg",
+            f"{user_1.id}/{recent_name}.jpg",
+            "favicon.ico",
+        ]
+    )
+
+    assert db.query(models.ImageBlob).filter_by(hash=orphan_hash).one_or_none() is None
+    drifted = db.query(models.ImageBlob).filter_by(hash=drifted_hash).one()
+    db.refresh(drifted)
+    assert drifted.ref_count == 0
+    assert drifted.orphaned_at is not None
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from server.tests.utils import get_token
 from server.storage import models
@@ -221,3 +221,189 @@ def test_delete_meal_plan_item(db, client):
         db.query(models.MealPlanItem).filter_by(user_id=user_1.id).all()
     )
     assert deleted_meal_plan_item not in new_meal_plan_items
+
+
+def test_meal_plan_calendar(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    recipes = db.query(models.Recipe).filter_by(user_id=user_1.id).all()
+
+    start_date = datetime(2030, 1, 7)
+    for days, recipe in [(0, recipes[0]), (0, recipes[1]), (2, recipes[0])]:
+        db.add(
+            models.MealPlanItem(
+                recipe_id=recipe.id,
+                date=start_date + timedelta(days=days, hours=18),
+                servings=2,
+            )
+        )
+    db.flush()
+
+    params = {
+        "start_date": start_date.isoformat(),
+        "end_date": (start_date + timedelta(days=7)).isoformat(),
+    }
+    response = client.get(
+        "/api/meal_plan_items/calendar", params=params, headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert list(data["days"]) == ["2030-01-07", "2030-01-09"]
+    assert [item["recipe_id"] for item in data["days"]["2030-01-07"]] == [
+        recipes[0].id,
+        recipes[1].id,
+    ]
+    assert all(
+        item["user_id"] == user_1.id
+        for items in data["days"].values()
+        for item in items
+    )
+    # Each recipe is summarized once
+    assert [recipe["id"] for recipe in data["recipes"]] == [
+        recipes[0].id,
+        recipes[1].id,
+    ]
+    assert data["recipes"][0]["name"] == recipes[0].name
+    assert "ingredients" not in data["recipes"][0]
+
+    # Unchanged windows revalidate to an empty 304
+    etag = response.headers["etag"]
+    response = client.get(
+        "/api/meal_plan_items/calendar",
+        params=params,
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # Changes to a recipe on the calendar change the ETag
+    recipes[1].name = "Renamed"
+    db.flush()
+    response = client.get(
+        "/api/meal_plan_items/calendar",
+        params=params,
+        headers={**headers, "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert response.json()["recipes"][1]["name"] == "Renamed"
+
+    # Other users' meal plans aren't included
+    user_2_token = get_token("user_2")
+    response = client.get(
+        "/api/meal_plan_items/calendar",
+        params=params,
+        headers={"Authorization": f"Bearer {user_2_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == {"days": {}, "recipes": []}
+
+
+def test_bulk_meal_plan_items(db, client):
+    user_2_token = get_token("user_2")
+    headers = {"Authorization": f"Bearer {user_2_token}"}
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+    recipes = db.query(models.Recipe).filter_by(user_id=user_2.id).all()
+    other_recipe = db.query(models.Recipe).filter_by(user_id=user_1.id).first()
+
+    week = datetime(2030, 2, 4)
+    items = [
+        {"recipe_id": recipes[0].id, "date": week.isoformat(), "servings": 2},
+        {
+            "recipe_id": recipes[1].id,
+            "date": (week + timedelta(days=1)).isoformat(),
+            "servings": 4,
+            "meal_type": "Lunch",
+        },
+        {
+            "recipe_id": recipes[0].id,
+            "date": (week + timedelta(days=6)).isoformat(),
+            "servings": 1,
+        },
+    ]
+
+    # Nothing is created when any recipe isn't the user's
+    response = client.post(
+        "/api/meal_plan_items/bulk",
+        headers=headers,
+        json=items + [{**items[0], "recipe_id": other_recipe.id}],
+    )
+    assert response.status_code == 404
+    assert str(other_recipe.id) in response.json()["detail"]
+    assert db.query(models.MealPlanItem).filter_by(user_id=user_2.id).count() == 10
+
+    response = client.post("/api/meal_plan_items/bulk", headers=headers, json=items)
+    assert response.status_code == 200
+    created = response.json()
+    assert [item["recipe_id"] for item in created] == [
+        recipes[0].id,
+        recipes[1].id,
+        recipes[0].id,
+    ]
+    assert [item["meal_type"] for item in created] == ["Dinner", "Lunch", "Dinner"]
+    assert all(item["user_id"] == user_2.id for item in created)
+
+    # A grocery list for the following week picks up the copies
+    next_week = week + timedelta(days=7)
+    response = client.post(
+        "/api/grocery_lists",
+        headers=headers,
+        json={
+            "start_date": next_week.isoformat(),
+            "end_date": (next_week + timedelta(days=7)).isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    grocery_list_id = response.json()["id"]
+    assert response.json()["grocery_list_items"] == []
+
+    response = client.post(
+        "/api/meal_plan_items/copy",
+        headers=headers,
+        json={
+            "start_date": week.isoformat(),
+            "end_date": (week + timedelta(days=7)).isoformat(),
+            "target_date": next_week.isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    copies = response.json()
+    assert len(copies) == 3
+    for item, copy in zip(created, copies):
+        assert copy["id"] != item["id"]
+        assert copy["recipe_id"] == item["recipe_id"]
+        assert copy["servings"] == item["servings"]
+        assert copy["meal_type"] == item["meal_type"]
+        assert copy["user_id"] == user_2.id
+        assert datetime.fromisoformat(copy["date"]) == datetime.fromisoformat(
+            item["date"]
+        ) + timedelta(days=7)
+
+    response = client.get(f"/api/grocery_lists/{grocery_list_id}", headers=headers)
+    assert {
+        item["meal_plan_item_id"] for item in response.json()["grocery_list_items"]
+    } == {copy["id"] for copy in copies}
+
+    # Range deletes only remove the window's items
+    response = client.delete(
+        "/api/meal_plan_items",
+        headers=headers,
+        params={
+            "start_date": next_week.isoformat(),
+            "end_date": (next_week + timedelta(days=7)).isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()] == [copy["id"] for copy in copies]
+    assert (
+        db.query(models.MealPlanItem)
+        .filter(models.MealPlanItem.id.in_([copy["id"] for copy in copies]))
+        .count()
+        == 0
+    )
+    assert db.query(models.MealPlanItem).filter_by(user_id=user_2.id).count() == 13
+
+    response = client.get(f"/api/grocery_lists/{grocery_list_id}", headers=headers)
+    assert response.json()["grocery_list_items"] == []
@@ -0,0 +1,137 @@
+from datetime import datetime
+
+from sqlalchemy import delete, select, text
+
+from server.partitions import maintain_meal_plan_partitions
+from server.storage import models
+from server.tests.utils import get_token
+
+DATES = [
+    datetime(2029, 12, 10, 18),
+    datetime(2030, 2, 20, 18),
+    datetime(2030, 5, 1, 18),
+    datetime(2030, 8, 3, 18),
+    datetime(2031, 1, 1, 18),
+]
+
+
+def partitions_of(db, meal_plan_items):
+    return [
+        db.scalar(
+            text(
+                "SELECT tableoid::regclass::text FROM meal_plan_item "
+                "WHERE id = :id AND date = :date"
+            ),
+            {"id": meal_plan_item.id, "date": meal_plan_item.date},
+        )
+        for meal_plan_item in meal_plan_items
+    ]
+
+
+def test_maintain_meal_plan_partitions(db, client):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_1.id).first()
+    meal_plan_items = [
+        models.MealPlanItem(recipe_id=recipe.id, date=date, servings=2)
+        for date in DATES
+    ]
+    db.add_all(meal_plan_items)
+    db.flush()
+    assert set(partitions_of(db, meal_plan_items)) == {"meal_plan_item_default"}
+
+    report = maintain_meal_plan_partitions(
+        db, datetime(2030, 6, 15), months_ahead=2, archive_months=3
+    )
+    assert report.archived == []
+    assert report.created == [
+        f"meal_plan_item_2030_{month:02}" for month in range(3, 9)
+    ]
+    assert partitions_of(db, meal_plan_items) == [
+        "meal_plan_item_archive",
+        "meal_plan_item_archive",
+        "meal_plan_item_2030_05",
+        "meal_plan_item_2030_08",
+        "meal_plan_item_default",
+    ]
+
+    # Queries for a recent window only read its months
+    plan = "\n".join(
+        db.scalars(
+            text(
+                "EXPLAIN SELECT * FROM meal_plan_item "
+                "WHERE user_id = :user_id AND date >= :start_date AND date <= :end_date"
+            ),
+            {
+                "user_id": user_1.id,
+                "start_date": datetime(2030, 5, 1),
+                "end_date": datetime(2030, 6, 30),
+            },
+        )
+    )
+    assert "meal_plan_item_2030_05" in plan
+    assert "meal_plan_item_2030_06" in plan
+    assert "meal_plan_item_archive" not in plan
+    assert "meal_plan_item_default" not in plan
+
+    # Months fall into the archive as the horizon moves on
+    report = maintain_meal_plan_partitions(
+        db, datetime(2030, 9, 15), months_ahead=2, archive_months=3
+    )
+    assert report.archived == [
+        f"meal_plan_item_2030_{month:02}" for month in range(3, 6)
+    ]
+    assert report.created == [
+        f"meal_plan_item_2030_{month:02}" for month in range(9, 12)
+    ]
+    report = maintain_meal_plan_partitions(
+        db, datetime(2030, 9, 16), months_ahead=2, archive_months=3
+    )
+    assert report.archived == report.created == []
+    assert partitions_of(db, meal_plan_items)[2] == "meal_plan_item_archive"
+
+    # Archived items are still read through the parent table
+    user_1_token = get_token("user_1")
+    response = client.get(
+        "/api/meal_plan_items",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+        params={
+            "start_date": DATES[0].isoformat(),
+            "end_date": DATES[-1].isoformat(),
+        },
+    )
+    assert response.status_code == 200
+    assert [item["id"] for item in response.json()["items"]] == [
+        meal_plan_item.id for meal_plan_item in meal_plan_items
+    ]
+
+
+def test_delete_meal_plan_item_grocery_list_items(db):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_1.id).first()
+    meal_plan_item = models.MealPlanItem(recipe_id=recipe.id, date=DATES[2], servings=2)
+    db.add(meal_plan_item)
+    db.flush()
+    grocery_list = models.GroceryList(user_id=user_1.id, extra_items="")
+    grocery_list.grocery_list_items.append(
+        models.GroceryListItem(
+            quantity=1,
+            name="onion",
+            recipe_name=recipe.name,
+            servings=2,
+            extra_items=False,
+            meal_plan_item_id=meal_plan_item.id,
+        )
+    )
+    db.add(grocery_list)
+    db.flush()
+
+    # Also when meal plan items are removed along with their recipe
+    db.execute(delete(models.Recipe).filter_by(id=recipe.id))
+    assert (
+        db.scalar(
+            select(models.GroceryListItem.id).filter_by(
+                meal_plan_item_id=meal_plan_item.id
+            )
+        )
+        is None
+    )
@@ -0,0 +1,319 @@
+from datetime import datetime, timedelta
+
+from server.recurrence import advance_rrule, parse_rrule
+from server.tests.utils import get_token
+from server.storage import models
+
+TUESDAYS = [datetime(2030, 1, day, 18) for day in [1, 8, 15, 22, 29]]
+JANUARY = {
+    "start_date": datetime(2030, 1, 1).isoformat(),
+    "end_date": datetime(2030, 1, 31).isoformat(),
+}
+
+
+def create_taco_tuesday(client, headers, recipe, **kwargs):
+    response = client.post(
+        "/api/meal_plan_rules",
+        headers=headers,
+        json={
+            "recipe_id": recipe.id,
+            "rrule": "FREQ=WEEKLY;BYDAY=TU",
+            "start_date": TUESDAYS[0].isoformat(),
+            "servings": 2,
+            **kwargs,
+        },
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_create_meal_plan_rule(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_1.id).first()
+    other_recipe = db.query(models.Recipe).filter_by(user_id=user_2.id).first()
+
+    response = client.post(
+        "/api/meal_plan_rules",
+        headers=headers,
+        json={
+            "recipe_id": recipe.id,
+            "rrule": "FREQ=SOMETIMES",
+            "start_date": TUESDAYS[0].isoformat(),
+            "servings": 2,
+        },
+    )
+    assert response.status_code == 400
+
+    # Rules recur at most once a day, and end soon enough if they count
+    for rrule in [
+        "FREQ=HOURLY",
+        "FREQ=MINUTELY;INTERVAL=5",
+        "FREQ=DAILY;BYHOUR=8,18",
+        "FREQ=DAILY;COUNT=100000",
+    ]:
+        response = client.post(
+            "/api/meal_plan_rules",
+            headers=headers,
+            json={
+                "recipe_id": recipe.id,
+                "rrule": rrule,
+                "start_date": TUESDAYS[0].isoformat(),
+                "servings": 2,
+            },
+        )
+        assert response.status_code == 400
+
+    response = client.post(
+        "/api/meal_plan_rules",
+        headers=headers,
+        json={
+            "recipe_id": other_recipe.id,
+            "rrule": "FREQ=WEEKLY;BYDAY=TU",
+            "start_date": TUESDAYS[0].isoformat(),
+            "servings": 2,
+        },
+    )
+    assert response.status_code == 404
+
+    meal_plan_rule = create_taco_tuesday(client, headers, recipe)
+    assert meal_plan_rule["user_id"] == user_1.id
+    assert meal_plan_rule["meal_type"] == "Dinner"
+    assert meal_plan_rule["exceptions"] == []
+
+    # Occurrences are listed for the window without being stored
+    response = client.get("/api/meal_plan_items", headers=headers, params=JANUARY)
+    assert response.status_code == 200
+    items = response.json()["items"]
+    assert [datetime.fromisoformat(item["date"]) for item in items] == TUESDAYS
+    for item in items:
+        assert item["id"] is None
+        assert item["meal_plan_rule_id"] == meal_plan_rule["id"]
+        assert item["recipe_id"] == recipe.id
+        assert item["servings"] == 2
+    assert (
+        db.query(models.MealPlanItem)
+        .filter(models.MealPlanItem.date >= TUESDAYS[0])
+        .count()
+        == 0
+    )
+
+    # Filters apply to occurrences too
+    response = client.get(
+        "/api/meal_plan_items",
+        headers=headers,
+        params={**JANUARY, "meal_type": "Lunch"},
+    )
+    assert response.json()["items"] == []
+
+    response = client.get(
+        "/api/meal_plan_items/calendar", headers=headers, params=JANUARY
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert list(data["days"]) == [date.date().isoformat() for date in TUESDAYS]
+    assert [recipe_summary["id"] for recipe_summary in data["recipes"]] == [recipe.id]
+
+    # Rules end with end_date, or with their own UNTIL or COUNT
+    response = client.put(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}",
+        headers=headers,
+        json={"end_date": datetime(2030, 1, 20).isoformat()},
+    )
+    assert response.status_code == 200
+    response = client.get("/api/meal_plan_items", headers=headers, params=JANUARY)
+    assert len(response.json()["items"]) == 3
+
+    response = client.put(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}",
+        headers=headers,
+        json={"rrule": "FREQ=WEEKLY;BYDAY=TU;COUNT=2"},
+    )
+    assert response.status_code == 200
+    response = client.get("/api/meal_plan_items", headers=headers, params=JANUARY)
+    assert len(response.json()["items"]) == 2
+
+    # Rules of other users aren't visible
+    user_2_token = get_token("user_2")
+    response = client.get(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}",
+        headers={"Authorization": f"Bearer {user_2_token}"},
+    )
+    assert response.status_code == 404
+    response = client.get(
+        "/api/meal_plan_items",
+        headers={"Authorization": f"Bearer {user_2_token}"},
+        params=JANUARY,
+    )
+    assert response.json()["items"] == []
+
+
+def test_meal_plan_rule_started_years_ago(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_1.id).first()
+    create_taco_tuesday(
+        client, headers, recipe, start_date=datetime(2010, 1, 5, 18).isoformat()
+    )
+
+    response = client.get("/api/meal_plan_items", headers=headers, params=JANUARY)
+    assert response.status_code == 200
+    assert [
+        datetime.fromisoformat(item["date"]) for item in response.json()["items"]
+    ] == TUESDAYS
+
+    # Expansion starts at the period before the window, not the rule's start
+    window_start = datetime.fromisoformat(JANUARY["start_date"])
+    for rule, start_date, moved_start in [
+        ("FREQ=WEEKLY;BYDAY=TU", datetime(2010, 1, 5, 18), datetime(2029, 12, 25, 18)),
+        ("FREQ=DAILY;INTERVAL=3", datetime(2010, 1, 1, 8), datetime(2029, 12, 29, 8)),
+        ("FREQ=MONTHLY", datetime(2001, 1, 31, 12), datetime(2029, 12, 31, 12)),
+        ("FREQ=YEARLY", datetime(2004, 2, 29, 12), datetime(2028, 2, 29, 12)),
+    ]:
+        parsed = parse_rrule(rule, start_date)
+        moved = advance_rrule(parsed, window_start)
+        assert moved._dtstart == moved_start
+        window_end = window_start + timedelta(days=400)
+        assert moved.between(window_start, window_end, inc=True) == parsed.between(
+            window_start, window_end, inc=True
+        )
+
+    # Occurrences before the window count towards COUNT
+    parsed = parse_rrule("FREQ=DAILY;COUNT=3", datetime(2029, 12, 30, 18))
+    assert advance_rrule(parsed, window_start) is parsed
+    assert parsed.between(window_start, window_start + timedelta(days=7)) == [
+        datetime(2030, 1, 1, 18)
+    ]
+
+
+def test_meal_plan_rule_exceptions(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    recipes = db.query(models.Recipe).filter_by(user_id=user_1.id).all()
+    meal_plan_rule = create_taco_tuesday(client, headers, recipes[0])
+
+    response = client.delete(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}/occurrences/"
+        f"{(TUESDAYS[1] + timedelta(days=1)).isoformat()}",
+        headers=headers,
+    )
+    assert response.status_code == 404
+
+    response = client.delete(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}/occurrences/"
+        f"{TUESDAYS[1].isoformat()}",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert [
+        datetime.fromisoformat(exception["date"])
+        for exception in response.json()["exceptions"]
+    ] == [TUESDAYS[1]]
+
+    response = client.put(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}/occurrences/"
+        f"{TUESDAYS[2].isoformat()}",
+        headers=headers,
+        json={"recipe_id": recipes[1].id, "servings": 6},
+    )
+    assert response.status_code == 200
+    override = response.json()
+    assert override["id"] is not None
+    assert override["recipe_id"] == recipes[1].id
+    assert override["servings"] == 6
+    assert override["meal_type"] == "Dinner"
+    assert override["meal_plan_rule_id"] == meal_plan_rule["id"]
+    assert datetime.fromisoformat(override["date"]) == TUESDAYS[2]
+
+    # Overridden occurrences can't be overridden again
+    response = client.put(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}/occurrences/"
+        f"{TUESDAYS[2].isoformat()}",
+        headers=headers,
+        json={"servings": 1},
+    )
+    assert response.status_code == 404
+
+    response = client.get("/api/meal_plan_items", headers=headers, params=JANUARY)
+    items = response.json()["items"]
+    assert [datetime.fromisoformat(item["date"]) for item in items] == [
+        TUESDAYS[0],
+        TUESDAYS[2],
+        TUESDAYS[3],
+        TUESDAYS[4],
+    ]
+    assert [item["id"] for item in items] == [None, override["id"], None, None]
+    assert items[1]["servings"] == 6
+
+    # Deleting the rule keeps its overrides
+    response = client.delete(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}", headers=headers
+    )
+    assert response.status_code == 200
+    response = client.get("/api/meal_plan_items", headers=headers, params=JANUARY)
+    items = response.json()["items"]
+    assert [item["id"] for item in items] == [override["id"]]
+    assert items[0]["meal_plan_rule_id"] is None
+
+
+def test_meal_plan_rule_grocery_list(db, client):
+    user_2_token = get_token("user_2")
+    headers = {"Authorization": f"Bearer {user_2_token}"}
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_2.id).first()
+    meal_plan_rule = create_taco_tuesday(client, headers, recipe)
+
+    first_week = {
+        "start_date": TUESDAYS[0].isoformat(),
+        "end_date": (TUESDAYS[1] + timedelta(days=1)).isoformat(),
+    }
+    response = client.post("/api/grocery_lists", headers=headers, json=first_week)
+    assert response.status_code == 200
+    grocery_list = response.json()
+    # The seeded recipes have 5 ingredients for 4 servings
+    items = grocery_list["grocery_list_items"]
+    assert len(items) == 10
+    assert {item["meal_plan_rule_id"] for item in items} == {meal_plan_rule["id"]}
+    assert {item["meal_plan_item_id"] for item in items} == {None}
+    assert {item["quantity"] for item in items if item["name"] == "salt"} == {1}
+
+    response = client.get(
+        "/api/grocery_lists/preview", headers=headers, params=first_week
+    )
+    assert response.status_code == 200
+    salt = [line for line in response.json() if line["name"] == "salt"]
+    assert salt == [
+        {"name": "salt", "quantity": 2, "unit": "tsp", "recipe_names": [recipe.name]}
+    ]
+
+    # Lists follow changes to the rule
+    response = client.put(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}",
+        headers=headers,
+        json={"servings": 4},
+    )
+    assert response.status_code == 200
+    response = client.get(f"/api/grocery_lists/{grocery_list['id']}", headers=headers)
+    items = response.json()["grocery_list_items"]
+    assert len(items) == 10
+    assert {item["quantity"] for item in items if item["name"] == "salt"} == {2}
+
+    response = client.delete(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}/occurrences/"
+        f"{TUESDAYS[0].isoformat()}",
+        headers=headers,
+    )
+    assert response.status_code == 200
+    response = client.get(f"/api/grocery_lists/{grocery_list['id']}", headers=headers)
+    assert len(response.json()["grocery_list_items"]) == 5
+
+    response = client.delete(
+        f"/api/meal_plan_rules/{meal_plan_rule['id']}", headers=headers
+    )
+    assert response.status_code == 200
+    response = client.get(f"/api/grocery_lists/{grocery_list['id']}", headers=headers)
+    assert response.json()["grocery_list_items"] == []
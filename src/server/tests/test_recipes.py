@@ -1,11 +1,29 @@
+import hashlib
 import os
+import time
 
-from unittest.mock import mock_open, patch, MagicMock
+from unittest.mock import patch, MagicMock
 
+from PIL import Image
 from typing import cast
+from server.config import CONFIG
+from server.dedup import minhash_signature, recipe_shingles
+from server.images import generate_image_derivatives, publish_image_derivatives
+from server.nutrition import parse_nutrition
+from server.similarity import (
+    RecipeSimilarityIndex,
+    SimilarityIndexCache,
+    similarity_cache,
+)
+from server.search import (
+    autocomplete_cache,
+    index_recipe_ingredients,
+    normalize_ingredient_name,
+)
 from server.tests.utils import get_token
 from server.tests.test_recipes_data import user_1_test_recipes
 from server.storage import models
+from server.storage.database import SessionLocal
 
 
 def test_authentication(client):
@@ -99,7 +117,680 @@ def test_list_recipes(db, client):
     assert len(data["items"]) == 0
 
 
-def test_upload_recipe_image(db, client):
+def test_list_recipes_range_filters(db, client):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    db.add_all(
+        [
+            models.Recipe(
+                name="Omelette", user_id=user_1.id, prep_time=5, cook_time=10
+            ),
+            models.Recipe(
+                name="Party Chili",
+                user_id=user_1.id,
+                prep_time=20,
+                cook_time=90,
+                servings=12,
+                favorite=True,
+            ),
+        ]
+    )
+    db.flush()
+
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    def list_names(**params):
+        response = client.get("/api/recipes", params=params, headers=headers)
+        assert response.status_code == 200
+        return [item["name"] for item in response.json()["items"]]
+
+    response = client.get(
+        "/api/recipes", params={"total_time__lte": 30}, headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["name"] for item in data["items"]] == ["Omelette"]
+    assert data["items"][0]["total_time"] == 15
+
+    assert list_names(servings__gte=6) == ["Party Chili"]
+    assert list_names(prep_time__gt=5, prep_time__lt=60) == ["Party Chili"]
+    assert list_names(total_time__gte=100, favorite=True) == ["Party Chili"]
+    assert len(list_names(total_time=180)) == 10
+
+    # Only declared fields are filters, anything else is ignored
+    assert len(list_names(user_id__gte=0)) == 12
+
+    response = client.get(
+        "/api/recipes", params={"servings__gte": "many"}, headers=headers
+    )
+    assert response.status_code == 422
+
+
+def test_parse_nutrition():
+    assert parse_nutrition("300 calories per serving")["calories"] == 300
+    assert parse_nutrition(
+        "Calories: 450, Protein: 30g, Total Fat: 12 g, Saturated Fat: 4g, "
+        "Sodium: 1.2g"
+    ) == {
+        "calories": 450,
+        "protein": 30,
+        "fat": 12,
+        "carbohydrates": None,
+        "fiber": None,
+        "sugar": None,
+        "sodium": 1200,
+    }
+    assert parse_nutrition("Protein 12g Fat 5g Carbs 40g") == {
+        "calories": None,
+        "protein": 12,
+        "fat": 5,
+        "carbohydrates": 40,
+        "fiber": None,
+        "sugar": None,
+        "sodium": None,
+    }
+    assert parse_nutrition(
+        "Per serving: 250 kcal | 800mg sodium | 10g sugars (2g added sugars)"
+    ) == {
+        "calories": 250,
+        "protein": None,
+        "fat": None,
+        "carbohydrates": None,
+        "fiber": None,
+        "sugar": 10,
+        "sodium": 800,
+    }
+    assert set(parse_nutrition("Low in calcium").values()) == {None}
+    assert set(parse_nutrition("").values()) == {None}
+
+
+def test_list_recipes_by_nutrition(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    response = client.post(
+        "/api/recipes",
+        json={"name": "Green Salad", "nutrition": "120 kcal, 3g protein"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    recipe = response.json()
+    assert recipe["calories"] == 120
+    assert recipe["protein"] == 3
+
+    response = client.get(
+        "/api/recipes", params={"calories__lte": 200}, headers=headers
+    )
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()["items"]] == ["Green Salad"]
+
+    # Nutrient columns follow the nutrition text and can't be set directly
+    response = client.put(
+        f"/api/recipes/{recipe['id']}",
+        json={"nutrition": "Calories: 640, Protein: 41 g", "calories": 1},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["calories"] == 640
+
+    response = client.get(
+        "/api/recipes",
+        params={"calories__gte": 500, "protein__gt": 40},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()["items"]] == ["Green Salad"]
+
+    response = client.get(
+        "/api/recipes", params={"calories__lte": 300}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()["total"] == 10
+
+
+def test_list_recipes_by_tags(db, client):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    vegetarian = models.Tag(name="Vegetarian", user_id=user_1.id)
+    quick = models.Tag(name="Quick", user_id=user_1.id)
+    dessert = models.Tag(name="Dessert", user_id=user_1.id)
+    db.add_all(
+        [
+            models.Recipe(
+                name="Caprese Salad", user_id=user_1.id, tags=[vegetarian, quick]
+            ),
+            models.Recipe(
+                name="Fruit Salad", user_id=user_1.id, tags=[vegetarian, quick, dessert]
+            ),
+            models.Recipe(name="Lentil Stew", user_id=user_1.id, tags=[vegetarian]),
+        ]
+    )
+    db.flush()
+
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    def list_names(**params):
+        response = client.get("/api/recipes", params=params, headers=headers)
+        assert response.status_code == 200
+        return [item["name"] for item in response.json()["items"]]
+
+    assert list_names(tags_all=[vegetarian.id]) == [
+        "Caprese Salad",
+        "Fruit Salad",
+        "Lentil Stew",
+    ]
+    assert list_names(tags_all=[vegetarian.id, quick.id]) == [
+        "Caprese Salad",
+        "Fruit Salad",
+    ]
+    assert list_names(tags_all=[vegetarian.id, quick.id], tags_none=[dessert.id]) == [
+        "Caprese Salad"
+    ]
+    assert list_names(tags_any=[quick.id, dessert.id]) == [
+        "Caprese Salad",
+        "Fruit Salad",
+    ]
+    assert len(list_names(tags_none=[vegetarian.id])) == 10
+
+    # Filters combine with the other list parameters
+    assert list_names(tags_any=[vegetarian.id], name="Lentil Stew") == ["Lentil Stew"]
+
+    # Tags of other users never match
+    user_2_token = get_token("user_2")
+    response = client.get(
+        "/api/recipes",
+        params={"tags_all": [vegetarian.id]},
+        headers={"Authorization": f"Bearer {user_2_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["items"] == []
+
+
+def test_list_recipes_facets(db, client):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    vegetarian = models.Tag(name="Vegetarian", user_id=user_1.id)
+    db.add(
+        models.Recipe(
+            name="Lentil Stew",
+            user_id=user_1.id,
+            favorite=True,
+            tags=[vegetarian, user_1.tags[0]],
+        )
+    )
+    db.flush()
+
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    # Facets are only computed on request
+    response = client.get("/api/recipes", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["facets"] is None
+
+    # Unfiltered facets come from the denormalized counts
+    response = client.get("/api/recipes", params={"facets": True}, headers=headers)
+    assert response.status_code == 200
+    facets = {facet["name"]: facet["count"] for facet in response.json()["facets"]}
+    assert facets == {
+        "Tag 0": 11,
+        **{f"Tag {i}": 10 for i in range(1, 10)},
+        "Vegetarian": 1,
+    }
+
+    # Filtered facets only count matching recipes
+    response = client.get(
+        "/api/recipes",
+        params={"facets": True, "favorite": True, "size": 1},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    assert data["facets"] == [
+        {"id": user_1.tags[0].id, "name": "Tag 0", "count": 1},
+        {"id": vegetarian.id, "name": "Vegetarian", "count": 1},
+    ]
+
+    response = client.get(
+        "/api/recipes",
+        params={"facets": True, "tags_none": [vegetarian.id]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    facets = {facet["name"]: facet["count"] for facet in response.json()["facets"]}
+    assert facets == {f"Tag {i}": 10 for i in range(10)}
+
+
+def test_search_recipes(db, client):
+    user_1_token = get_token("user_1")
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    # Matches in the name rank above matches in ingredients and description
+    response = client.post(
+        "/api/recipes",
+        json={"name": "Oregano Chicken", "description": "Weeknight dinner"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    oregano_id = response.json()["id"]
+
+    response = client.get(
+        "/api/recipes/search", params={"q": "oregano"}, headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 11
+    assert data["items"][0]["id"] == oregano_id
+    for item in data["items"]:
+        assert item["user_id"] == user_1.id
+
+    # Web search syntax with stemming, phrases and exclusion
+    response = client.get(
+        "/api/recipes/search",
+        params={"q": '"red chile" -oregano'},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert response.json()["total"] == 0
+
+    response = client.get(
+        "/api/recipes/search", params={"q": "tomato chicken"}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()["total"] == 0
+
+    # Updates are reflected in the index
+    response = client.put(
+        f"/api/recipes/{oregano_id}",
+        json={"steps": ["Roast the chicken on a bed of tomatoes"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+
+    response = client.get(
+        "/api/recipes/search", params={"q": "tomato chicken"}, headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    assert data["items"][0]["id"] == oregano_id
+
+    # Pagination
+    response = client.get(
+        "/api/recipes/search",
+        params={"q": "onion", "size": 3, "page": 2},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 10
+    assert len(data["items"]) == 3
+
+    # Admin searches across all users
+    admin_token = get_token("admin")
+    response = client.get(
+        "/api/recipes/search",
+        params={"q": "onion"},
+        headers={"Authorization": f"Bearer {admin_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["total"] == 20
+
+
+def test_autocomplete_recipes(db, client):
+    autocomplete_cache.clear()
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    db.add_all(
+        [
+            models.Recipe(name="Chicken Tikka Masala", user_id=user_1.id),
+            models.Recipe(name="Chickpea Curry", user_id=user_1.id),
+            models.Recipe(name="Roast Chicken", user_id=user_1.id),
+        ]
+    )
+    db.flush()
+
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    # Prefix matches come before fuzzy ones
+    response = client.get(
+        "/api/recipes/autocomplete", params={"q": "chick"}, headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+    names = [item["name"] for item in data]
+    assert set(names[:2]) == {"Chicken Tikka Masala", "Chickpea Curry"}
+    assert names[2] == "Roast Chicken"
+    assert set(data[0].keys()) == {"id", "name"}
+
+    # Typos still match
+    response = client.get(
+        "/api/recipes/autocomplete", params={"q": "Chiken Tika"}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["name"] == "Chicken Tikka Masala"
+
+    # LIKE wildcards are matched literally
+    response = client.get(
+        "/api/recipes/autocomplete", params={"q": "%"}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+    response = client.get(
+        "/api/recipes/autocomplete",
+        params={"q": "recipe", "limit": 3},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["name"] for item in data] == ["Recipe 0", "Recipe 1", "Recipe 2"]
+
+    # Results are cached per user and prefix
+    db.add(models.Recipe(name="Chicken Soup", user_id=user_1.id))
+    db.flush()
+    response = client.get(
+        "/api/recipes/autocomplete", params={"q": "Chick "}, headers=headers
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+
+    # Other users' recipes are never suggested
+    user_2_token = get_token("user_2")
+    response = client.get(
+        "/api/recipes/autocomplete",
+        params={"q": "chick"},
+        headers={"Authorization": f"Bearer {user_2_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_normalize_ingredient_name():
+    assert normalize_ingredient_name("Red Chiles,") == "red chile"
+    assert normalize_ingredient_name("whole peeled tomatoes") == "whole peeled tomato"
+    assert normalize_ingredient_name("Cherries") == "cherry"
+    assert normalize_ingredient_name("watercress") == "watercress"
+    assert normalize_ingredient_name("couscous") == "couscous"
+    assert normalize_ingredient_name("  ") == ""
+
+
+def test_cookable_recipes(db, client):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    recipe = models.Recipe(name="Salted Onions", user_id=user_1.id)
+    recipe.ingredients.extend(
+        [
+            models.Ingredient(name="onion", input="1 onion", position=0),
+            models.Ingredient(name="salt", input="salt", position=1),
+        ]
+    )
+    index_recipe_ingredients(recipe)
+    db.add(recipe)
+    db.flush()
+
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+    response = client.get(
+        "/api/recipes/cookable",
+        params={"ingredients": ["Onions", "Salt", "butter"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 11
+    assert data["items"][0]["recipe"]["id"] == recipe.id
+    assert data["items"][0]["coverage"] == 1
+    assert data["items"][0]["missing"] == []
+    assert data["items"][1]["recipe"]["name"] == "Recipe 0"
+    assert data["items"][1]["coverage"] == 0.4
+    assert data["items"][1]["missing"] == [
+        "oregano",
+        "red chile",
+        "whole peeled tomato",
+    ]
+    for item in data["items"]:
+        assert item["recipe"]["user_id"] == user_1.id
+
+    response = client.get(
+        "/api/recipes/cookable",
+        params={"ingredients": ["onion", "salt"], "min_coverage": 0.5},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["total"] == 1
+    assert data["items"][0]["recipe"]["id"] == recipe.id
+
+    response = client.get(
+        "/api/recipes/cookable", params={"ingredients": ["butter"]}, headers=headers
+    )
+    assert response.status_code == 200
+    assert response.json()["total"] == 0
+
+
+def test_similar_recipes(db, client):
+    similarity_cache.clear()
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    italian = models.Tag(name="Italian", user_id=user_1.id)
+    recipes = [
+        models.Recipe(
+            name="Margherita Pizza",
+            user_id=user_1.id,
+            ingredient_names=["basil", "flour", "mozzarella", "tomato"],
+            tags=[italian],
+        ),
+        models.Recipe(
+            name="Caprese Salad",
+            user_id=user_1.id,
+            ingredient_names=["basil", "mozzarella", "tomato"],
+            tags=[italian],
+        ),
+        models.Recipe(
+            name="Pancakes",
+            user_id=user_1.id,
+            ingredient_names=["egg", "flour", "milk"],
+        ),
+        models.Recipe(
+            name="Bruschetta",
+            user_id=user_1.id,
+            ingredient_names=["basil", "bread", "tomato"],
+        ),
+    ]
+    db.add_all(recipes)
+    db.flush()
+    pizza, salad, pancakes, bruschetta = recipes
+
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    response = client.get(f"/api/recipes/{pizza.id}/similar", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["recipe"]["name"] for item in data] == [
+        "Caprese Salad",
+        "Bruschetta",
+        "Pancakes",
+    ]
+    assert 0 < data[2]["score"] < data[1]["score"] < data[0]["score"] < 1
+    bruschetta_score = data[1]["score"]
+
+    response = client.get(
+        f"/api/recipes/{pizza.id}/similar", params={"limit": 1}, headers=headers
+    )
+    assert response.status_code == 200
+    assert [item["recipe"]["id"] for item in response.json()] == [salad.id]
+
+    # Seeded recipes share every feature with each other
+    seeded = db.query(models.Recipe).filter_by(user_id=user_1.id, name="Recipe 0").one()
+    response = client.get(f"/api/recipes/{seeded.id}/similar", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 9
+    assert all(abs(item["score"] - 1) < 1e-9 for item in data)
+
+    # Changes through the API are picked up without a full reload
+    response = client.put(
+        f"/api/recipes/{bruschetta.id}", json={"tag_ids": [italian.id]}, headers=headers
+    )
+    assert response.status_code == 200
+    response = client.delete(f"/api/recipes/{pancakes.id}", headers=headers)
+    assert response.status_code == 200
+
+    response = client.get(f"/api/recipes/{pizza.id}/similar", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert [item["recipe"]["name"] for item in data] == [
+        "Caprese Salad",
+        "Bruschetta",
+    ]
+    assert data[1]["score"] > bruschetta_score
+
+    # Changed rows were replaced in place of a rebuild, scoring like one
+    index = similarity_cache.indexes.get(user_1.id)
+    rebuilt = RecipeSimilarityIndex(user_1.id)
+    rebuilt.load(db)
+    assert index.matrix.shape[0] == rebuilt.matrix.shape[0] + 2
+    matches = index.similar(pizza.id, 10)
+    rebuilt_matches = rebuilt.similar(pizza.id, 10)
+    assert [id for id, _ in matches] == [id for id, _ in rebuilt_matches]
+    for (_, score), (_, rebuilt_score) in zip(matches, rebuilt_matches):
+        assert abs(score - rebuilt_score) < 1e-9
+
+    # Recipes of other users are out of reach
+    user_2_token = get_token("user_2")
+    response = client.get(
+        f"/api/recipes/{pizza.id}/similar",
+        headers={"Authorization": f"Bearer {user_2_token}"},
+    )
+    assert response.status_code == 404
+
+
+def test_similarity_invalidated_after_commit(db):
+    similarity_cache.clear()
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_1.id).first()
+    index = similarity_cache.get(db, user_1.id)
+
+    with SessionLocal() as session:
+        similarity_cache.invalidate(session, user_1.id, recipe.id)
+        assert recipe.id in index.pending
+        # A concurrent lookup refreshing before the commit sees the old row
+        similarity_cache.get(db, user_1.id)
+        assert recipe.id not in index.pending
+        session.commit()
+    assert recipe.id in index.pending
+
+    with SessionLocal() as session:
+        similarity_cache.invalidate(session, user_1.id, recipe.id)
+        similarity_cache.get(db, user_1.id)
+        session.rollback()
+    assert recipe.id not in index.pending
+
+
+def test_similarity_cache_eviction(db):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+
+    # Only the most recently used users keep an index
+    cache = SimilarityIndexCache(ttl=300, max_size=1)
+    index = cache.get(db, user_1.id)
+    assert cache.get(db, user_1.id) is index
+    cache.get(db, user_2.id)
+    assert cache.indexes.get(user_1.id) is None
+    assert cache.get(db, user_1.id) is not index
+
+    # Expired indexes are loaded afresh
+    cache = SimilarityIndexCache(ttl=300, max_size=10)
+    index = cache.get(db, user_1.id)
+    with patch("server.cache.time.monotonic", return_value=time.monotonic() + 300):
+        assert cache.get(db, user_1.id) is not index
+
+
+def test_minhash_signature():
+    steps = ["Whisk the eggs with the milk", "Fold in the flour and rest"]
+    shingles = recipe_shingles(["egg", "flour", "milk"], steps)
+    assert "i:egg" in shingles
+    assert "s:whisk the eggs" in shingles
+    assert "s:milk fold in" in shingles
+    assert recipe_shingles(None, ["Serve"]) == {"s:serve"}
+    assert minhash_signature(set()) is None
+
+    signature = minhash_signature(shingles)
+    assert (signature == minhash_signature(set(shingles))).all()
+
+    # Equal values estimate the Jaccard similarity, here 10 / 12
+    similar = minhash_signature(shingles | {"i:salt", "i:sugar"})
+    different = minhash_signature({"i:bread", "i:butter"})
+    assert (signature == similar).mean() > 0.5
+    assert (signature == different).mean() < 0.2
+
+
+def test_duplicate_recipes(db, client):
+    user_1_token = get_token("user_1")
+    headers = {"Authorization": f"Bearer {user_1_token}"}
+
+    steps = [
+        "Mash the bananas in a large bowl until smooth",
+        "Stir in the melted butter, sugar, egg and vanilla",
+        "Fold in the flour, baking soda and a pinch of salt",
+        "Pour into a buttered loaf pan and bake for an hour",
+    ]
+    recipe_ids = []
+    for name, recipe_steps in [
+        ("Banana Bread", steps),
+        (
+            "Banana Bread (copy)",
+            steps[:-1] + ["Pour into a greased loaf pan and bake for an hour"],
+        ),
+        ("Omelette", ["Whisk the eggs", "Cook them in butter over low heat"]),
+    ]:
+        response = client.post(
+            "/api/recipes", json={"name": name, "steps": recipe_steps}, headers=headers
+        )
+        assert response.status_code == 200
+        recipe_ids.append(response.json()["id"])
+    banana_bread, copy, _ = recipe_ids
+
+    response = client.get("/api/recipes/duplicates", headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert len(data) == 2
+    # Seeded recipes are identical
+    assert {recipe["name"] for recipe in data[0]["recipes"]} == {
+        f"Recipe {i}" for i in range(10)
+    }
+    assert data[0]["similarity"] == 1
+    assert [recipe["id"] for recipe in data[1]["recipes"]] == [banana_bread, copy]
+    assert 0.6 <= data[1]["similarity"] < 1
+
+    response = client.get(
+        "/api/recipes/duplicates", params={"threshold": 1}, headers=headers
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+    # Edits and deletes update the index
+    response = client.put(
+        f"/api/recipes/{copy}",
+        json={"steps": ["Toast the bread and serve with jam"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    response = client.get("/api/recipes/duplicates", headers=headers)
+    assert len(response.json()) == 1
+
+    response = client.put(
+        f"/api/recipes/{copy}", json={"steps": steps}, headers=headers
+    )
+    assert response.status_code == 200
+    response = client.delete(f"/api/recipes/{banana_bread}", headers=headers)
+    assert response.status_code == 200
+    response = client.get("/api/recipes/duplicates", headers=headers)
+    assert len(response.json()) == 1
+
+
+def test_upload_recipe_image(db, client, blob_storage):
     user_1_token = get_token("user_1")
     user_1 = db.query(models.User).filter_by(username="user_1").one_or_none()
 
@@ -115,8 +806,12 @@ def test_upload_recipe_image(db, client):
     with open(fpath, "rb") as f:
         image_data = f.read()
 
-    mocked_open = MagicMock()
-    with patch("builtins.open", mock_open(mocked_open)):
+    # Derivatives are generated once committed, the original stands in until then
+    scheduled = []
+    with patch.object(CONFIG, "image_derivative_widths", [1, 2]), patch(
+        "server.routes.recipes.schedule_image_derivatives",
+        lambda db, storage, key: scheduled.append(key),
+    ):
         response = client.post(
             f"/api/recipes/{recipe_1.id}/upload_image",
             headers={"Authorization": f"Bearer {user_1_token}"},
@@ -124,7 +819,49 @@ def test_upload_recipe_image(db, client):
         )
 
     assert response.status_code == 200
-    mocked_open.assert_called()
+    r_1 = response.json()
+    image_hash = hashlib.sha256(image_data).hexdigest()
+    key = f"blobs/{image_hash[:2]}/{image_hash[2:4]}/{image_hash}.jpg"
+    assert r_1["image_url"] == f"/static/{key}"
+    assert r_1["image_hash"] == image_hash
+    assert r_1["thumbnail_url"] == r_1["image_url"]
+    assert r_1["srcset"] is None
+    assert scheduled == [key]
+    with blob_storage.open(key) as f:
+        assert f.read() == image_data
+
+    with patch.object(CONFIG, "image_derivative_widths", [1, 2]):
+        generate_image_derivatives(blob_storage, key)
+        publish_image_derivatives(db, blob_storage, key)
+    response = client.get(
+        f"/api/recipes/{recipe_1.id}",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    r_1 = response.json()
+
+    stem = r_1["image_url"][: -len(".jpg")]
+    assert r_1["thumbnail_url"] == f"{stem}_1w.jpg"
+    assert r_1["srcset"] == {
+        "image/webp": f"{stem}_1w.webp 1w, {stem}_2w.webp 2w",
+        "image/jpeg": f"{stem}_1w.jpg 1w, {stem}_2w.jpg 2w",
+    }
+    stored_keys = sorted(obj.key for obj in blob_storage.iter_objects())
+    assert stored_keys == sorted(
+        [key]
+        + [
+            f"{key[: -len('.jpg')]}_{width}w{extension}"
+            for width in [1, 2]
+            for extension in [".jpg", ".webp"]
+        ]
+    )
+    thumbnail_key = blob_storage.key_for_url(r_1["thumbnail_url"])
+    with blob_storage.open(thumbnail_key) as f, Image.open(f) as thumbnail:
+        assert thumbnail.width == 1
+
+    blob = db.query(models.ImageBlob).filter_by(hash=image_hash).one()
+    assert blob.ref_count == 1
+    assert blob.size == len(image_data)
+    assert blob.mime_type == "image/jpeg"
 
     # Invalid mime type
     recipe_2 = (
@@ -136,21 +873,29 @@ def test_upload_recipe_image(db, client):
 
     fpath = os.path.join(os.path.dirname(__file__), "assets/dummy.pdf")
     with open(fpath, "rb") as f:
-        image_data = f.read()
+        pdf_data = f.read()
 
-    mocked_open = MagicMock()
-    with patch("builtins.open", mock_open(mocked_open)):
-        response = client.post(
-            f"/api/recipes/{recipe_2.id}/upload_image",
-            headers={"Authorization": f"Bearer {user_1_token}"},
-            files={"file": ("assets/dummy.pdf", image_data, "application/pdf")},
-        )
+    response = client.post(
+        f"/api/recipes/{recipe_2.id}/upload_image",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+        files={"file": ("assets/dummy.pdf", pdf_data, "application/pdf")},
+    )
     assert response.status_code == 400
 
     data = response.json()
     assert data["detail"] == "Image file format not supported: application/pdf"
 
-    # Different recipe has same image
+    # Image larger than the maximum size
+    with patch.object(CONFIG, "max_image_size", len(image_data) - 1):
+        response = client.post(
+            f"/api/recipes/{recipe_2.id}/upload_image",
+            headers={"Authorization": f"Bearer {user_1_token}"},
+            files={"file": ("assets/black_square.jpg", image_data, "image/jpeg")},
+        )
+    assert response.status_code == 413
+    assert os.listdir(CONFIG.upload_staging_dir) == []
+
+    # Different recipes with the same image share one blob
     recipe_3 = (
         db.query(models.Recipe)
         .filter_by(user_id=user_1.id)
@@ -158,69 +903,62 @@ def test_upload_recipe_image(db, client):
         .one()
     )
 
-    recipe_4 = (
-        db.query(models.Recipe)
-        .filter_by(user_id=user_1.id)
-        .filter_by(name="Recipe 4")
-        .one()
-    )
-
-    fpath = os.path.join(os.path.dirname(__file__), "assets/black_square.jpg")
-    with open(fpath, "rb") as f:
-        image_data = f.read()
-
-    mocked_open = MagicMock()
-    with patch("builtins.open", mock_open(mocked_open)):
+    mocked_schedule = MagicMock()
+    with patch.object(CONFIG, "image_derivative_widths", [1, 2]), patch(
+        "server.routes.recipes.schedule_image_derivatives", mocked_schedule
+    ):
         response = client.post(
             f"/api/recipes/{recipe_3.id}/upload_image",
             headers={"Authorization": f"Bearer {user_1_token}"},
             files={"file": ("assets/black_square.jpg", image_data, "image/jpeg")},
         )
-        assert response.status_code == 200
-
-        mocked_open.assert_called()
-        r_3 = response.json()
-        assert r_3["image_url"] != None
-
-        response = client.post(
-            f"/api/recipes/{recipe_4.id}/upload_image",
-            headers={"Authorization": f"Bearer {user_1_token}"},
-            files={"file": ("assets/black_square.jpg", image_data, "image/jpeg")},
-        )
-        assert response.status_code == 200
+    assert response.status_code == 200
 
-        mocked_open.assert_called()
-        r_4 = response.json()
-        assert r_4["image_url"] != None
+    r_3 = response.json()
+    assert r_3["image_url"] == r_1["image_url"]
+    assert r_3["thumbnail_url"] == r_1["thumbnail_url"]
+    mocked_schedule.assert_not_called()
 
-        assert r_3["image_url"] != r_4["image_url"]
+    db.refresh(blob)
+    assert blob.ref_count == 2
+    assert sorted(obj.key for obj in blob_storage.iter_objects()) == stored_keys
 
     # Recipe already has image
-    original_image_url = recipe_1.image_url
-    assert original_image_url != None
-
     fpath = os.path.join(os.path.dirname(__file__), "assets/blue_square.png")
     with open(fpath, "rb") as f:
-        image_data = f.read()
+        png_data = f.read()
 
-    mocked_open = MagicMock()
-    mocked_unlink = MagicMock()
-    with patch("builtins.open", mock_open(mocked_open)), patch(
-        "os.unlink", mocked_unlink
-    ):
+    mocked_schedule = MagicMock()
+    with patch("server.routes.recipes.schedule_image_derivatives", mocked_schedule):
         response = client.post(
             f"/api/recipes/{recipe_1.id}/upload_image",
             headers={"Authorization": f"Bearer {user_1_token}"},
-            files={"file": ("assets/blue_square.png", image_data, "image/jpeg")},
+            files={"file": ("assets/blue_square.png", png_data, "image/jpeg")},
         )
 
     assert response.status_code == 200
 
-    mocked_open.assert_called()
-    mocked_unlink.assert_called()
+    mocked_schedule.assert_called_once()
     r_1 = response.json()
-    assert r_1["image_url"] != None
-    assert original_image_url != r_1["image_url"]
+    assert r_1["image_url"] != r_3["image_url"]
+    assert r_1["image_url"].endswith(".png")
+    assert r_1["thumbnail_url"] == r_1["image_url"]
+    assert r_1["srcset"] is None
+
+    db.refresh(blob)
+    assert blob.ref_count == 1
+    assert blob.orphaned_at is None
+
+    # Deleting the last recipe using a blob orphans it
+    response = client.delete(
+        f"/api/recipes/{recipe_3.id}",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 200
+
+    db.refresh(blob)
+    assert blob.ref_count == 0
+    assert blob.orphaned_at is not None
 
 
 def test_create_recipe(db, client):
@@ -397,3 +1135,83 @@ def test_delete_recipe(db, client):
 
     new_recipes = db.query(models.Recipe).filter_by(user_id=user_1.id).all()
     assert original_recipe not in new_recipes
+
+
+def test_clone_recipe(db, client):
+    user_1_token = get_token("user_1")
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    user_2 = db.query(models.User).filter_by(username="user_2").one()
+    recipe = db.query(models.Recipe).filter_by(user_id=user_1.id).first()
+    other_recipe = db.query(models.Recipe).filter_by(user_id=user_2.id).first()
+    tag = recipe.tags[0]
+    recipe_count = tag.recipe_count
+
+    image_hash = "c" * 64
+    db.add(
+        models.ImageBlob(
+            hash=image_hash,
+            key=f"blobs/cc/cc/{image_hash}.jpg",
+            mime_type="image/jpeg",
+            size=5,
+            ref_count=1,
+        )
+    )
+    db.flush()
+    recipe.image_hash = image_hash
+    recipe.image_url = f"/static/blobs/cc/cc/{image_hash}.jpg"
+    db.flush()
+
+    response = client.post(
+        f"/api/recipes/{other_recipe.id}/clone",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 404
+
+    # Ingredients are copied as they are, not parsed again
+    with patch(
+        "server.routes.recipes.parse_ingredient", side_effect=AssertionError
+    ) as mocked_parse:
+        response = client.post(
+            f"/api/recipes/{recipe.id}/clone",
+            headers={"Authorization": f"Bearer {user_1_token}"},
+        )
+    assert response.status_code == 200
+    mocked_parse.assert_not_called()
+
+    original = client.get(
+        f"/api/recipes/{recipe.id}",
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    ).json()
+    clone = response.json()
+    assert clone["id"] != recipe.id
+    for key in ["name", "image_url", "image_hash", "servings", "total_time"]:
+        assert clone[key] == original[key]
+    for key in ["ingredients", "steps"]:
+        assert [
+            {k: v for k, v in row.items() if k not in ("id", "recipe_id")}
+            for row in clone[key]
+        ] == [
+            {k: v for k, v in row.items() if k not in ("id", "recipe_id")}
+            for row in original[key]
+        ]
+        assert {row["recipe_id"] for row in clone[key]} == {clone["id"]}
+    assert [tag["id"] for tag in clone["tags"]] == [
+        tag["id"] for tag in original["tags"]
+    ]
+
+    db.refresh(tag)
+    assert tag.recipe_count == recipe_count + 1
+    blob = db.query(models.ImageBlob).filter_by(hash=image_hash).one()
+    db.refresh(blob)
+    assert blob.ref_count == 2
+
+    # Derived data is copied too, so the clone is found as a duplicate
+    cloned = db.query(models.Recipe).filter_by(id=clone["id"]).one()
+    assert cloned.minhash == recipe.minhash
+    assert cloned.search_vector == recipe.search_vector
+    buckets = db.query(
+        models.RecipeLSHBucket.band, models.RecipeLSHBucket.bucket
+    ).order_by(models.RecipeLSHBucket.band)
+    assert buckets.filter_by(recipe_id=clone["id"]).all() == (
+        buckets.filter_by(recipe_id=recipe.id).all()
+    )
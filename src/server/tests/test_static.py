@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import os
+import shutil
+
+import pytest
+
+from server.config import CONFIG
+from server.static import ImmutableFileResponse
+
+IMAGE_DATA = bytes(range(256)) * 4
+IMAGE_HASH = hashlib.sha256(IMAGE_DATA).hexdigest()
+IMAGE_URL = f"/static/blobs/{IMAGE_HASH[:2]}/{IMAGE_HASH[2:4]}/{IMAGE_HASH}.jpg"
+
+
+@pytest.fixture(scope="function")
+def static_image():
+    path = os.path.join(CONFIG.static_dir, IMAGE_URL.removeprefix("/static/"))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(IMAGE_DATA)
+    yield path
+    shutil.rmtree(os.path.join(CONFIG.static_dir, "blobs", IMAGE_HASH[:2]))
+
+
+def test_immutable_headers(client, static_image):
+    response = client.get(IMAGE_URL)
+    assert response.status_code == 200
+    assert response.content == IMAGE_DATA
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["etag"] == f'"{IMAGE_HASH}"'
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-type"] == "image/jpeg"
+    assert response.headers["content-length"] == str(len(IMAGE_DATA))
+
+    # Revalidation
+    response = client.get(IMAGE_URL, headers={"If-None-Match": f'"{IMAGE_HASH}"'})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    response = client.get(IMAGE_URL, headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+    # HEAD
+    response = client.head(IMAGE_URL)
+    assert response.status_code == 200
+    assert response.content == b""
+    assert response.headers["content-length"] == str(len(IMAGE_DATA))
+
+
+def test_range_requests(client, static_image):
+    response = client.get(IMAGE_URL, headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == IMAGE_DATA[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(IMAGE_DATA)}"
+    assert response.headers["content-length"] == "10"
+
+    # Open ended and suffix ranges
+    response = client.get(IMAGE_URL, headers={"Range": "bytes=1000-"})
+    assert response.status_code == 206
+    assert response.content == IMAGE_DATA[1000:]
+
+    response = client.get(IMAGE_URL, headers={"Range": "bytes=-24"})
+    assert response.status_code == 206
+    assert response.content == IMAGE_DATA[-24:]
+
+    # Ranges past the end are clamped
+    response = client.get(IMAGE_URL, headers={"Range": "bytes=1020-5000"})
+    assert response.status_code == 206
+    assert response.content == IMAGE_DATA[1020:]
+
+    # Unsatisfiable range
+    response = client.get(IMAGE_URL, headers={"Range": "bytes=5000-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(IMAGE_DATA)}"
+
+    # Multiple ranges and stale If-Range fall back to the whole file
+    response = client.get(IMAGE_URL, headers={"Range": "bytes=0-1,5-6"})
+    assert response.status_code == 200
+    assert response.content == IMAGE_DATA
+
+    response = client.get(
+        IMAGE_URL, headers={"Range": "bytes=0-1", "If-Range": '"other"'}
+    )
+    assert response.status_code == 200
+    assert response.content == IMAGE_DATA
+
+    response = client.get(
+        IMAGE_URL, headers={"Range": "bytes=0-1", "If-Range": f'"{IMAGE_HASH}"'}
+    )
+    assert response.status_code == 206
+    assert response.content == IMAGE_DATA[:2]
+
+
+def test_hidden_paths_not_served(client):
+    staging_dir = os.path.join(CONFIG.static_dir, ".staging")
+    os.makedirs(staging_dir, exist_ok=True)
+    with open(os.path.join(staging_dir, "upload.tmp"), "wb") as f:
+        f.write(IMAGE_DATA)
+
+    response = client.get("/static/.staging/upload.tmp")
+    assert response.status_code == 404
+
+    os.unlink(os.path.join(staging_dir, "upload.tmp"))
+
+
+def test_zerocopy(static_image):
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"range", b"bytes=100-199")],
+        "extensions": {"http.response.zerocopy": {}},
+    }
+    messages = []
+
+    async def send(message):
+        if message["type"] == "http.response.zerocopy":
+            message["file"].seek(message["offset"])
+            message = {**message, "data": message["file"].read(message["count"])}
+        messages.append(message)
+
+    response = ImmutableFileResponse(static_image, os.stat(static_image), scope)
+    asyncio.run(response(scope, None, send))
+
+    assert messages[0]["status"] == 206
+    assert messages[1]["type"] == "http.response.zerocopy"
+    assert messages[1]["offset"] == 100
+    assert messages[1]["count"] == 100
+    assert messages[1]["data"] == IMAGE_DATA[100:200]
@@ -1,3 +1,6 @@
+from sqlalchemy import delete
+
+from server.search import autocomplete_cache
 from server.tests.utils import get_token
 from server.storage import models
 
@@ -43,6 +46,78 @@ def test_list_tags(db, client):
     assert data["items"][0]["name"] == "Tag 5"
 
 
+def test_autocomplete_tags(db, client):
+    autocomplete_cache.clear()
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    db.add_all(
+        [
+            models.Tag(name="Vegetarian", user_id=user_1.id),
+            models.Tag(name="Vegan", user_id=user_1.id),
+        ]
+    )
+    db.flush()
+
+    user_1_token = get_token("user_1")
+    response = client.get(
+        "/api/tags/autocomplete",
+        params={"q": "veg"},
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 200
+    assert [item["name"] for item in response.json()] == ["Vegan", "Vegetarian"]
+
+    response = client.get(
+        "/api/tags/autocomplete",
+        params={"q": "vegitarian"},
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json()[0]["name"] == "Vegetarian"
+
+    response = client.get(
+        "/api/tags/autocomplete",
+        params={"q": "  "},
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_tag_recipe_count(db, client):
+    user_1 = db.query(models.User).filter_by(username="user_1").one()
+    tag = models.Tag(name="Soup", user_id=user_1.id)
+    db.add(tag)
+    db.flush()
+    assert tag.recipe_count == 0
+
+    recipes = [
+        models.Recipe(name=f"Soup {i}", user_id=user_1.id, tags=[tag]) for i in range(3)
+    ]
+    db.add_all(recipes)
+    db.flush()
+    db.refresh(tag)
+    assert tag.recipe_count == 3
+
+    recipes[0].tags.clear()
+    db.flush()
+    db.refresh(tag)
+    assert tag.recipe_count == 2
+
+    # Rows removed by ON DELETE CASCADE are counted too
+    db.execute(delete(models.Recipe).filter_by(id=recipes[1].id))
+    db.refresh(tag)
+    assert tag.recipe_count == 1
+
+    user_1_token = get_token("user_1")
+    response = client.get(
+        "/api/tags",
+        params={"name": "Soup"},
+        headers={"Authorization": f"Bearer {user_1_token}"},
+    )
+    assert response.status_code == 200
+    assert response.json()["items"][0]["recipe_count"] == 1
+
+
 def test_create_tags(client):
     user_1_token = get_token("user_1")
 
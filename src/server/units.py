@@ -0,0 +1,97 @@
+from typing import NamedTuple, Optional
+
+from server.search import normalize_ingredient_name
+
+VOLUME = "volume"
+MASS = "mass"
+
+# Canonical unit -> (dimension, amount of the dimension's base unit, ml or g)
+UNITS = {
+    "ml": (VOLUME, 1),
+    "l": (VOLUME, 1000),
+    "tsp": (VOLUME, 4.92892),
+    "tbsp": (VOLUME, 14.7868),
+    "fl oz": (VOLUME, 29.5735),
+    "cup": (VOLUME, 236.588),
+    "pint": (VOLUME, 473.176),
+    "quart": (VOLUME, 946.353),
+    "gallon": (VOLUME, 3785.41),
+    "mg": (MASS, 0.001),
+    "g": (MASS, 1),
+    "kg": (MASS, 1000),
+    "oz": (MASS, 28.3495),
+    "lb": (MASS, 453.592),
+}
+
+# Spellings found in parsed ingredients -> canonical unit
+UNIT_ALIASES = {
+    "milliliter": "ml",
+    "millilitre": "ml",
+    "liter": "l",
+    "litre": "l",
+    "teaspoon": "tsp",
+    "tablespoon": "tbsp",
+    "tbs": "tbsp",
+    "tbl": "tbsp",
+    "fluid ounce": "fl oz",
+    "c": "cup",
+    "pt": "pint",
+    "qt": "quart",
+    "gal": "gallon",
+    "milligram": "mg",
+    "gram": "g",
+    "gr": "g",
+    "kilogram": "kg",
+    "kilo": "kg",
+    "ounce": "oz",
+    "pound": "lb",
+}
+
+
+class NormalizedQuantity(NamedTuple):
+    # VOLUME, MASS or, for units that don't convert, the unit itself
+    dimension: Optional[str]
+    # Canonical unit, or the cleaned up unit if it doesn't convert
+    unit: Optional[str]
+    # Quantity in the dimension's base unit, or in unit if it doesn't convert
+    base_quantity: float
+
+
+def canonical_unit(unit: Optional[str]) -> Optional[str]:
+    if unit is None:
+        return None
+
+    unit = " ".join(unit.lower().replace(".", "").split())
+    if not unit:
+        return None
+    if unit in UNITS:
+        return unit
+    if unit in UNIT_ALIASES:
+        return UNIT_ALIASES[unit]
+    if unit.endswith("s") and unit[:-1] in UNITS:
+        return unit[:-1]
+    if unit.endswith("s") and unit[:-1] in UNIT_ALIASES:
+        return UNIT_ALIASES[unit[:-1]]
+    # "cloves" and "clove" should still add up
+    return normalize_ingredient_name(unit) or unit
+
+
+def normalize_quantity(quantity: float, unit: Optional[str]) -> NormalizedQuantity:
+    """Express quantity in the base unit of its dimension where it has one.
+
+    "2 tbsp" and "1 teaspoon" both become milliliters, so they can be added
+    up. Units without a conversion, e.g. "clove" or "28-oz can", are their
+    own dimension and only add up with themselves.
+    """
+    unit = canonical_unit(unit)
+    if unit in UNITS:
+        dimension, factor = UNITS[unit]
+        return NormalizedQuantity(dimension, unit, quantity * factor)
+    return NormalizedQuantity(unit, unit, quantity)
+
+
+def convert_base_quantity(base_quantity: float, unit: Optional[str]) -> float:
+    """Inverse of normalize_quantity for a canonical unit."""
+    if unit in UNITS:
+        return base_quantity / UNITS[unit][1]
+    return base_quantity